@@ -7,14 +7,18 @@
 import json
 import sqlite3
 import asyncio
+import collections
+import concurrent.futures
 import logging
 from datetime import datetime, timedelta
 import os
+import queue
 import re
 import threading
 import time
 import signal
 import sys
+import types
 
 try:
     import discord
@@ -25,21 +29,913 @@ except ImportError:
     print("Please install it with: pip3 install discord.py")
     exit(1)
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('prot7.log'),
-        logging.StreamHandler()
-    ]
-)
+import prot7db
+
+def setup_logging():
+    """Log to prot7.log and the console (only when running the bot, not on import)"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('prot7.log'),
+            logging.StreamHandler()
+        ]
+    )
 
 # Global variables for graceful shutdown
 bot_running = True
 shutdown_event = threading.Event()
 
+class DatabaseWriter:
+    """Background thread that batches inserts into short transactions"""
+    
+    INSERT_COLUMNS = {
+        'messages': ('user_id', 'username', 'channel_id', 'guild_id', 'content', 'timestamp', 'message_type'),
+    }
+    
+    _STOP = object()
+    
+    # Search index / rollup backfill runs in slices while the queue is idle
+    BACKFILL_BATCH = 2000
+    BACKFILL_IDLE = 0.05
+    
+    # Seconds per checkpoint interval spent returning free pages to the filesystem
+    VACUUM_BUDGET = 0.05
+    
+    def __init__(self, db_path, batch_size=200, flush_interval=0.25, max_queue=10000, checkpoint_interval=60):
+        self.db_path = db_path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.checkpoint_interval = max(1.0, float(checkpoint_interval))
+        self.queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self.thread = None
+        
+        # Counters (written by the writer thread, read anywhere)
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flush_count = 0
+        self.last_flush_ms = 0.0
+        self.flush_latency = LatencyHistogram()
+        self.checkpoint_count = 0
+        self.wal_frames = 0
+        self.pages_vacuumed = 0
+    
+    def start(self):
+        """Start the writer thread"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name="prot7-db-writer", daemon=True)
+        self.thread.start()
+        logging.info(f"Database writer started (batch: {self.batch_size} rows / {self.flush_interval * 1000:.0f} ms)")
+    
+    def submit(self, table, row):
+        """Queue a row for insertion without blocking the caller"""
+        try:
+            self.queue.put_nowait((table, row))
+            return True
+        except queue.Full:
+            self.rows_dropped += 1
+            if self.rows_dropped % 1000 == 1:
+                logging.warning(f"Database writer queue full, dropped {self.rows_dropped} rows so far")
+            return False
+    
+    def stop(self, timeout=10):
+        """Flush everything still queued and stop the writer thread"""
+        thread = self.thread
+        if not thread:
+            return
+        self.thread = None
+        try:
+            self.queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            logging.error("Database writer did not accept stop request, pending rows may be lost")
+            return
+        thread.join(timeout)
+        if thread.is_alive():
+            logging.error("Database writer did not finish draining in time")
+        else:
+            logging.info(f"Database writer stopped ({self.rows_written} rows written)")
+    
+    def _run(self):
+        """Writer loop: collect rows until the batch is full or the interval expires"""
+        try:
+            conn = prot7db.connect(self.db_path)
+        except Exception as e:
+            logging.error(f"Database writer could not open {self.db_path}: {e}")
+            return
+        
+        batch = []
+        deadline = 0.0
+        next_checkpoint = time.monotonic() + self.checkpoint_interval
+        backfill_pending = self._backfill_pending(conn)
+        stopping = False
+        while not stopping:
+            if batch:
+                timeout = max(0.0, deadline - time.monotonic())
+            elif backfill_pending:
+                timeout = min(self.BACKFILL_IDLE, max(0.0, next_checkpoint - time.monotonic()))
+            else:
+                timeout = max(0.0, next_checkpoint - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            
+            if item is self._STOP:
+                stopping = True
+            elif item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+            
+            if batch and (stopping or item is None or len(batch) >= self.batch_size
+                          or time.monotonic() >= deadline):
+                self._flush(conn, batch)
+                batch = []
+            elif item is None and backfill_pending:
+                # Queue is idle: index a slice of old messages for search
+                backfill_pending = self._backfill_step(conn)
+            
+            if time.monotonic() >= next_checkpoint:
+                self._checkpoint(conn, "PASSIVE")
+                self._vacuum(conn)
+                next_checkpoint = time.monotonic() + self.checkpoint_interval
+        
+        # Leave an empty WAL behind on clean shutdown
+        self._checkpoint(conn, "TRUNCATE")
+        conn.close()
+    
+    def _backfill_pending(self, conn):
+        """Whether old rows still need to be added to the search index or the rollups"""
+        try:
+            return prot7db.fts_backfill_status(conn) is not None or bool(prot7db.rollup_backfill_status(conn))
+        except Exception as e:
+            logging.warning(f"Could not read backfill state: {e}")
+            return False
+    
+    def _backfill_step(self, conn):
+        """Run one backfill batch, returns whether more work is left"""
+        try:
+            if not prot7db.backfill_fts(conn, batch_size=self.BACKFILL_BATCH, max_batches=1):
+                return True
+            return not prot7db.backfill_rollups(conn, batch_size=self.BACKFILL_BATCH, max_batches=1)
+        except sqlite3.OperationalError as e:
+            # Admin panel holds the write lock, try again on the next idle period
+            logging.debug(f"Backfill deferred: {e}")
+            return True
+        except Exception as e:
+            logging.error(f"Backfill failed: {e}")
+            return False
+    
+    def _vacuum(self, conn):
+        """Return pages freed by deletes to the filesystem, a few milliseconds at a time"""
+        try:
+            self.pages_vacuumed += prot7db.incremental_vacuum(conn, time_budget=self.VACUUM_BUDGET)
+        except sqlite3.OperationalError as e:
+            # Someone else holds the write lock, try again next interval
+            logging.debug(f"Incremental vacuum deferred: {e}")
+        except Exception as e:
+            logging.warning(f"Incremental vacuum failed: {e}")
+    
+    def _checkpoint(self, conn, mode):
+        """Checkpoint the WAL so it cannot grow while readers are active"""
+        try:
+            busy, frames, _ = prot7db.checkpoint(conn, mode)
+            self.checkpoint_count += 1
+            self.wal_frames = max(frames, 0)
+            if busy:
+                logging.debug(f"WAL checkpoint ({mode}) could not complete, readers active")
+        except Exception as e:
+            logging.warning(f"WAL checkpoint failed: {e}")
+    
+    def _flush(self, conn, batch):
+        """Write one batch in a single transaction"""
+        started = time.perf_counter()
+        rows_by_table = {}
+        for table, row in batch:
+            rows_by_table.setdefault(table, []).append(row)
+        
+        try:
+            with conn:
+                for table, rows in rows_by_table.items():
+                    columns = self.INSERT_COLUMNS[table]
+                    conn.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+                    )
+                    prot7db.update_rollups(conn, table, columns, rows)
+            self.rows_written += len(batch)
+        except Exception as e:
+            logging.error(f"Failed to write {len(batch)} queued rows: {e}")
+        
+        elapsed = time.perf_counter() - started
+        self.flush_count += 1
+        self.last_flush_ms = elapsed * 1000
+        self.flush_latency.record(int(elapsed * 1e9))
+
+class AsyncDatabase:
+    """Database access for coroutines: calls run on one thread that owns the connection"""
+    
+    # Calls slower than this are logged
+    SLOW_CALL_MS = 500
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None  # opened by the database thread on first use
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="prot7-db")
+        self.closed = False
+        
+        # submitted is only written by the event loop, completed only by the database thread
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.timings = {}  # label -> [calls, total ms, max ms, total queue wait ms]
+    
+    def queue_depth(self):
+        """Calls queued or running on the database thread"""
+        return self.submitted - self.completed
+    
+    def _run(self, label, queued, fn, args):
+        """Run one call on the database thread and record its timing"""
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = prot7db.connect(self.db_path)
+            return fn(self.conn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            timing = self.timings.setdefault(label, [0, 0.0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+            timing[3] += (started - queued) * 1000
+            self.completed += 1
+            if elapsed > self.SLOW_CALL_MS:
+                logging.warning(f"Slow database call {label}: {elapsed:.0f} ms")
+    
+    def submit(self, label, fn, *args):
+        """Queue fn(conn, *args) on the database thread, returns a concurrent.futures.Future"""
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self.queue_depth())
+        return self.executor.submit(self._run, label, time.perf_counter(), fn, args)
+    
+    def post(self, label, fn, *args):
+        """Queue a call without waiting for it, errors are logged"""
+        def report(future):
+            if future.exception():
+                logging.error(f"Database call {label} failed: {future.exception()}")
+        self.submit(label, fn, *args).add_done_callback(report)
+    
+    async def call(self, label, fn, *args):
+        """Run fn(conn, *args) on the database thread and await the result"""
+        return await asyncio.wrap_future(self.submit(label, fn, *args))
+    
+    async def fetchone(self, label, sql, params=()):
+        """Await the first row of a query"""
+        return await self.call(label, lambda conn: conn.execute(sql, params).fetchone())
+    
+    async def fetchall(self, label, sql, params=()):
+        """Await all rows of a query"""
+        return await self.call(label, lambda conn: conn.execute(sql, params).fetchall())
+    
+    def stats(self):
+        """Call counts, queue depth and per-label timings in milliseconds"""
+        return {
+            'calls': self.completed,
+            'failed': self.failed,
+            'queue_depth': self.queue_depth(),
+            'max_depth': self.max_depth,
+            'timings': {
+                label: {'calls': calls, 'avg_ms': total / calls, 'max_ms': peak, 'avg_wait_ms': wait / calls}
+                for label, (calls, total, peak, wait) in list(self.timings.items()) if calls
+            },
+        }
+    
+    def close(self):
+        """Finish queued calls, then close the connection"""
+        if self.closed:
+            return
+        self.closed = True
+        
+        def close_connection():
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        self.executor.submit(close_connection)
+        self.executor.shutdown(wait=True)
+
+class LatencyHistogram:
+    """Fixed-size histogram of durations in nanoseconds: 4 buckets per power of two"""
+    
+    __slots__ = ('counts', 'count', 'total_ns', 'max_ns')
+    
+    BUCKETS = 64 * 4
+    
+    def __init__(self):
+        # Plain list: increments are cheaper than on an array.array and it never resizes
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+    
+    def record(self, ns):
+        """Count one duration (no allocation beyond the arithmetic itself)"""
+        bits = ns.bit_length()
+        self.counts[(bits << 2) | ((ns >> (bits - 3)) & 3) if bits > 2 else ns] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+    
+    @staticmethod
+    def bucket_limit(index):
+        """Upper bound in nanoseconds of the durations counted in a bucket"""
+        bits = index >> 2
+        if bits <= 2:
+            return index + 1
+        return (5 + (index & 3)) << (bits - 3)
+    
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of durations"""
+        if not self.count:
+            return 0
+        rank = max(1, round(self.count * fraction))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.bucket_limit(index), self.max_ns)
+        return self.max_ns
+    
+    def summary(self):
+        """Count, mean and percentiles in microseconds"""
+        return {
+            'count': self.count,
+            'avg_us': self.total_ns / self.count / 1000 if self.count else 0.0,
+            'p50_us': self.percentile(0.5) / 1000,
+            'p90_us': self.percentile(0.9) / 1000,
+            'p99_us': self.percentile(0.99) / 1000,
+            'max_us': self.max_ns / 1000,
+        }
+
+class StageTimings:
+    """Latency histograms per event handler stage (monitoring.stage_timings)"""
+    
+    STAGES = (
+        'on_message', 'process_commands', 'log_message', 'blocked_words', 'spam_check', 'delete',
+        'member_join', 'raid_check', 'member_remove',
+    )
+    
+    # Snapshot read by the admin panel
+    SNAPSHOT_FILE = 'prot7_timings.json'
+    
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.started_at = datetime.now()
+    
+    def record(self, stage, started):
+        """Record the time since started (perf_counter_ns) for stage, returns the current time"""
+        now = time.perf_counter_ns()
+        self.histograms[stage].record(now - started)
+        return now
+    
+    def summary(self):
+        """Stage -> summary for every stage seen so far"""
+        return {stage: histogram.summary() for stage, histogram in self.histograms.items() if histogram.count}
+    
+    def write_snapshot(self, path=SNAPSHOT_FILE):
+        """Write the summary as JSON, replacing the previous snapshot atomically"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({
+                'since': str(self.started_at),
+                'written': str(datetime.now()),
+                'stages': self.summary(),
+            }, f, indent=2)
+        os.replace(temp_path, path)
+
+class RateLimitCounter(logging.Handler):
+    """Counts the rate limit warnings discord.py logs for its HTTP client
+    
+    Every 429 logs the first message; a global one logs the second as well.
+    """
+    
+    MESSAGES = (('We are being rate limited', 'all'), ('Global rate limit', 'global'))
+    
+    def __init__(self, counts):
+        super().__init__(logging.WARNING)
+        self.counts = counts
+    
+    def emit(self, record):
+        message = str(record.msg)
+        for prefix, scope in self.MESSAGES:
+            if message.startswith(prefix):
+                self.counts[scope] += 1
+                return
+
+class BotMetrics:
+    """Counters exported on the metrics endpoint"""
+    
+    def __init__(self):
+        self.started_at = time.time()
+        self.messages = 0
+        self.events = collections.Counter()  # (event_type, severity) -> count
+        self.rest_requests = collections.Counter()  # HTTP method -> count
+        self.rest_errors = collections.Counter()  # HTTP status -> count
+        self.rate_limits = collections.Counter()  # 'all' (every 429) or 'global' -> count
+    
+    def install(self, http):
+        """Count REST requests, errors and rate limits of a discord.py HTTPClient"""
+        request = http.request
+        
+        async def counted_request(route, **kwargs):
+            self.rest_requests[route.method] += 1
+            try:
+                return await request(route, **kwargs)
+            except discord.HTTPException as e:
+                self.rest_errors[e.status] += 1
+                raise
+        
+        http.request = counted_request
+        logging.getLogger('discord.http').addHandler(RateLimitCounter(self.rate_limits))
+
+def format_metric_value(value):
+    """Sample value in the Prometheus text format"""
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value) if isinstance(value, float) else str(int(value))
+
+def escape_label(value):
+    """Label value with backslashes, quotes and newlines escaped"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_metric(name, kind, help_text, samples):
+    """Lines for one metric family; samples are (labels dict or None, value) or (suffix, labels, value)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for sample in samples:
+        suffix, labels, value = sample if len(sample) == 3 else ('', *sample)
+        label_text = ''
+        if labels:
+            label_text = '{' + ','.join(f'{key}="{escape_label(label)}"' for key, label in labels.items()) + '}'
+        lines.append(f"{name}{suffix}{label_text} {format_metric_value(value)}")
+    return lines
+
+def summary_samples(histogram, labels=None):
+    """Quantile, sum and count samples (seconds) of a LatencyHistogram"""
+    labels = labels or {}
+    samples = [('', {**labels, 'quantile': str(q)}, histogram.percentile(q) / 1e9) for q in (0.5, 0.9, 0.99)]
+    samples.append(('_sum', labels, histogram.total_ns / 1e9))
+    samples.append(('_count', labels, histogram.count))
+    return samples
+
+class MetricsServer:
+    """Minimal HTTP server on the bot's event loop answering GET /metrics"""
+    
+    HOST = '127.0.0.1'  # never exposed beyond this machine
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    READ_TIMEOUT = 5
+    MAX_HEADER_LINES = 100
+    
+    def __init__(self, render, port):
+        self.render = render
+        self.port = port
+        self.server = None
+        self.scrapes = 0
+    
+    async def start(self):
+        """Start listening (idempotent)"""
+        if self.server is None:
+            self.server = await asyncio.start_server(self.handle, self.HOST, self.port)
+            logging.info(f"Metrics endpoint listening on http://{self.HOST}:{self.port}/metrics")
+    
+    def close(self):
+        """Stop accepting scrapes"""
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+    
+    async def handle(self, reader, writer):
+        """Answer one request, then close the connection"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.READ_TIMEOUT)
+            for _ in range(self.MAX_HEADER_LINES):
+                line = await asyncio.wait_for(reader.readline(), self.READ_TIMEOUT)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+            
+            parts = request_line.decode('latin-1').split()
+            body = b''
+            if len(parts) < 2 or parts[0] not in ('GET', 'HEAD'):
+                status = '405 Method Not Allowed'
+            elif parts[1].split('?', 1)[0] not in ('/', '/metrics'):
+                status = '404 Not Found'
+            else:
+                status = '200 OK'
+                body = self.render().encode()
+                self.scrapes += 1
+            
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {self.CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + (body if parts and parts[0] == 'GET' else b'')
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        except Exception as e:
+            logging.warning(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+class BlockedWordMatcher:
+    """Aho-Corasick automaton that finds every blocked word in a single pass"""
+    
+    # Below this many words, C-level substring search beats the Python automaton loop
+    SMALL_LIST = 32
+    
+    def __init__(self, words):
+        # Keep the first spelling of each word for reporting, match case-insensitively
+        self.words = []
+        self.keys = []
+        seen = set()
+        for word in words or []:
+            if not isinstance(word, str):
+                continue
+            key = word.lower()
+            if key and key not in seen:
+                seen.add(key)
+                self.keys.append(key)
+                self.words.append(word)
+        
+        # Build the trie
+        self.goto = [{}]
+        self.output = [()]
+        for index, key in enumerate(self.keys):
+            state = 0
+            for char in key:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (index,)
+        
+        # Compute failure links breadth-first and merge outputs along them
+        self.fail = [0] * len(self.goto)
+        pending = collections.deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self.goto[state].items():
+                pending.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+    
+    def __len__(self):
+        return len(self.words)
+    
+    def find_all(self, text):
+        """Return every blocked word contained in text, in order of appearance"""
+        if not self.words or not text:
+            return []
+        
+        if len(self.words) <= self.SMALL_LIST:
+            lowered = text.lower()
+            return [word for word, key in zip(self.words, self.keys) if key in lowered]
+        
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        found = None
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                if found is None:
+                    found = {}
+                for index in output[state]:
+                    found.setdefault(index, None)
+        
+        if not found:
+            return []
+        return [self.words[index] for index in found]
+
+class SpamRecord:
+    """Per-user sliding window of recent message times and content hashes"""
+    
+    __slots__ = ('times', 'hashes', 'warnings', 'last_warning')
+    
+    WINDOW_SECONDS = 60
+    MAX_MESSAGES = 8  # more messages than this inside the window is spam
+    
+    def __init__(self):
+        # Both deques hold the same messages; only MAX_MESSAGES + 1 are ever needed
+        self.times = collections.deque(maxlen=self.MAX_MESSAGES + 1)
+        self.hashes = collections.deque(maxlen=self.MAX_MESSAGES + 1)
+        self.warnings = 0
+        self.last_warning = None
+    
+    def add(self, now, content):
+        """Record a message at monotonic time now and return the window size"""
+        times = self.times
+        cutoff = now - self.WINDOW_SECONDS
+        while times and times[0] <= cutoff:
+            times.popleft()
+            self.hashes.popleft()
+        
+        times.append(now)
+        self.hashes.append(hash(content))
+        return len(times)
+    
+    def is_repeating(self, count=3):
+        """Whether the last count messages had identical content"""
+        hashes = self.hashes
+        if len(hashes) < count:
+            return False
+        last = hashes[-1]
+        return all(hashes[-i] == last for i in range(2, count + 1))
+
+class BoundedTracker:
+    """Mapping with LRU eviction above max_size and expiry of idle keys"""
+    
+    def __init__(self, max_size, idle_seconds, clock=time.monotonic):
+        self.max_size = max(1, int(max_size))
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self.entries = collections.OrderedDict()  # least recently used first
+        self.last_used = {}
+        self.evictions = 0
+        self.expirations = 0
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __contains__(self, key):
+        return key in self.entries
+    
+    def values(self):
+        return self.entries.values()
+    
+    def get(self, key, factory=None):
+        """Return the value for key, creating it with factory if missing"""
+        value = self.entries.get(key)
+        if value is None:
+            if factory is None:
+                return None
+            value = self.entries[key] = factory()
+            if len(self.entries) > self.max_size:
+                old_key, _ = self.entries.popitem(last=False)
+                del self.last_used[old_key]
+                self.evictions += 1
+        else:
+            self.entries.move_to_end(key)
+        
+        self.last_used[key] = self.clock()
+        return value
+    
+    def set(self, key, value):
+        """Insert or replace the value for key"""
+        self.entries[key] = value
+        self.get(key)
+        if len(self.entries) > self.max_size:
+            old_key, _ = self.entries.popitem(last=False)
+            del self.last_used[old_key]
+            self.evictions += 1
+    
+    def pop(self, key):
+        self.last_used.pop(key, None)
+        return self.entries.pop(key, None)
+    
+    def expire(self, now=None):
+        """Drop keys that have not been used for idle_seconds"""
+        cutoff = (self.clock() if now is None else now) - self.idle_seconds
+        expired = 0
+        while self.entries:
+            key = next(iter(self.entries))
+            if self.last_used[key] > cutoff:
+                break
+            del self.entries[key]
+            del self.last_used[key]
+            expired += 1
+        
+        self.expirations += expired
+        return expired
+    
+    def stats(self):
+        """Current size and eviction counters"""
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+class UserResolver:
+    """Resolve user IDs from the gateway cache, then a TTL cache, then the API"""
+    
+    def __init__(self, bot, max_size=5000, ttl_seconds=3600):
+        self.bot = bot
+        self.ttl_seconds = ttl_seconds
+        self.cache = BoundedTracker(max_size, ttl_seconds)  # user_id -> (fetched_at, user or None)
+        self.in_flight = {}  # user_id -> fetch task
+        
+        # Counters
+        self.local_hits = 0
+        self.cache_hits = 0
+        self.shared_fetches = 0
+        self.api_calls = 0
+        self.failures = 0
+    
+    async def resolve(self, user_id):
+        """Return the discord.User for user_id, or None if it cannot be resolved"""
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            self.local_hits += 1
+            return user
+        
+        entry = self.cache.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+            self.cache_hits += 1
+            return entry[1]
+        
+        # Share a single API request between concurrent lookups of the same user
+        task = self.in_flight.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self.fetch(user_id))
+            self.in_flight[user_id] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(user_id, None))
+        else:
+            self.shared_fetches += 1
+        return await asyncio.shield(task)
+    
+    async def fetch(self, user_id):
+        """Fetch a user from the API and cache the result"""
+        self.api_calls += 1
+        try:
+            user = await self.bot.fetch_user(user_id)
+        except discord.NotFound:
+            user = None
+        except Exception as e:
+            # Transient errors are not cached
+            self.failures += 1
+            logging.error(f"Failed to fetch user {user_id}: {e}")
+            return None
+        
+        self.cache.set(user_id, (time.monotonic(), user))
+        return user
+    
+    def stats(self):
+        """Hit/miss counters and cache size"""
+        return {
+            'local_hits': self.local_hits,
+            'cache_hits': self.cache_hits,
+            'shared_fetches': self.shared_fetches,
+            'api_calls': self.api_calls,
+            'failures': self.failures,
+            'cache_size': len(self.cache)
+        }
+
+class LogChannelQueue:
+    """Pending security events and built embeds for one log channel"""
+    
+    __slots__ = ('events', 'embeds', 'dropped')
+    
+    MAX_EVENTS = 1000
+    MAX_EMBEDS = 100
+    
+    def __init__(self):
+        self.events = collections.deque()
+        self.embeds = collections.deque()
+        self.dropped = 0
+    
+    def add_event(self, event):
+        if len(self.events) >= self.MAX_EVENTS:
+            self.events.popleft()
+            self.dropped += 1
+        self.events.append(event)
+    
+    def add_embed(self, embed):
+        if len(self.embeds) >= self.MAX_EMBEDS:
+            self.embeds.popleft()
+            self.dropped += 1
+        self.embeds.append(embed)
+
+class ConfigSnapshot:
+    """Immutable, precompiled view of config.json read by the message hot path"""
+    
+    __slots__ = (
+        'raw', 'prefix', 'modules', 'anti_spam', 'auto_mod', 'channel_guard', 'user_tracking',
+        'blocked_words', 'matcher', 'log_channel_id', 'mod_log_channel_id', 'admin_role_ids', 'mod_role_ids',
+        'retention'
+    )
+    
+    # Units accepted in retention periods ("30d", "12w", "2y", or a number of days)
+    RETENTION_UNITS = {'h': 1 / 24, 'd': 1, 'w': 7, 'm': 30, 'y': 365}
+    
+    def __init__(self, config):
+        modules = dict(config.get('modules') or {})
+        values = {
+            'raw': types.MappingProxyType(config),
+            'prefix': config.get('prefix', '!p7'),
+            'modules': types.MappingProxyType(modules),
+            'anti_spam': bool(modules.get('anti_spam', True)),
+            'auto_mod': bool(modules.get('auto_mod', True)),
+            'channel_guard': bool(modules.get('channel_guard', True)),
+            'user_tracking': bool(modules.get('user_tracking', True)),
+            'blocked_words': tuple(config.get('blocked_words') or ()),
+            'log_channel_id': self.parse_id(config.get('log_channel')),
+            'mod_log_channel_id': self.parse_id(config.get('mod_log_channel')),
+            'admin_role_ids': frozenset(filter(None, map(self.parse_id, config.get('admin_roles') or ()))),
+            'mod_role_ids': frozenset(filter(None, map(self.parse_id, config.get('mod_roles') or ()))),
+            'retention': types.MappingProxyType(self.parse_retention(config.get('retention') or {})),
+        }
+        values['matcher'] = BlockedWordMatcher(values['blocked_words'])
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot is immutable, publish a new one instead")
+    
+    def __delattr__(self, name):
+        raise AttributeError("ConfigSnapshot is immutable, publish a new one instead")
+    
+    @staticmethod
+    def parse_id(value):
+        """Parse a Discord ID stored as string or int, None if unset or invalid"""
+        try:
+            return int(value) if value else None
+        except (TypeError, ValueError):
+            return None
+    
+    @classmethod
+    def parse_retention(cls, retention):
+        """Map table -> timedelta for every table with a valid retention period"""
+        periods = {}
+        for table, value in retention.items():
+            if table not in prot7db.DELETABLE_TABLES:
+                logging.warning(f"Retention: unknown table '{table}' ignored")
+                continue
+            if value in (None, 0, '', 'forever'):
+                continue
+            try:
+                if isinstance(value, (int, float)):
+                    days = float(value)
+                else:
+                    text = str(value).strip().lower()
+                    days = float(text[:-1]) * cls.RETENTION_UNITS[text[-1]] if text[-1] in cls.RETENTION_UNITS else float(text)
+                if days > 0:
+                    periods[table] = timedelta(days=days)
+            except (ValueError, IndexError):
+                logging.warning(f"Retention: invalid period '{value}' for {table} ignored")
+        return periods
+    
+    def to_dict(self):
+        """Mutable deep copy of the underlying config for editing"""
+        return json.loads(json.dumps(dict(self.raw)))
+
 class Prot7Bot:
+    # Color based on severity
+    SEVERITY_COLORS = {
+        "low": 0x00ff00,     # Green
+        "medium": 0xffa500,  # Orange
+        "high": 0xff0000     # Red
+    }
+    
+    # Low severity events of one type are collapsed into a summary from this count on
+    LOG_SUMMARY_THRESHOLD = 3
+    # Discord allows 10 embeds and 6000 characters per message
+    LOG_EMBEDS_PER_MESSAGE = 10
+    LOG_CHARS_PER_MESSAGE = 6000
+    # Messages per channel per flush; the message route allows 5 per 5 seconds per channel
+    LOG_MESSAGES_PER_FLUSH = 2
+    
+    # Set from monitoring.stage_timings; None disables handler instrumentation
+    stage_timings = None
+    
+    # Time source for the spam and raid windows (prot7replay.py substitutes message timestamps)
+    clock = staticmethod(time.monotonic)
+    
+    # Column order of logged security event rows
+    EVENT_COLUMNS = ('event_type', 'user_id', 'details', 'timestamp', 'severity')
+    
+    # Default port of the local metrics endpoint (monitoring.metrics_port)
+    METRICS_PORT = 9477
+    
+    # Retention: rows per delete batch and time budget per pass
+    RETENTION_BATCH_ROWS = 2000
+    RETENTION_PASS_SECONDS = 30
+    
     def __init__(self):
         # Log startup information
         print(f"Starting Prot7 Security Bot (PID: {os.getpid()})...")
@@ -54,20 +950,51 @@ class Prot7Bot:
                 raise ValueError("Discord token not found")
             
             # Load configuration
-            self.config = self.load_config()
+            self.snapshot = ConfigSnapshot(self.load_config())
             
             # Initialize Discord bot
             self.intents = discord.Intents.all()
-            self.bot = commands.Bot(command_prefix=self.config.get('prefix', '!p7'), intents=self.intents)
+            self.bot = commands.Bot(command_prefix=self.snapshot.prefix, intents=self.intents)
             
             # Initialize database
             self.db = self.initialize_database()
             
-            # Initialize trackers
-            self.spam_tracker = {}
-            self.raid_protection = {}
-            self.last_config_check = time.time()
-            self.config_lock = threading.Lock()
+            # Start batched writer for high-volume inserts
+            db_settings = self.config.get('database', {})
+            self.db_writer = DatabaseWriter(
+                prot7db.DB_PATH,
+                batch_size=db_settings.get('batch_size', 200),
+                flush_interval=db_settings.get('flush_interval_ms', 250) / 1000,
+                max_queue=db_settings.get('max_queue', 10000),
+                checkpoint_interval=db_settings.get('checkpoint_interval_seconds', 60)
+            ) if self.db else None
+            if self.db_writer:
+                self.db_writer.start()
+            
+            # Initialize trackers (bounded so long-running processes stay flat)
+            limits = self.config.get('limits', {})
+            idle_seconds = limits.get('tracker_idle_minutes', 60) * 60
+            self.spam_tracker = BoundedTracker(limits.get('max_tracked_users', 50000), idle_seconds)
+            self.raid_protection = BoundedTracker(limits.get('max_tracked_guilds', 5000), idle_seconds)
+            self.ban_cache = {}  # guild_id -> set of banned user IDs
+            self.log_queues = {}  # channel_id -> LogChannelQueue
+            
+            # Per-stage handler latency, off unless enabled (read once at startup)
+            monitoring = self.config.get('monitoring', {})
+            self.stage_timings = StageTimings() if monitoring.get('stage_timings') else None
+            
+            # Counters for the local Prometheus endpoint (monitoring.metrics_port, 0 disables it)
+            self.metrics = BotMetrics()
+            self.metrics.install(self.bot.http)
+            metrics_port = monitoring.get('metrics_port', self.METRICS_PORT)
+            self.metrics_server = MetricsServer(self.render_metrics, metrics_port) if metrics_port else None
+            self.user_resolver = UserResolver(self.bot)
+            self.config_file_signature = self.get_config_signature()
+            self.config_lock = threading.Lock()  # serialises config writers; readers use self.snapshot
+            self.retention_stats = {
+                'passes': 0, 'rows_purged': 0, 'last_pass_rows': 0, 'last_pass_seconds': 0.0,
+                'last_pass_at': None, 'deferred': 0, 'pending_tables': 0
+            }
             self.current_status = "STARTING"
             
             # Set up event handlers and commands
@@ -89,6 +1016,11 @@ class Prot7Bot:
             print(f"ERROR: {error_msg}")
             raise
     
+    @property
+    def config(self):
+        """Raw (read-only) config of the current snapshot"""
+        return self.snapshot.raw
+    
     def load_token_from_env(self):
         """Load bot token from prot7.env file"""
         env_file = 'prot7.env'
@@ -151,82 +1083,31 @@ class Prot7Bot:
             # Return minimal config to keep bot functional
             return {"prefix": "!p7", "modules": {}, "blocked_words": []}
     
-    def initialize_database(self):
-        """Initialize SQLite database"""
+    def initialize_database(self, db_path=None):
+        """Initialize SQLite database, returns the AsyncDatabase used by coroutines"""
         logging.info("Initializing database")
+        db_path = db_path or prot7db.DB_PATH
         try:
-            conn = sqlite3.connect('prot7.db')
-            cursor = conn.cursor()
-            
-            # Create messages table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT,
-                    username TEXT,
-                    channel_id TEXT,
-                    guild_id TEXT,
-                    content TEXT,
-                    timestamp DATETIME,
-                    message_type TEXT
-                )
-            ''')
-            
-            # Create security events table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS security_events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    event_type TEXT,
-                    user_id TEXT,
-                    details TEXT,
-                    timestamp DATETIME,
-                    severity TEXT
-                )
-            ''')
-            
-            # Create server stats table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS server_stats (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    guild_id TEXT,
-                    member_count INTEGER,
-                    channel_count INTEGER,
-                    timestamp DATETIME
-                )
-            ''')
-            
-            # Create moderation actions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS moderation_actions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    guild_id TEXT,
-                    user_id TEXT,
-                    moderator_id TEXT,
-                    action_type TEXT,
-                    reason TEXT,
-                    timestamp DATETIME
-                )
-            ''')
+            conn = prot7db.connect(db_path)
+            try:
+                prot7db.migrate(conn)
+            finally:
+                conn.close()
             
-            conn.commit()
             logging.info("Database initialized successfully")
-            return conn
+            return AsyncDatabase(db_path)
         except Exception as e:
             logging.error(f"Database initialization error: {e}")
             print(f"Database error: {e}")
             return None
     
     def log_message(self, message):
-        """Log message to database"""
-        if not self.db:
+        """Queue message for the batched database writer"""
+        if not self.db_writer:
             return
             
         try:
-            cursor = self.db.cursor()
-            cursor.execute('''
-                INSERT INTO messages (user_id, username, channel_id, guild_id, content, timestamp, message_type)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            self.db_writer.submit('messages', (
                 str(message.author.id),
                 message.author.name,
                 str(message.channel.id),
@@ -235,77 +1116,152 @@ class Prot7Bot:
                 datetime.now(),
                 'user_message'
             ))
-            self.db.commit()
         except Exception as e:
             logging.error(f"Failed to log message: {e}")
     
     def log_security_event(self, event_type, user_id, details, severity="medium"):
         """Log security event to database and send to log channel"""
+        self.metrics.events[event_type, severity] += 1
         if not self.db:
             return
             
         try:
-            cursor = self.db.cursor()
-            cursor.execute('''
-                INSERT INTO security_events (event_type, user_id, details, timestamp, severity)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
+            self.db.post('security_event', self.insert_security_event, (
                 event_type,
                 str(user_id) if user_id else "system",
                 details,
                 datetime.now(),
                 severity
             ))
-            self.db.commit()
             
             logging.warning(f"Security Event: {event_type} - User: {user_id} - {details}")
             
-            # Send to Discord log channel asynchronously
-            asyncio.create_task(self.send_log_embed(event_type, user_id, details, severity))
+            # Queue for the Discord log channel, sent in batches by flush_log_embeds
+            self.queue_log_embed(event_type, user_id, details, severity)
         except Exception as e:
             logging.error(f"Failed to log security event: {e}")
     
-    async def send_log_embed(self, event_type, user_id, details, severity="medium"):
-        """Send log embed to configured log channel"""
-        with self.config_lock:
-            log_channel_id = self.config.get('log_channel')
-        
+    def insert_security_event(self, conn, row):
+        """Insert one security event and count it in the rollups (database thread)"""
+        with conn:
+            conn.execute('''
+                INSERT INTO security_events (event_type, user_id, details, timestamp, severity)
+                VALUES (?, ?, ?, ?, ?)
+            ''', row)
+            prot7db.update_rollups(conn, 'security_events', self.EVENT_COLUMNS, (row,))
+    
+    def queue_log_embed(self, event_type, user_id, details, severity="medium"):
+        """Queue a security event for the configured log channel"""
+        log_channel_id = self.snapshot.log_channel_id
         if not log_channel_id:
             return
+        
+        log_queue = self.log_queues.get(log_channel_id)
+        if log_queue is None:
+            log_queue = self.log_queues[log_channel_id] = LogChannelQueue()
+        log_queue.add_event((event_type, user_id, details, severity, datetime.now()))
+    
+    async def build_log_embed(self, event_type, user_id, details, severity, timestamp):
+        """Build the embed for a single security event"""
+        embed = discord.Embed(
+            title=f"🛡️ Security Event: {event_type.replace('_', ' ').title()}",
+            color=self.SEVERITY_COLORS.get(severity, 0xffa500),
+            timestamp=timestamp
+        )
+        
+        if user_id:
+            user = await self.user_resolver.resolve(int(user_id))
+            if user is not None:
+                embed.add_field(name="👤 User", value=f"{user.mention} (`{user.id}`)", inline=True)
+            else:
+                embed.add_field(name="👤 User ID", value=user_id, inline=True)
+        
+        embed.add_field(name="📝 Details", value=details[:1024], inline=False)
+        embed.add_field(name="⚠️ Severity", value=severity.upper(), inline=True)
+        embed.set_footer(text=f"Prot7 Security System")
+        return embed
+    
+    def build_summary_embed(self, event_type, severity, events):
+        """Build one embed summarising many events of the same type"""
+        embed = discord.Embed(
+            title=f"🛡️ Security Events: {event_type.replace('_', ' ').title()} ×{len(events)}",
+            color=self.SEVERITY_COLORS.get(severity, 0xffa500),
+            timestamp=events[-1][4]
+        )
+        
+        lines = []
+        for _, user_id, details, _, _ in events[:10]:
+            prefix = f"<@{user_id}> " if user_id else ""
+            lines.append(f"{prefix}{details[:80]}")
+        if len(events) > 10:
+            lines.append(f"... and {len(events) - 10} more")
+        
+        embed.add_field(name="📝 Events", value="\n".join(lines)[:1024], inline=False)
+        embed.add_field(name="🕒 Period", value=f"{events[0][4]:%H:%M:%S} - {events[-1][4]:%H:%M:%S}", inline=True)
+        embed.add_field(name="⚠️ Severity", value=severity.upper(), inline=True)
+        embed.set_footer(text=f"Prot7 Security System")
+        return embed
+    
+    async def build_log_embeds(self, events):
+        """Turn queued events into embeds, collapsing repeated low severity events"""
+        low_groups = {}
+        for event in events:
+            if event[3] == "low":
+                low_groups.setdefault(event[0], []).append(event)
+        
+        embeds = []
+        summarised = set()
+        for event in events:
+            event_type, severity = event[0], event[3]
+            group = low_groups.get(event_type) if severity == "low" else None
+            if group and len(group) >= self.LOG_SUMMARY_THRESHOLD:
+                if event_type not in summarised:
+                    summarised.add(event_type)
+                    embeds.append(self.build_summary_embed(event_type, severity, group))
+                continue
+            embeds.append(await self.build_log_embed(*event))
+        return embeds
+    
+    @tasks.loop(seconds=2)
+    async def flush_log_embeds(self):
+        """Send queued security events to their log channels in packed messages"""
+        for channel_id, log_queue in list(self.log_queues.items()):
+            if not log_queue.events and not log_queue.embeds:
+                continue
             
-        try:
-            channel = self.bot.get_channel(int(log_channel_id))
+            channel = self.bot.get_channel(channel_id)
             if not channel:
-                return
-                
-            # Color based on severity
-            color_map = {
-                "low": 0x00ff00,     # Green
-                "medium": 0xffa500,  # Orange
-                "high": 0xff0000     # Red
-            }
-            
-            embed = discord.Embed(
-                title=f"🛡️ Security Event: {event_type.replace('_', ' ').title()}",
-                color=color_map.get(severity, 0xffa500),
-                timestamp=datetime.now()
-            )
-            
-            if user_id:
-                try:
-                    user = await self.bot.fetch_user(int(user_id))
-                    embed.add_field(name="👤 User", value=f"{user.mention} (`{user.id}`)", inline=True)
-                except:
-                    embed.add_field(name="👤 User ID", value=user_id, inline=True)
+                log_queue.events.clear()
+                log_queue.embeds.clear()
+                continue
             
-            embed.add_field(name="📝 Details", value=details, inline=False)
-            embed.add_field(name="⚠️ Severity", value=severity.upper(), inline=True)
-            embed.set_footer(text=f"Prot7 Security System")
+            try:
+                events = list(log_queue.events)
+                log_queue.events.clear()
+                for embed in await self.build_log_embeds(events):
+                    log_queue.add_embed(embed)
+                
+                for _ in range(self.LOG_MESSAGES_PER_FLUSH):
+                    if not log_queue.embeds:
+                        break
+                    
+                    # Pack embeds up to Discord's per-message limits
+                    batch = [log_queue.embeds.popleft()]
+                    size = len(batch[0])
+                    while (log_queue.embeds and len(batch) < self.LOG_EMBEDS_PER_MESSAGE
+                           and size + len(log_queue.embeds[0]) <= self.LOG_CHARS_PER_MESSAGE):
+                        embed = log_queue.embeds.popleft()
+                        size += len(embed)
+                        batch.append(embed)
+                    
+                    await channel.send(embeds=batch)
+                    logging.info(f"Sent {len(batch)} security log embeds to channel {channel_id}")
+            except Exception as e:
+                logging.error(f"Failed to send log embeds: {e}")
             
-            await channel.send(embed=embed)
-            logging.info(f"Security event logged to channel: {event_type}")
-        except Exception as e:
-            logging.error(f"Failed to send log embed: {e}")
+            if log_queue.dropped:
+                logging.warning(f"Dropped {log_queue.dropped} security log entries for channel {channel_id} (queue full)")
+                log_queue.dropped = 0
     
     async def on_message_handler(self, message):
         """Handle incoming messages"""
@@ -313,93 +1269,101 @@ class Prot7Bot:
         if message.author.bot:
             return
         
-        # Process commands
-        await self.bot.process_commands(message)
-        
-        # Check if auto-mod is enabled
-        with self.config_lock:
-            auto_mod_enabled = self.config['modules'].get('auto_mod', True)
-        
-        if not auto_mod_enabled:
-            return
-        
-        # Log message to database
-        self.log_message(message)
-        
-        # Run moderation checks
-        if await self.check_message_content(message):
-            return
-        
-        # Check for spam
-        if await self.check_for_spam(message):
-            return
+        self.metrics.messages += 1
+        timings = self.stage_timings
+        if timings:
+            started = mark = time.perf_counter_ns()
+        try:
+            # Process commands
+            await self.bot.process_commands(message)
+            if timings:
+                mark = timings.record('process_commands', mark)
+            
+            # Check if auto-mod is enabled
+            if not self.snapshot.auto_mod:
+                return
+            
+            # Log message to database
+            self.log_message(message)
+            if timings:
+                mark = timings.record('log_message', mark)
+            
+            # Run moderation checks
+            if await self.check_message_content(message):
+                return
+            
+            # Check for spam
+            if await self.check_for_spam(message):
+                return
+        finally:
+            if timings:
+                timings.record('on_message', started)
+    
+    async def delete_message(self, message):
+        """message.delete(), timed as its own stage"""
+        timings = self.stage_timings
+        if timings:
+            started = time.perf_counter_ns()
+            try:
+                await message.delete()
+            finally:
+                timings.record('delete', started)
+        else:
+            await message.delete()
     
     async def check_message_content(self, message):
         """Check message content for blocked words"""
-        with self.config_lock:
-            blocked_words = self.config.get('blocked_words', [])
+        timings = self.stage_timings
+        if timings:
+            started = time.perf_counter_ns()
+        matches = self.snapshot.matcher.find_all(message.content)
+        if timings:
+            timings.record('blocked_words', started)
+        if not matches:
+            return False
         
-        for word in blocked_words:
-            if word.lower() in message.content.lower():
-                try:
-                    await message.delete()
-                    self.log_security_event("blocked_word", message.author.id, f"Used blocked word: {word}", "medium")
-                    try:
-                        await message.author.send(f"⚠️ Your message was deleted for containing a blocked word: `{word}`")
-                    except:
-                        pass
-                    return True
-                except Exception as e:
-                    logging.error(f"Failed to delete message: {e}")
+        words = ", ".join(matches)
+        try:
+            await self.delete_message(message)
+            self.log_security_event("blocked_word", message.author.id, f"Used blocked word: {words}", "medium")
+            try:
+                await message.author.send(f"⚠️ Your message was deleted for containing a blocked word: `{words}`")
+            except:
+                pass
+            return True
+        except Exception as e:
+            logging.error(f"Failed to delete message: {e}")
         
         return False
     
     async def check_for_spam(self, message):
         """Check message for spam patterns"""
-        with self.config_lock:
-            anti_spam_enabled = self.config['modules'].get('anti_spam', True)
-        
-        if not anti_spam_enabled:
+        if not self.snapshot.anti_spam:
             return False
         
-        user_id = str(message.author.id)
-        current_time = datetime.now()
+        timings = self.stage_timings
+        if timings:
+            started = time.perf_counter_ns()
+        current_time = self.clock()
         
-        # Initialize user tracker
-        if user_id not in self.spam_tracker:
-            self.spam_tracker[user_id] = {
-                'messages': [],
-                'warnings': 0,
-                'last_warning': None
-            }
-        
-        # Clean old messages (older than 1 minute)
-        self.spam_tracker[user_id]['messages'] = [
-            msg for msg in self.spam_tracker[user_id]['messages']
-            if current_time - msg['time'] < timedelta(minutes=1)
-        ]
+        # Get or create user tracker
+        record = self.spam_tracker.get(message.author.id, SpamRecord)
         
-        # Add current message
-        self.spam_tracker[user_id]['messages'].append({
-            'content': message.content,
-            'time': current_time
-        })
-        
-        user_messages = self.spam_tracker[user_id]['messages']
+        # Evict messages older than the window and add the current one
+        message_count = record.add(current_time, message.content)
         
         # Check for spam patterns
         spam_detected = False
         reason = ""
         
         # Too many messages in short time
-        if len(user_messages) > 8:
+        if message_count > SpamRecord.MAX_MESSAGES:
             spam_detected = True
             reason = "Too many messages in short time"
         
         # Repeated content
-        elif len(user_messages) >= 3:
-            recent_content = [msg['content'] for msg in user_messages[-3:]]
-            if len(set(recent_content)) == 1:
+        elif message_count >= 3:
+            if record.is_repeating(3):
                 spam_detected = True
                 reason = "Repeated message content"
         
@@ -413,21 +1377,24 @@ class Prot7Bot:
             spam_detected = True
             reason = "Too many user mentions"
         
+        if timings:
+            timings.record('spam_check', started)
+        
         if spam_detected:
             try:
-                await message.delete()
-                self.spam_tracker[user_id]['warnings'] += 1
-                self.spam_tracker[user_id]['last_warning'] = current_time
+                await self.delete_message(message)
+                record.warnings += 1
+                record.last_warning = current_time
                 
                 # Progressive punishment
-                if self.spam_tracker[user_id]['warnings'] >= 3:
+                if record.warnings >= 3:
                     # Timeout for 10 minutes
                     try:
                         await message.author.timeout(duration=timedelta(minutes=10), reason=f"Spam: {reason}")
                         self.log_security_event("spam_timeout", message.author.id, f"User timed out for spam: {reason}", "high")
                     except Exception as e:
                         logging.error(f"Failed to timeout user: {e}")
-                elif self.spam_tracker[user_id]['warnings'] >= 2:
+                elif record.warnings >= 2:
                     # Warning message
                     try:
                         await message.author.send(f"⚠️ **Spam Warning**: {reason}. One more spam message will result in a timeout.")
@@ -444,33 +1411,31 @@ class Prot7Bot:
     
     async def check_raid_protection(self, member):
         """Check for potential raid when new member joins"""
-        with self.config_lock:
-            channel_guard_enabled = self.config['modules'].get('channel_guard', True)
-        
-        if not channel_guard_enabled:
+        if not self.snapshot.channel_guard:
             return
         
-        guild_id = str(member.guild.id)
-        current_time = datetime.now()
-        
-        if guild_id not in self.raid_protection:
-            self.raid_protection[guild_id] = []
+        timings = self.stage_timings
+        if timings:
+            started = time.perf_counter_ns()
+        current_time = self.clock()
+        joins = self.raid_protection.get(member.guild.id, collections.deque)
         
         # Clean old joins (older than 5 minutes)
-        self.raid_protection[guild_id] = [
-            join_time for join_time in self.raid_protection[guild_id]
-            if current_time - join_time < timedelta(minutes=5)
-        ]
+        while joins and current_time - joins[0] >= 300:
+            joins.popleft()
         
         # Add current join
-        self.raid_protection[guild_id].append(current_time)
+        joins.append(current_time)
+        
+        if timings:
+            timings.record('raid_check', started)
         
         # Check if too many joins in short time (potential raid)
-        if len(self.raid_protection[guild_id]) > 10:  # 10 joins in 5 minutes
-            self.log_security_event("potential_raid", member.id, f"Potential raid detected: {len(self.raid_protection[guild_id])} joins in 5 minutes", "high")
+        if len(joins) > 10:  # 10 joins in 5 minutes
+            self.log_security_event("potential_raid", member.id, f"Potential raid detected: {len(joins)} joins in 5 minutes", "high")
             
             # Check if account is new (created less than 7 days ago)
-            account_age = current_time - member.created_at
+            account_age = discord.utils.utcnow() - member.created_at
             if account_age < timedelta(days=7):
                 try:
                     await member.kick(reason="Raid protection: New account during potential raid")
@@ -503,6 +1468,16 @@ class Prot7Bot:
             self.cleanup_old_data.start()
             self.config_monitor.start()
             self.update_server_stats.start()
+            self.refresh_ban_cache.start()
+            self.flush_log_embeds.start()
+            self.enforce_retention.start()
+            if self.stage_timings:
+                self.write_stage_timings.start()
+            if self.metrics_server:
+                try:
+                    await self.metrics_server.start()
+                except OSError as e:
+                    logging.error(f"Could not start metrics endpoint on port {self.metrics_server.port}: {e}")
             
             # Set custom status
             await self.bot.change_presence(
@@ -522,32 +1497,51 @@ class Prot7Bot:
         
         @self.bot.event
         async def on_member_join(member):
+            timings = self.stage_timings
+            if timings:
+                started = time.perf_counter_ns()
             self.log_security_event("member_join", member.id, f"User {member.name} joined server", "low")
             
             # Raid protection
             await self.check_raid_protection(member)
             
             # Check if user was previously banned
-            try:
-                bans = [ban async for ban in member.guild.bans()]
-                if any(ban.user.id == member.id for ban in bans):
-                    self.log_security_event("banned_user_rejoin", member.id, "Previously banned user attempted to rejoin", "high")
-            except Exception as e:
-                logging.error(f"Failed to check bans: {e}")
+            if member.id in self.ban_cache.get(member.guild.id, ()):
+                self.log_security_event("banned_user_rejoin", member.id, "Previously banned user attempted to rejoin", "high")
+            if timings:
+                timings.record('member_join', started)
+        
+        @self.bot.event
+        async def on_member_ban(guild, user):
+            self.ban_cache.setdefault(guild.id, set()).add(user.id)
+        
+        @self.bot.event
+        async def on_member_unban(guild, user):
+            self.ban_cache.get(guild.id, set()).discard(user.id)
+        
+        @self.bot.event
+        async def on_guild_join(guild):
+            await self.load_guild_bans(guild)
+        
+        @self.bot.event
+        async def on_guild_remove(guild):
+            self.ban_cache.pop(guild.id, None)
         
         @self.bot.event
         async def on_member_remove(member):
+            timings = self.stage_timings
+            if timings:
+                started = time.perf_counter_ns()
             self.log_security_event("member_leave", member.id, f"User {member.name} left server", "low")
+            if timings:
+                timings.record('member_remove', started)
         
         @self.bot.event
         async def on_message_delete(message):
             if message.author.bot:
                 return
             
-            with self.config_lock:
-                user_tracking_enabled = self.config['modules'].get('user_tracking', True)
-            
-            if user_tracking_enabled:
+            if self.snapshot.user_tracking:
                 self.log_security_event("message_deleted", message.author.id, f"Message deleted: {message.content[:100]}", "low")
         
         @self.bot.event
@@ -555,76 +1549,283 @@ class Prot7Bot:
             if before.author.bot or before.content == after.content:
                 return
             
-            with self.config_lock:
-                user_tracking_enabled = self.config['modules'].get('user_tracking', True)
-            
-            if user_tracking_enabled:
+            if self.snapshot.user_tracking:
                 self.log_security_event("message_edited", before.author.id, f"Message edited from: {before.content[:50]} to: {after.content[:50]}", "low")
     
+    def get_config_signature(self):
+        """Cheap change marker for config.json (mtime, size, inode)"""
+        try:
+            st = os.stat('config.json')
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            return None
+    
+    def write_config_file(self, config):
+        """Write config.json atomically so the monitor never reads a partial file"""
+        tmp_path = 'config.json.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(config, f, indent=4)
+        os.replace(tmp_path, 'config.json')
+    
+    def update_config_file(self, changes):
+        """Apply changes to the current config, write it and compile a snapshot (runs in an executor thread)"""
+        with self.config_lock:
+            config = self.snapshot.to_dict()
+            config.update(changes)
+            self.write_config_file(config)
+            return ConfigSnapshot(config)
+    
+    def parse_config_file(self):
+        """Read config.json and compile a snapshot (runs in an executor thread)"""
+        with open('config.json', 'r') as f:
+            return ConfigSnapshot(json.load(f))
+    
+    async def reload_config(self):
+        """Parse config.json off the event loop and publish it"""
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(None, self.parse_config_file)
+        self.publish_config(snapshot)
+    
+    def publish_config(self, snapshot):
+        """Make snapshot the current config with a single reference swap"""
+        old_prefix = self.snapshot.prefix
+        self.snapshot = snapshot
+        
+        # Update prefix if changed
+        if old_prefix != snapshot.prefix:
+            self.bot.command_prefix = snapshot.prefix
+    
+    def render_metrics(self):
+        """Current counters and gauges in the Prometheus text format"""
+        metrics = self.metrics
+        lines = []
+        lines += format_metric('prot7_status', 'gauge', 'Bot status (1 for the current one)',
+                               [({'status': self.current_status}, 1)])
+        lines += format_metric('process_start_time_seconds', 'gauge', 'Start time of the process since the epoch',
+                               [(None, metrics.started_at)])
+        lines += format_metric('process_cpu_seconds_total', 'counter', 'User and system CPU time',
+                               [(None, time.process_time())])
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                resident_pages = int(f.read().split()[1])
+            lines += format_metric('process_resident_memory_bytes', 'gauge', 'Resident memory size',
+                                   [(None, resident_pages * os.sysconf('SC_PAGE_SIZE'))])
+        except (OSError, ValueError, IndexError):
+            pass
+        
+        lines += format_metric('prot7_guilds', 'gauge', 'Servers the bot is in', [(None, len(self.bot.guilds))])
+        lines += format_metric('prot7_gateway_latency_seconds', 'gauge', 'Gateway heartbeat latency',
+                               [(None, self.bot.latency)])
+        lines += format_metric('prot7_messages_processed_total', 'counter', 'Messages handled by on_message',
+                               [(None, metrics.messages)])
+        lines += format_metric('prot7_security_events_total', 'counter', 'Security events by type and severity',
+                               [({'event_type': event_type, 'severity': severity}, count)
+                                for (event_type, severity), count in sorted(metrics.events.items())])
+        
+        lines += format_metric('prot7_rest_requests_total', 'counter', 'Discord REST requests by method',
+                               [({'method': method}, count) for method, count in sorted(metrics.rest_requests.items())])
+        lines += format_metric('prot7_rest_errors_total', 'counter', 'Failed Discord REST requests by status',
+                               [({'status': status}, count) for status, count in sorted(metrics.rest_errors.items())])
+        lines += format_metric('prot7_rest_rate_limits_total', 'counter', 'Rate limit responses (429) from Discord',
+                               [(None, metrics.rate_limits['all'])])
+        lines += format_metric('prot7_rest_global_rate_limits_total', 'counter', 'Of those, global rate limits',
+                               [(None, metrics.rate_limits['global'])])
+        
+        if self.db_writer:
+            writer = self.db_writer
+            lines += format_metric('prot7_db_writer_queue_depth', 'gauge', 'Rows waiting for the batched writer',
+                                   [(None, writer.queue.qsize())])
+            lines += format_metric('prot7_db_writer_rows_written_total', 'counter', 'Rows written by the batched writer',
+                                   [(None, writer.rows_written)])
+            lines += format_metric('prot7_db_writer_rows_dropped_total', 'counter', 'Rows dropped because the queue was full',
+                                   [(None, writer.rows_dropped)])
+            lines += format_metric('prot7_db_writer_flush_seconds', 'summary', 'Duration of batched writer transactions',
+                                   summary_samples(writer.flush_latency))
+        if self.db:
+            db = self.db
+            lines += format_metric('prot7_db_queue_depth', 'gauge', 'Calls queued or running on the database thread',
+                                   [(None, db.queue_depth())])
+            lines += format_metric('prot7_db_call_failures_total', 'counter', 'Database thread calls that raised',
+                                   [(None, db.failed)])
+            timings = sorted(db.timings.items())
+            lines += format_metric('prot7_db_calls_total', 'counter', 'Database thread calls by label',
+                                   [({'label': label}, calls) for label, (calls, _, _, _) in timings])
+            lines += format_metric('prot7_db_call_seconds_total', 'counter', 'Time spent in database thread calls by label',
+                                   [({'label': label}, total / 1000) for label, (_, total, _, _) in timings])
+            lines += format_metric('prot7_db_call_wait_seconds_total', 'counter', 'Time calls waited in the database queue by label',
+                                   [({'label': label}, wait / 1000) for label, (_, _, _, wait) in timings])
+        
+        trackers = (('spam', self.spam_tracker), ('raid', self.raid_protection), ('users', self.user_resolver.cache))
+        lines += format_metric('prot7_tracker_entries', 'gauge', 'Entries held by the in-memory trackers',
+                               [({'tracker': name}, len(tracker)) for name, tracker in trackers])
+        lines += format_metric('prot7_tracker_evictions_total', 'counter', 'Tracker entries evicted at the size limit',
+                               [({'tracker': name}, tracker.evictions) for name, tracker in trackers])
+        lines += format_metric('prot7_tracker_expirations_total', 'counter', 'Tracker entries dropped after being idle',
+                               [({'tracker': name}, tracker.expirations) for name, tracker in trackers])
+        lines += format_metric('prot7_retention_rows_purged_total', 'counter', 'Rows deleted by retention',
+                               [(None, self.retention_stats['rows_purged'])])
+        
+        if self.stage_timings:
+            samples = []
+            for stage, histogram in self.stage_timings.histograms.items():
+                samples += summary_samples(histogram, {'stage': stage})
+            lines += format_metric('prot7_stage_latency_seconds', 'summary', 'Handler latency per stage', samples)
+        return "\n".join(lines) + "\n"
+    
     @tasks.loop(minutes=1)
+    async def write_stage_timings(self):
+        """Publish handler latency percentiles for the admin panel"""
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.stage_timings.write_snapshot)
+        except Exception as e:
+            logging.warning(f"Could not write stage timings: {e}")
+    
+    @tasks.loop(seconds=0.2)
     async def config_monitor(self):
         """Monitor config file for changes"""
+        signature = self.get_config_signature()
+        if signature is None or signature == self.config_file_signature:
+            return
+        
+        # Remember the signature even if parsing fails, the next write changes it again
+        self.config_file_signature = signature
         try:
-            config_mtime = os.path.getmtime('config.json')
-            if config_mtime > self.last_config_check:
-                old_config = self.config.copy()
-                
-                with open('config.json', 'r') as f:
-                    self.config = json.load(f)
-                
-                # Update prefix if changed
-                if old_config.get('prefix') != self.config.get('prefix'):
-                    self.bot.command_prefix = self.config.get('prefix', '!p7')
-                
-                self.last_config_check = config_mtime
-                logging.info("Configuration reloaded due to file change")
+            await self.reload_config()
+            logging.info("Configuration reloaded due to file change")
         except Exception as e:
             logging.error(f"Error checking config changes: {e}")
     
-    @tasks.loop(hours=1)
+    @tasks.loop(minutes=10)
     async def cleanup_old_data(self):
         """Clean up old data periodically"""
-        current_time = datetime.now()
+        now = self.clock()
+        
+        # Drop users and guilds that have been idle too long
+        expired_users = self.spam_tracker.expire(now)
+        expired_guilds = self.raid_protection.expire(now)
+        self.user_resolver.cache.expire(now)
         
         # Clean spam tracker
-        for user_id in list(self.spam_tracker.keys()):
+        for record in self.spam_tracker.values():
             # Reset warnings after 1 hour
-            if (self.spam_tracker[user_id].get('last_warning') and 
-                current_time - self.spam_tracker[user_id]['last_warning'] > timedelta(hours=1)):
-                self.spam_tracker[user_id]['warnings'] = 0
+            if record.last_warning is not None and now - record.last_warning > 3600:
+                record.warnings = 0
         
         # Clean raid protection data
-        for guild_id in list(self.raid_protection.keys()):
-            self.raid_protection[guild_id] = [
-                join_time for join_time in self.raid_protection[guild_id]
-                if current_time - join_time < timedelta(hours=1)
-            ]
+        for joins in self.raid_protection.values():
+            while joins and now - joins[0] >= 3600:
+                joins.popleft()
         
-        logging.info("Cleaned up old data")
+        logging.info(f"Cleaned up old data (expired {expired_users} users, {expired_guilds} guilds; "
+                     f"tracking {len(self.spam_tracker)} users, {len(self.raid_protection)} guilds)")
+    
+    def retention_busy(self):
+        """Whether the bot is writing enough that retention deletes should wait"""
+        return bool(self.db_writer) and self.db_writer.queue.qsize() > self.db_writer.batch_size
+    
+    async def run_retention_pass(self, retention):
+        """Delete expired rows one small batch per database call until done, busy or out of time"""
+        started = time.monotonic()
+        purged = 0
+        pending = 0
+        deferred = False
+        for table, period in retention.items():
+            job = await self.db.call('retention', prot7db.get_delete_job, table)
+            if not job:
+                job = await self.db.call('retention', prot7db.start_delete_job, table, datetime.now() - period)
+                if not job:
+                    continue
+            
+            finished = False
+            while not finished:
+                if self.retention_busy() or time.monotonic() - started > self.RETENTION_PASS_SECONDS:
+                    deferred = True
+                    break
+                # Other queries queue behind at most one batch
+                deleted, finished = await self.db.call('retention', lambda conn: prot7db.run_delete_job(
+                    conn, table, batch_size=self.RETENTION_BATCH_ROWS, pause=0, max_batches=1
+                ))
+                purged += deleted
+                await asyncio.sleep(0.05)
+            if not finished:
+                pending += 1
+        return purged, pending, deferred, time.monotonic() - started
+    
+    @tasks.loop(minutes=15)
+    async def enforce_retention(self):
+        """Apply the retention policy from config.json incrementally"""
+        retention = dict(self.snapshot.retention)
+        if not self.db or not retention:
+            return
+        if self.retention_busy():
+            self.retention_stats['deferred'] += 1
+            return
+        
+        try:
+            purged, pending, deferred, seconds = await self.run_retention_pass(retention)
+        except Exception as e:
+            logging.error(f"Retention pass failed: {e}")
+            return
+        
+        stats = self.retention_stats
+        stats['passes'] += 1
+        stats['rows_purged'] += purged
+        stats['last_pass_rows'] = purged
+        stats['last_pass_seconds'] = seconds
+        stats['last_pass_at'] = datetime.now()
+        stats['pending_tables'] = pending
+        if deferred:
+            stats['deferred'] += 1
+        if purged or pending:
+            logging.info(f"Retention pass purged {purged} rows in {seconds:.1f}s"
+                         + (f", {pending} tables continue next pass" if pending else ""))
+    
+    async def load_guild_bans(self, guild):
+        """Load the full ban list of a guild into the ban cache"""
+        try:
+            banned = set()
+            async for ban in guild.bans(limit=None):
+                banned.add(ban.user.id)
+            self.ban_cache[guild.id] = banned
+            return True
+        except Exception as e:
+            logging.error(f"Failed to load bans for guild {guild.id}: {e}")
+            return False
+    
+    @tasks.loop(hours=12)
+    async def refresh_ban_cache(self):
+        """Rebuild the ban cache periodically (first run happens at startup)"""
+        loaded = 0
+        for guild in self.bot.guilds:
+            if await self.load_guild_bans(guild):
+                loaded += 1
+        
+        logging.info(f"Ban cache refreshed for {loaded} guilds ({sum(len(b) for b in self.ban_cache.values())} bans)")
     
     @tasks.loop(hours=6)
     async def update_server_stats(self):
         """Update server statistics periodically"""
         if not self.db:
             return
-            
-        for guild in self.bot.guilds:
-            try:
-                cursor = self.db.cursor()
-                cursor.execute('''
+        
+        now = datetime.now()
+        rows = [(str(guild.id), guild.member_count, len(guild.channels), now) for guild in self.bot.guilds]
+        
+        def insert_stats(conn):
+            with conn:
+                conn.executemany('''
                     INSERT INTO server_stats (guild_id, member_count, channel_count, timestamp)
                     VALUES (?, ?, ?, ?)
-                ''', (
-                    str(guild.id),
-                    guild.member_count,
-                    len(guild.channels),
-                    datetime.now()
-                ))
-                self.db.commit()
-            except Exception as e:
-                logging.error(f"Failed to update server stats: {e}")
+                ''', rows)
         
-        logging.info("Updated server statistics")
+        try:
+            await self.db.call('server_stats', insert_stats)
+        except Exception as e:
+            logging.error(f"Failed to update server stats: {e}")
+            return
+        
+        logging.info(f"Updated server statistics for {len(rows)} guilds")
     
     def setup_bot_commands(self):
         """Set up traditional prefix commands"""
@@ -638,7 +1839,50 @@ class Prot7Bot:
             embed.add_field(name="Servers", value=len(self.bot.guilds), inline=True)
             embed.add_field(name="Users", value=sum(g.member_count for g in self.bot.guilds), inline=True)
             embed.add_field(name="Status", value=self.current_status, inline=True)
-            embed.add_field(name="Modules", value="\n".join([f"✅ {k}" for k, v in self.config['modules'].items() if v]), inline=False)
+            spam_stats = self.spam_tracker.stats()
+            raid_stats = self.raid_protection.stats()
+            embed.add_field(
+                name="Trackers",
+                value=f"Users: {spam_stats['size']}/{spam_stats['max_size']} (evicted {spam_stats['evictions']}, expired {spam_stats['expirations']})\n"
+                      f"Guilds: {raid_stats['size']}/{raid_stats['max_size']} (evicted {raid_stats['evictions']}, expired {raid_stats['expirations']})",
+                inline=False
+            )
+            lookups = self.user_resolver.stats()
+            embed.add_field(
+                name="User Lookups",
+                value=f"Gateway cache: {lookups['local_hits']} | TTL cache: {lookups['cache_hits']} ({lookups['cache_size']} cached) | "
+                      f"Shared: {lookups['shared_fetches']} | API: {lookups['api_calls']} (failed {lookups['failures']})",
+                inline=False
+            )
+            retention = self.retention_stats
+            if self.snapshot.retention:
+                embed.add_field(
+                    name="Retention",
+                    value=f"Purged: {retention['rows_purged']} rows in {retention['passes']} passes | "
+                          f"Last pass: {retention['last_pass_rows']} rows, {retention['last_pass_seconds']:.1f}s | "
+                          f"Deferred: {retention['deferred']} | Pending tables: {retention['pending_tables']}",
+                    inline=False
+                )
+            if self.stage_timings:
+                stages = self.stage_timings.summary()
+                embed.add_field(
+                    name="Latency (p50 / p99 / max µs)",
+                    value="\n".join(f"{stage}: {t['p50_us']:.0f} / {t['p99_us']:.0f} / {t['max_us']:.0f} ({t['count']}x)"
+                                    for stage, t in stages.items()) or "No events yet",
+                    inline=False
+                )
+            if self.db:
+                db_stats = self.db.stats()
+                timings = sorted(db_stats['timings'].items(), key=lambda item: item[1]['calls'] * item[1]['avg_ms'], reverse=True)
+                embed.add_field(
+                    name="Database",
+                    value=f"Calls: {db_stats['calls']} (failed {db_stats['failed']}) | "
+                          f"Queue: {db_stats['queue_depth']} (max {db_stats['max_depth']})\n"
+                          + "\n".join(f"{label}: {t['calls']}x, avg {t['avg_ms']:.1f} ms, max {t['max_ms']:.0f} ms, "
+                                      f"wait {t['avg_wait_ms']:.1f} ms" for label, t in timings[:4]),
+                    inline=False
+                )
+            embed.add_field(name="Modules", value="\n".join([f"✅ {k}" for k, v in self.snapshot.modules.items() if v]), inline=False)
             
             await ctx.send(embed=embed)
         
@@ -669,8 +1913,7 @@ class Prot7Bot:
         async def reload_config_cmd(ctx):
             """Reload bot configuration"""
             try:
-                with open('config.json', 'r') as f:
-                    self.config = json.load(f)
+                await self.reload_config()
                 await ctx.send("✅ Configuration reloaded!")
             except Exception as e:
                 await ctx.send(f"❌ Failed to reload config: {e}")
@@ -685,18 +1928,19 @@ class Prot7Bot:
                 await interaction.response.send_message("❌ You need administrator permissions!", ephemeral=True)
                 return
             
-            # Get statistics
-            cursor = self.db.cursor()
-            cursor.execute("SELECT COUNT(*) FROM messages WHERE timestamp > datetime('now', '-24 hours')")
-            recent_messages = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM security_events WHERE timestamp > datetime('now', '-24 hours')")
-            recent_events = cursor.fetchone()[0]
+            # Get statistics from the hourly rollups
+            cutoff = prot7db.rollup_cutoff(24)
+            recent_messages, recent_events = await self.db.fetchone('security_status', '''
+                SELECT
+                    (SELECT COALESCE(SUM(messages), 0) FROM hourly_guild_messages WHERE hour >= ?),
+                    (SELECT COALESCE(SUM(events), 0) FROM hourly_security_events WHERE hour >= ?)
+            ''', (cutoff, cutoff))
             
             embed = discord.Embed(title="🛡️ Prot7 Security Status", color=0x00ff00)
             embed.add_field(name="📊 24h Activity", value=f"Messages: {recent_messages}\nEvents: {recent_events}", inline=True)
-            embed.add_field(name="🔧 Active Modules", value="\n".join([f"✅ {k}" for k, v in self.config['modules'].items() if v]), inline=True)
-            embed.add_field(name="🚫 Blocked Words", value=f"{len(self.config.get('blocked_words', []))}", inline=True)
+            config = self.snapshot
+            embed.add_field(name="🔧 Active Modules", value="\n".join([f"✅ {k}" for k, v in config.modules.items() if v]), inline=True)
+            embed.add_field(name="🚫 Blocked Words", value=f"{len(config.blocked_words)}", inline=True)
             
             await interaction.response.send_message(embed=embed)
         
@@ -873,14 +2117,14 @@ class Prot7Bot:
                     )
                 
                 # 3. Update configuration
-                with self.config_lock:
-                    self.config["log_channel"] = str(security_logs.id)
-                    self.config["mod_log_channel"] = str(mod_logs.id)
-                    self.config["admin_roles"] = [str(admin_role.id)]
-                    self.config["mod_roles"] = [str(mod_role.id)]
-                    
-                    with open('config.json', 'w') as f:
-                        json.dump(self.config, f, indent=4)
+                loop = asyncio.get_running_loop()
+                snapshot = await loop.run_in_executor(None, self.update_config_file, {
+                    "log_channel": str(security_logs.id),
+                    "mod_log_channel": str(mod_logs.id),
+                    "admin_roles": [str(admin_role.id)],
+                    "mod_roles": [str(mod_role.id)]
+                })
+                self.publish_config(snapshot)
                 
                 # 4. Send success message with information
                 setup_embed = discord.Embed(
@@ -925,10 +2169,10 @@ class Prot7Bot:
             logging.info(f"Received signal {sig}, shutting down gracefully...")
             bot_running = False
             shutdown_event.set()
-            # Close database connection
-            if self.db:
-                self.db.close()
-            # Close discord connection
+            if self.metrics_server:
+                self.metrics_server.close()
+            # Close discord connection; run() drains the writer and closes the
+            # database once the loop has stopped, so handlers still running can log
             asyncio.create_task(self.bot.close())
         
         # Register signal handlers
@@ -954,6 +2198,9 @@ class Prot7Bot:
             logging.error(error_msg)
             print(f"ERROR: {error_msg}")
         finally:
+            # Drain queued writes
+            if getattr(self, 'db_writer', None):
+                self.db_writer.stop()
             # Close database connection
             if hasattr(self, 'db') and self.db:
                 self.db.close()
@@ -961,6 +2208,7 @@ class Prot7Bot:
             print("Bot shutdown complete")
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         bot = Prot7Bot()
         bot.run()
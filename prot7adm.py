@@ -3,7 +3,6 @@
 # Prot7 Admin Control Panel - Enhanced Edition
 # Author: T9Tuco
 
-import sqlite3
 import json
 import argparse
 import sys
@@ -14,8 +13,19 @@ import signal
 import time
 import threading
 import csv
+import gzip
 import io
 import re
+import urllib.request
+
+import prot7db
+import prot7export
+
+# Optional: zstd compression for exports
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Color codes for terminal
 class Colors:
@@ -41,8 +51,12 @@ def safe_input(prompt):
         return ""
 
 class BotController:
+    # Seconds to wait for the bot's metrics endpoint
+    METRICS_TIMEOUT = 2
+    
     def __init__(self):
         self.bot_pid_file = 'prot7_bot.pid'
+        self.metrics_port = 9477  # monitoring.metrics_port, set by Prot7Admin from config.json
         self.bot_script = 'prot7.py'  # Name des Bot-Scripts
         self.log_file = 'prot7_bot.log'
         self.env_file = 'prot7.env'
@@ -186,6 +200,16 @@ class BotController:
                     if i < len(values):
                         process_info[header.lower()] = values[i]
             
+            # Memory and CPU from the metrics endpoint, ps only if it is disabled
+            metrics = self.get_bot_metrics()
+            if metrics and 'process_resident_memory_bytes' in metrics:
+                process_info['memory_kb'] = int(self.metric_value(metrics, 'process_resident_memory_bytes') / 1024)
+                process_info['memory_mb'] = round(process_info['memory_kb'] / 1024, 2)
+                # Same as ps %cpu: CPU time over the lifetime of the process
+                lifetime = time.time() - self.metric_value(metrics, 'process_start_time_seconds')
+                process_info['cpu'] = f"{self.metric_value(metrics, 'process_cpu_seconds_total') / max(lifetime, 1) * 100:.1f}"
+                return process_info
+            
             # Get memory usage
             mem_output = subprocess.check_output(f"ps -p {pid} -o rss", shell=True).decode()
             mem_lines = mem_output.strip().split('\n')
@@ -211,27 +235,50 @@ class BotController:
         else:
             return "OFFLINE", Colors.RED
     
-    def get_bot_activity(self):
-        """Get the current bot activity from database"""
+    def get_bot_metrics(self):
+        """Scrape the bot's local metrics endpoint, returns {name: [(labels, value), ...]} or None"""
+        if not self.metrics_port:
+            return None
         try:
-            conn = sqlite3.connect('prot7.db')
-            cursor = conn.cursor()
-            
-            # Try to get bot status from database
-            cursor.execute("SELECT status, details, timestamp FROM bot_status ORDER BY id DESC LIMIT 1")
-            status_row = cursor.fetchone()
-            
-            if status_row:
-                status, details, timestamp = status_row
-                return status, details, timestamp
-            
-            return "Unknown", "No status recorded", None
-        except Exception as e:
-            print(f"Error getting bot activity: {e}")
-            return "Unknown", "Database error", None
-        finally:
-            if conn:
-                conn.close()
+            url = f"http://127.0.0.1:{self.metrics_port}/metrics"
+            with urllib.request.urlopen(url, timeout=self.METRICS_TIMEOUT) as response:
+                text = response.read().decode()
+        except (OSError, ValueError):
+            return None
+        
+        metrics = {}
+        for line in text.splitlines():
+            if not line or line.startswith('#'):
+                continue
+            sample, _, value = line.rpartition(' ')
+            name, _, labels = sample.partition('{')
+            try:
+                metrics.setdefault(name, []).append((dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels)), float(value)))
+            except ValueError:
+                continue
+        return metrics
+    
+    @staticmethod
+    def metric_value(metrics, name, **labels):
+        """Sum of the samples of a metric matching the given labels (0 if there are none)"""
+        return sum(value for sample_labels, value in metrics.get(name, [])
+                   if all(sample_labels.get(key) == wanted for key, wanted in labels.items()))
+    
+    def get_bot_activity(self):
+        """Get the current bot activity from the bot's metrics endpoint"""
+        metrics = self.get_bot_metrics()
+        if metrics is None:
+            return "Unknown", f"Metrics endpoint not reachable on port {self.metrics_port}", None
+        
+        status = next((labels.get('status') for labels, value in metrics.get('prot7_status', []) if value), "Unknown")
+        latency = self.metric_value(metrics, 'prot7_gateway_latency_seconds')
+        latency_text = f"{latency * 1000:.0f} ms" if latency == latency and latency != float('inf') else "n/a"
+        details = (f"{self.metric_value(metrics, 'prot7_guilds'):.0f} servers, "
+                   f"{self.metric_value(metrics, 'prot7_messages_processed_total'):,.0f} messages, "
+                   f"{self.metric_value(metrics, 'prot7_security_events_total'):,.0f} security events, "
+                   f"gateway latency {latency_text}")
+        started = self.metric_value(metrics, 'process_start_time_seconds')
+        return status, details, str(datetime.fromtimestamp(started)) if started else None
 
     def show_bot_logs(self):
         """Show bot logs"""
@@ -246,12 +293,17 @@ class BotController:
         print(f"{Colors.YELLOW}Ende der Logs{Colors.ENDC}")
 
 class Prot7Admin:
+    # Rows fetched from SQLite per chunk while exporting
+    EXPORT_CHUNK_ROWS = 5000
+    
     def __init__(self):
-        self.db_path = 'prot7.db'
+        self.db_path = prot7db.DB_PATH
         self.config_path = 'config.json'
         self.env_path = 'prot7.env'
+        self.timings_path = 'prot7_timings.json'  # written by the bot when monitoring.stage_timings is on
         self.bot_controller = BotController()
         self.ensure_files_exist()
+        self.bot_controller.metrics_port = self.load_config().get('monitoring', {}).get('metrics_port', 9477)
         self.ensure_database_tables()
     
     def ensure_files_exist(self):
@@ -295,117 +347,174 @@ class Prot7Admin:
             print(f"Please add your Discord token to this file.{Colors.ENDC}")
     
     def ensure_database_tables(self):
-        """Ensure all required database tables exist"""
+        """Ensure all required database tables exist and the schema is up to date"""
         conn = self.get_db_connection()
         if not conn:
             return
         
-        cursor = conn.cursor()
-        
-        # Check if users table exists, if not create it
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-        if not cursor.fetchone():
-            cursor.execute('''
-            CREATE TABLE users (
-                user_id TEXT PRIMARY KEY,
-                username TEXT,
-                joined_at TEXT,
-                avatar_url TEXT,
-                is_bot INTEGER DEFAULT 0,
-                last_seen TEXT,
-                notes TEXT
-            )
-            ''')
-            print(f"{Colors.GREEN}Created users table{Colors.ENDC}")
-        
-        # Check if messages table exists, if not create it
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='messages'")
-        if not cursor.fetchone():
-            cursor.execute('''
-            CREATE TABLE messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message_id TEXT,
-                user_id TEXT,
-                username TEXT,
-                channel_id TEXT,
-                guild_id TEXT,
-                content TEXT,
-                timestamp TEXT
-            )
-            ''')
-            print(f"{Colors.GREEN}Created messages table{Colors.ENDC}")
-        
-        # Check if security_events table exists, if not create it
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='security_events'")
-        if not cursor.fetchone():
-            cursor.execute('''
-            CREATE TABLE security_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                event_type TEXT,
-                user_id TEXT,
-                details TEXT,
-                timestamp TEXT,
-                severity TEXT
-            )
-            ''')
-            print(f"{Colors.GREEN}Created security_events table{Colors.ENDC}")
-        
-        # Check if bot_status table exists, if not create it
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='bot_status'")
-        if not cursor.fetchone():
-            cursor.execute('''
-            CREATE TABLE bot_status (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                status TEXT,
-                details TEXT,
-                timestamp TEXT
-            )
-            ''')
-            print(f"{Colors.GREEN}Created bot_status table{Colors.ENDC}")
-        
-        # Check if advanced_audit table exists, if not create it
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='advanced_audit'")
-        if not cursor.fetchone():
-            cursor.execute('''
-            CREATE TABLE advanced_audit (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                action_type TEXT,
-                guild_id TEXT,
-                channel_id TEXT,
-                user_id TEXT,
-                target_id TEXT,
-                details TEXT,
-                timestamp TEXT
-            )
-            ''')
-            print(f"{Colors.GREEN}Created advanced_audit table{Colors.ENDC}")
-
-        # Check if server_stats table exists, if not create it
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='server_stats'")
-        if not cursor.fetchone():
-            cursor.execute('''
-            CREATE TABLE server_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                guild_id TEXT,
-                member_count INTEGER,
-                online_count INTEGER,
-                channel_count INTEGER,
-                timestamp TEXT
-            )
-            ''')
-            print(f"{Colors.GREEN}Created server_stats table{Colors.ENDC}")
-        
-        conn.commit()
-        conn.close()
+        try:
+            for version, description in prot7db.migrate(conn):
+                print(f"{Colors.GREEN}Database migrated to schema version {version}: {description}{Colors.ENDC}")
+        except Exception as e:
+            print(f"{Colors.RED}Database migration failed: {e}{Colors.ENDC}")
+        finally:
+            conn.close()
     
-    def get_db_connection(self):
-        """Get database connection"""
+    def get_db_connection(self, readonly=False):
+        """Get database connection (read-only connections never block the bot's writer)"""
         try:
-            return sqlite3.connect(self.db_path)
+            return prot7db.connect(self.db_path, readonly=readonly)
         except Exception as e:
             print(f"{Colors.RED}Database error: {e}{Colors.ENDC}")
             return None
     
+    def browse_pages(self, conn, select, source, params, keys, show_header, show_row, page_size, noun, descending=True,
+                     rank=None):
+        """Show query results page by page with keyset (cursor) paging
+
+        keys are the sort expressions, the last one must be unique. Pages are
+        fetched with a range condition on the keys of the neighbouring page
+        instead of OFFSET, so every page costs the same however deep it is.
+        keys must not change while browsing; rank is an optional expression
+        (lowest first) that only orders the rows within each page.
+        """
+        aliases = [f"page_key{i}" for i in range(len(keys))]
+        inner = (f"SELECT {select}, " + (f"{rank} AS page_rank, " if rank else "")
+                 + ", ".join(f"{key} AS {alias}" for key, alias in zip(keys, aliases)) + f" {source}")
+        skip = len(keys) + (1 if rank else 0)
+        key_columns = ", ".join(aliases)
+        placeholders = ", ".join("?" for _ in keys)
+        
+        def fetch(cursor_key, newer):
+            # Walking back towards the first page reverses the sort direction
+            desc = descending != newer
+            query = f"SELECT * FROM ({inner})"
+            query_params = list(params)
+            if cursor_key:
+                query += f" WHERE ({key_columns}) {'<' if desc else '>'} ({placeholders})"
+                query_params.extend(cursor_key)
+            query += " ORDER BY " + ", ".join(f"{alias} {'DESC' if desc else 'ASC'}" for alias in aliases) + " LIMIT ?"
+            query_params.append(page_size + 1)
+            
+            rows = conn.execute(query, query_params).fetchall()
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            if newer:
+                rows.reverse()
+            return rows, has_more
+        
+        page = 1
+        rows, has_older = fetch(None, False)
+        while True:
+            show_header()
+            if not rows:
+                print(f"{Colors.YELLOW}No {noun} found matching the criteria{Colors.ENDC}")
+                safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+                return
+            
+            for row in sorted(rows, key=lambda row: row[-skip]) if rank else rows:
+                show_row(row[:-skip])
+            
+            first = (page - 1) * page_size + 1
+            print(f"{Colors.GREEN}Page {page}: {noun} {first}-{first + len(rows) - 1}{Colors.ENDC}")
+            
+            options = []
+            if has_older:
+                options.append("[N]ext")
+            if page > 1:
+                options.append("[P]revious")
+            options.append("[Enter] Back")
+            choice = safe_input(f"{Colors.CYAN}{'  '.join(options)}: {Colors.ENDC}").strip().lower()
+            
+            if choice == 'n' and has_older:
+                next_rows, more = fetch(rows[-1][-len(keys):], False)
+                if next_rows:
+                    rows, has_older, page = next_rows, more, page + 1
+                else:
+                    has_older = False
+            elif choice == 'p' and page > 1:
+                previous_rows, _ = fetch(rows[0][-len(keys):], True)
+                if previous_rows:
+                    rows, has_older = previous_rows, True
+                page -= 1
+            elif choice not in ('n', 'p'):
+                return
+    
+    def ask_export_file(self, default_name):
+        """Ask for export filename and compression, returns the final path"""
+        compression = safe_input(f"Compression (none/gzip/zstd, default: none): ").strip().lower()
+        if compression == 'zstd' and not zstandard:
+            print(f"{Colors.YELLOW}zstandard is not installed (pip3 install zstandard), using gzip{Colors.ENDC}")
+            compression = 'gzip'
+        suffix = {'gzip': '.gz', 'zstd': '.zst'}.get(compression, '')
+        
+        export_file = safe_input(f"Export filename (default: {default_name}{suffix}): ").strip()
+        if not export_file:
+            export_file = default_name
+        
+        # Add extensions if not present
+        if export_file.endswith(suffix) and suffix:
+            export_file = export_file[:-len(suffix)]
+        if not export_file.endswith('.csv'):
+            export_file += '.csv'
+        return export_file + suffix
+    
+    def open_export_file(self, path, export_file):
+        """Open a text file for writing, compressed according to the export's extension"""
+        if export_file.endswith('.gz'):
+            return gzip.open(path, 'wt', compresslevel=6, newline='', encoding='utf-8')
+        if export_file.endswith('.zst'):
+            raw = open(path, 'wb')
+            return io.TextIOWrapper(zstandard.ZstdCompressor(level=3).stream_writer(raw), newline='', encoding='utf-8')
+        return open(path, 'w', newline='', encoding='utf-8')
+    
+    def stream_csv_export(self, conn, query, params, header, export_file):
+        """Write query results to CSV chunk by chunk, returns the number of rows
+
+        Only EXPORT_CHUNK_ROWS rows are held in memory at a time. The file is
+        written under a temporary name and only renamed once complete.
+        """
+        temp_file = export_file + '.part'
+        
+        # A sequential scan gains nothing from a big page cache or memory map
+        conn.execute("PRAGMA cache_size = -2000")
+        conn.execute("PRAGMA mmap_size = 0")
+        
+        cursor = conn.cursor()
+        cursor.arraysize = self.EXPORT_CHUNK_ROWS
+        cursor.execute(query, params)
+        
+        count = 0
+        started = time.time()
+        last_report = started
+        try:
+            with self.open_export_file(temp_file, export_file) as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                
+                while True:
+                    rows = cursor.fetchmany()
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+                    count += len(rows)
+                    
+                    now = time.time()
+                    if now - last_report >= 0.5:
+                        last_report = now
+                        print(f"\r  {count:,} rows ({count / (now - started):,.0f} rows/s)", end="", flush=True)
+        except BaseException:
+            os.remove(temp_file)
+            raise
+        
+        elapsed = time.time() - started
+        if count:
+            print(f"\r  {count:,} rows in {elapsed:.1f}s ({count / max(elapsed, 1e-6):,.0f} rows/s)")
+            os.replace(temp_file, export_file)
+        else:
+            os.remove(temp_file)
+        return count
+    
     def load_config(self):
         """Load configuration"""
         try:
@@ -418,11 +527,15 @@ class Prot7Admin:
     def save_config(self, config):
         """Save configuration and notify bot to reload config"""
         try:
-            with open(self.config_path, 'w') as f:
+            # Schreibt in eine temporäre Datei und ersetzt atomar, damit der Bot nie eine halbe Datei liest
+            tmp_path = f"{self.config_path}.tmp"
+            with open(tmp_path, 'w') as f:
                 json.dump(config, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_path)
             print(f"{Colors.GREEN}Configuration saved successfully!{Colors.ENDC}")
-            print(f"{Colors.YELLOW}Bot will reload config automatically within 1 minute.{Colors.ENDC}")
-            print(f"{Colors.YELLOW}Use /reload_config in Discord for instant reload.{Colors.ENDC}")
+            print(f"{Colors.YELLOW}A running bot picks up the change in under a second.{Colors.ENDC}")
         except Exception as e:
             print(f"{Colors.RED}Failed to save config: {e}{Colors.ENDC}")
     
@@ -603,6 +716,7 @@ class Prot7Admin:
             print(f"{Colors.BOLD} 3.{Colors.ENDC} View Bot Logs")
             print(f"{Colors.BOLD} 4.{Colors.ENDC} Force Kill Bot")
             print(f"{Colors.BOLD} 5.{Colors.ENDC} Advanced Process Info")
+            print(f"{Colors.BOLD} 6.{Colors.ENDC} Handler Latency")
             print(f"{Colors.BOLD} 0.{Colors.ENDC} Back to Main Menu")
             print(f"{Colors.BLUE}{'='*50}{Colors.ENDC}")
             choice = safe_input(f"\n{Colors.CYAN}Enter your choice: {Colors.ENDC}").strip()
@@ -643,9 +757,35 @@ class Prot7Admin:
             elif choice == '5':
                 self.show_advanced_process_info()
                 safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+            elif choice == '6':
+                self.show_stage_timings()
+                safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
             elif choice == '0':
                 break
     
+    def show_stage_timings(self):
+        """Show per-stage handler latency from the bot's last timings snapshot"""
+        if not os.path.exists(self.timings_path):
+            print(f"{Colors.YELLOW}No latency data. Set \"stage_timings\": true under \"monitoring\" in config.json "
+                  f"and restart the bot.{Colors.ENDC}")
+            return
+        
+        try:
+            with open(self.timings_path, 'r') as f:
+                snapshot = json.load(f)
+        except Exception as e:
+            print(f"{Colors.RED}Could not read {self.timings_path}: {e}{Colors.ENDC}")
+            return
+        
+        print(f"\n{Colors.HEADER}HANDLER LATENCY{Colors.ENDC}")
+        print(f"{Colors.BLUE}{'='*78}{Colors.ENDC}")
+        print(f"Since {snapshot.get('since', '?')[:19]}, written {snapshot.get('written', '?')[:19]}")
+        print(f"{Colors.BOLD}{'Stage':<18} {'Count':>10} {'Avg µs':>9} {'p50 µs':>9} {'p90 µs':>9} {'p99 µs':>9} {'Max µs':>10}{Colors.ENDC}")
+        for stage, t in snapshot.get('stages', {}).items():
+            p99_color = Colors.RED if t['p99_us'] >= 100000 else Colors.YELLOW if t['p99_us'] >= 10000 else Colors.GREEN
+            print(f"{stage:<18} {t['count']:>10,} {t['avg_us']:>9.1f} {t['p50_us']:>9.1f} {t['p90_us']:>9.1f} "
+                  f"{p99_color}{t['p99_us']:>9.1f}{Colors.ENDC} {t['max_us']:>10.0f}")
+    
     def show_advanced_process_info(self):
         """Show advanced process information"""
         if not self.bot_controller.is_bot_running():
@@ -700,28 +840,65 @@ class Prot7Admin:
         except Exception as e:
             print(f"{Colors.RED}Error getting advanced process info: {e}{Colors.ENDC}")
     
+    def show_live_metrics(self):
+        """Print counters from the running bot's metrics endpoint"""
+        controller = self.bot_controller
+        metrics = controller.get_bot_metrics()
+        print(f"\n{Colors.BOLD}Live Metrics:{Colors.ENDC}")
+        if metrics is None:
+            print(f"  {Colors.YELLOW}Metrics endpoint not reachable on port {controller.metrics_port} "
+                  f"(monitoring.metrics_port in config.json){Colors.ENDC}")
+            return
+        
+        def value(name, **labels):
+            return controller.metric_value(metrics, name, **labels)
+        
+        latency = value('prot7_gateway_latency_seconds')
+        latency_text = f"{latency * 1000:.0f} ms" if latency == latency and latency != float('inf') else "n/a"
+        flush_p99 = value('prot7_db_writer_flush_seconds', quantile='0.99') * 1000
+        print(f"{Colors.BOLD}Messages Processed:{Colors.ENDC} {Colors.GREEN}{value('prot7_messages_processed_total'):,.0f}{Colors.ENDC}")
+        print(f"{Colors.BOLD}Security Events:{Colors.ENDC} "
+              + ", ".join(f"{severity} {Colors.GREEN}{value('prot7_security_events_total', severity=severity):,.0f}{Colors.ENDC}"
+                          for severity in ('low', 'medium', 'high')))
+        print(f"{Colors.BOLD}Gateway Latency:{Colors.ENDC} {Colors.CYAN}{latency_text}{Colors.ENDC}")
+        print(f"{Colors.BOLD}Database:{Colors.ENDC} writer queue {Colors.CYAN}{value('prot7_db_writer_queue_depth'):,.0f}{Colors.ENDC}, "
+              f"flush p99 {Colors.CYAN}{flush_p99:.1f} ms{Colors.ENDC}, "
+              f"dropped {Colors.RED}{value('prot7_db_writer_rows_dropped_total'):,.0f}{Colors.ENDC}, "
+              f"query queue {Colors.CYAN}{value('prot7_db_queue_depth'):,.0f}{Colors.ENDC}")
+        print(f"{Colors.BOLD}Discord API:{Colors.ENDC} {Colors.GREEN}{value('prot7_rest_requests_total'):,.0f}{Colors.ENDC} requests, "
+              f"{Colors.RED}{value('prot7_rest_errors_total'):,.0f}{Colors.ENDC} errors, "
+              f"{Colors.YELLOW}{value('prot7_rest_rate_limits_total'):,.0f}{Colors.ENDC} rate limited "
+              f"({value('prot7_rest_global_rate_limits_total'):,.0f} global)")
+        print(f"{Colors.BOLD}Trackers:{Colors.ENDC} "
+              + ", ".join(f"{tracker} {Colors.CYAN}{value('prot7_tracker_entries', tracker=tracker):,.0f}{Colors.ENDC}"
+                          for tracker in ('spam', 'raid', 'users')))
+    
     def show_status_detailed(self):
         """Show detailed status"""
         try:
-            conn = self.get_db_connection()
+            conn = self.get_db_connection(readonly=True)
             if conn:
                 cursor = conn.cursor()
                 
-                # Get message count
-                cursor.execute("SELECT COUNT(*) FROM messages")
+                # Message and event counts come from the hourly rollups: everything
+                # ever logged, including rows since removed by retention or cleanup
+                cursor.execute("SELECT COALESCE(SUM(messages), 0) FROM hourly_guild_messages")
                 result = cursor.fetchone()
                 msg_count = result[0] if result else 0
                 
                 # Get recent message count (24h)
-                cursor.execute("SELECT COUNT(*) FROM messages WHERE timestamp > datetime('now', '-1 day')")
+                cursor.execute(
+                    "SELECT COALESCE(SUM(messages), 0) FROM hourly_guild_messages WHERE hour >= ?",
+                    (prot7db.rollup_cutoff(24),)
+                )
                 recent_msg_count = cursor.fetchone()[0] if result else 0
                 
                 # Get security events count
-                cursor.execute("SELECT COUNT(*) FROM security_events")
+                cursor.execute("SELECT COALESCE(SUM(events), 0) FROM hourly_security_events")
                 events_count = cursor.fetchone()[0] if result else 0
                 
                 # Get high severity events count
-                cursor.execute("SELECT COUNT(*) FROM security_events WHERE severity = 'high'")
+                cursor.execute("SELECT COALESCE(SUM(events), 0) FROM hourly_security_events WHERE severity = 'high'")
                 high_severity_count = cursor.fetchone()[0] if result else 0
                 
                 # Get servers count from stats if available
@@ -741,10 +918,12 @@ class Prot7Admin:
                 except:
                     members_count = "N/A"
                 
+                rollups_pending = prot7db.rollup_backfill_status(conn)
                 conn.close()
             else:
                 msg_count = recent_msg_count = events_count = high_severity_count = 0
                 servers_count = members_count = "N/A"
+                rollups_pending = {}
             
             config = self.load_config()
             bot_status, status_color = self.bot_controller.get_bot_status()
@@ -783,11 +962,19 @@ class Prot7Admin:
             
             # Statistics
             print(f"\n{Colors.BOLD}Statistics:{Colors.ENDC}")
-            print(f"{Colors.BOLD}Messages Logged:{Colors.ENDC} {Colors.GREEN}{msg_count:,}{Colors.ENDC} (Last 24h: {Colors.GREEN}{recent_msg_count:,}{Colors.ENDC})")
-            print(f"{Colors.BOLD}Security Events:{Colors.ENDC} {Colors.GREEN}{events_count:,}{Colors.ENDC} (High Severity: {Colors.RED}{high_severity_count:,}{Colors.ENDC})")
+            print(f"{Colors.BOLD}Messages Logged (all time):{Colors.ENDC} {Colors.GREEN}{msg_count:,}{Colors.ENDC} (Last 24h: {Colors.GREEN}{recent_msg_count:,}{Colors.ENDC})")
+            print(f"{Colors.BOLD}Security Events (all time):{Colors.ENDC} {Colors.GREEN}{events_count:,}{Colors.ENDC} (High Severity: {Colors.RED}{high_severity_count:,}{Colors.ENDC})")
+            if rollups_pending:
+                position = sum(position for position, _ in rollups_pending.values())
+                end_id = sum(end_id for _, end_id in rollups_pending.values())
+                print(f"{Colors.YELLOW}Older rows are still being counted ({position / max(end_id, 1):.0%} done), "
+                      f"totals are incomplete{Colors.ENDC}")
             print(f"{Colors.BOLD}Servers:{Colors.ENDC} {Colors.GREEN}{servers_count}{Colors.ENDC}")
             print(f"{Colors.BOLD}Members:{Colors.ENDC} {Colors.GREEN}{members_count}{Colors.ENDC}")
             
+            if bot_status == "ONLINE":
+                self.show_live_metrics()
+            
             # Configuration
             print(f"\n{Colors.BOLD}Configuration:{Colors.ENDC}")
             print(f"{Colors.BOLD}Bot Prefix:{Colors.ENDC} {Colors.CYAN}{config.get('prefix', 'Unknown')}{Colors.ENDC}")
@@ -865,7 +1052,7 @@ class Prot7Admin:
         print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
         
         # Get available event types from database
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(readonly=True)
         if not conn:
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
@@ -906,12 +1093,6 @@ class Prot7Admin:
     
     def view_security_logs(self, user_id=None, severity=None, event_types=None, time_range=None, limit=100):
         """View security logs with filters"""
-        self.clear_screen()
-        
-        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
-        print(f"{Colors.BOLD}{Colors.HEADER}              SECURITY LOGS{Colors.ENDC}")
-        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
-        
         # Build filters for display
         filters = []
         if user_id:
@@ -923,78 +1104,76 @@ class Prot7Admin:
         if time_range:
             filters.append(f"Time Range: Last {time_range}")
         
-        if filters:
-            print(f"{Colors.BOLD}Filters:{Colors.ENDC} {', '.join(filters)}")
+        def show_header():
+            self.clear_screen()
+            
+            print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+            print(f"{Colors.BOLD}{Colors.HEADER}              SECURITY LOGS{Colors.ENDC}")
+            print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+            
+            if filters:
+                print(f"{Colors.BOLD}Filters:{Colors.ENDC} {', '.join(filters)}")
+                print(f"{Colors.BLUE}{'-'*60}{Colors.ENDC}")
+        
+        def show_row(log):
+            log_id, event_type, user_id, details, timestamp, severity = log
+            
+            # Set color based on severity
+            if severity == "high":
+                severity_color = Colors.RED
+            elif severity == "medium":
+                severity_color = Colors.YELLOW
+            else:
+                severity_color = Colors.GREEN
+            
+            print(f"{Colors.BOLD}ID:{Colors.ENDC} {log_id}")
+            print(f"{Colors.BOLD}Type:{Colors.ENDC} {Colors.BLUE}{event_type}{Colors.ENDC}")
+            print(f"{Colors.BOLD}User ID:{Colors.ENDC} {user_id}")
+            print(f"{Colors.BOLD}Severity:{Colors.ENDC} {severity_color}{(severity or '').upper()}{Colors.ENDC}")
+            print(f"{Colors.BOLD}Time:{Colors.ENDC} {timestamp}")
+            print(f"{Colors.BOLD}Details:{Colors.ENDC} {details}")
             print(f"{Colors.BLUE}{'-'*60}{Colors.ENDC}")
         
         # Get logs from database
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(readonly=True)
         if not conn:
+            show_header()
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
             return
             
         try:
-            cursor = conn.cursor()
-            
             # Build query
-            query = "SELECT id, event_type, user_id, details, timestamp, severity FROM security_events WHERE 1=1"
+            source = "FROM security_events WHERE 1=1"
             params = []
             
             if user_id:
-                query += " AND user_id = ?"
+                source += " AND user_id = ?"
                 params.append(user_id)
             
             if severity:
-                query += " AND severity = ?"
+                source += " AND severity = ?"
                 params.append(severity)
             
             if event_types:
                 placeholders = ", ".join(["?" for _ in event_types])
-                query += f" AND event_type IN ({placeholders})"
+                source += f" AND event_type IN ({placeholders})"
                 params.extend(event_types)
             
             if time_range == "24h":
-                query += " AND timestamp > datetime('now', '-1 day')"
+                source += " AND timestamp > datetime('now', '-1 day')"
             elif time_range == "7d":
-                query += " AND timestamp > datetime('now', '-7 days')"
-            
-            query += " ORDER BY timestamp DESC LIMIT ?"
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            logs = cursor.fetchall()
+                source += " AND timestamp > datetime('now', '-7 days')"
             
-            if not logs:
-                print(f"{Colors.YELLOW}No security logs found matching the criteria{Colors.ENDC}")
-            else:
-                # Display logs
-                for log in logs:
-                    log_id, event_type, user_id, details, timestamp, severity = log
-                    
-                    # Set color based on severity
-                    if severity == "high":
-                        severity_color = Colors.RED
-                    elif severity == "medium":
-                        severity_color = Colors.YELLOW
-                    else:
-                        severity_color = Colors.GREEN
-                    
-                    print(f"{Colors.BOLD}ID:{Colors.ENDC} {log_id}")
-                    print(f"{Colors.BOLD}Type:{Colors.ENDC} {Colors.BLUE}{event_type}{Colors.ENDC}")
-                    print(f"{Colors.BOLD}User ID:{Colors.ENDC} {user_id}")
-                    print(f"{Colors.BOLD}Severity:{Colors.ENDC} {severity_color}{severity.upper()}{Colors.ENDC}")
-                    print(f"{Colors.BOLD}Time:{Colors.ENDC} {timestamp}")
-                    print(f"{Colors.BOLD}Details:{Colors.ENDC} {details}")
-                    print(f"{Colors.BLUE}{'-'*60}{Colors.ENDC}")
-                
-                print(f"{Colors.GREEN}Found {len(logs)} security logs{Colors.ENDC}")
+            self.browse_pages(
+                conn, "id, event_type, user_id, details, timestamp, severity", source, params,
+                ("timestamp", "id"), show_header, show_row, limit, "security logs"
+            )
         except Exception as e:
             print(f"{Colors.RED}Error retrieving security logs: {e}{Colors.ENDC}")
+            safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
         finally:
             conn.close()
-            
-        safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
     
     def export_security_logs(self):
         """Export security logs to CSV"""
@@ -1012,24 +1191,16 @@ class Prot7Admin:
             severity = "all"
         
         # Get export filename
-        export_file = safe_input(f"Export filename (default: security_logs.csv): ").strip()
-        if not export_file:
-            export_file = "security_logs.csv"
-        
-        # Add .csv extension if not present
-        if not export_file.endswith('.csv'):
-            export_file += '.csv'
+        export_file = self.ask_export_file("security_logs")
         
         # Get logs from database
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(readonly=True)
         if not conn:
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
             return
             
         try:
-            cursor = conn.cursor()
-            
             # Build query
             query = "SELECT id, event_type, user_id, details, timestamp, severity FROM security_events WHERE 1=1"
             params = []
@@ -1047,21 +1218,15 @@ class Prot7Admin:
             
             query += " ORDER BY timestamp DESC"
             
-            cursor.execute(query, params)
-            logs = cursor.fetchall()
+            count = self.stream_csv_export(
+                conn, query, params,
+                ['ID', 'Event Type', 'User ID', 'Details', 'Timestamp', 'Severity'], export_file
+            )
             
-            if not logs:
+            if not count:
                 print(f"{Colors.YELLOW}No security logs found matching the criteria{Colors.ENDC}")
             else:
-                # Write to CSV
-                with open(export_file, 'w', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['ID', 'Event Type', 'User ID', 'Details', 'Timestamp', 'Severity'])
-                    
-                    for log in logs:
-                        writer.writerow(log)
-                
-                print(f"{Colors.GREEN}Successfully exported {len(logs)} logs to {export_file}{Colors.ENDC}")
+                print(f"{Colors.GREEN}Successfully exported {count} logs to {export_file}{Colors.ENDC}")
         except Exception as e:
             print(f"{Colors.RED}Error exporting security logs: {e}{Colors.ENDC}")
         finally:
@@ -1069,6 +1234,63 @@ class Prot7Admin:
             
         safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
     
+    def export_message_logs(self):
+        """Export message logs to CSV"""
+        self.clear_screen()
+        
+        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+        print(f"{Colors.BOLD}{Colors.HEADER}           EXPORT MESSAGE LOGS{Colors.ENDC}")
+        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+        
+        # Get export parameters
+        time_range = safe_input(f"Time range (all/24h/7d/30d): ").strip().lower()
+        user_id = safe_input(f"User ID (empty for all users): ").strip()
+        
+        # Get export filename
+        export_file = self.ask_export_file("message_logs")
+        
+        # Get logs from database
+        conn = self.get_db_connection(readonly=True)
+        if not conn:
+            print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
+            safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+            return
+            
+        try:
+            # Build query
+            query = "SELECT id, message_id, user_id, username, channel_id, guild_id, content, timestamp, message_type FROM messages WHERE 1=1"
+            params = []
+            
+            if user_id:
+                query += " AND user_id = ?"
+                params.append(user_id)
+            
+            if time_range == "24h":
+                query += " AND timestamp > datetime('now', '-1 day')"
+            elif time_range == "7d":
+                query += " AND timestamp > datetime('now', '-7 days')"
+            elif time_range == "30d":
+                query += " AND timestamp > datetime('now', '-30 days')"
+            
+            query += " ORDER BY timestamp DESC"
+            
+            count = self.stream_csv_export(
+                conn, query, params,
+                ['ID', 'Message ID', 'User ID', 'Username', 'Channel ID', 'Guild ID', 'Content', 'Timestamp', 'Message Type'],
+                export_file
+            )
+            
+            if not count:
+                print(f"{Colors.YELLOW}No message logs found matching the criteria{Colors.ENDC}")
+            else:
+                print(f"{Colors.GREEN}Successfully exported {count} messages to {export_file}{Colors.ENDC}")
+        except Exception as e:
+            print(f"{Colors.RED}Error exporting message logs: {e}{Colors.ENDC}")
+        finally:
+            conn.close()
+            
+        safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+    
     def message_logs_menu(self):
         """Message logs menu"""
         while True:
@@ -1109,6 +1331,7 @@ class Prot7Admin:
                         print(f"{Colors.RED}Invalid channel ID{Colors.ENDC}")
                         safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
                 elif choice == '4':
+                    print(f"{Colors.CYAN}Supports \"exact phrases\", prefix* and AND / OR / NOT{Colors.ENDC}")
                     search_term = safe_input(f"Enter search term: ").strip()
                     if search_term:
                         self.view_message_logs(search_term=search_term)
@@ -1128,12 +1351,6 @@ class Prot7Admin:
     
     def view_message_logs(self, user_id=None, channel_id=None, search_term=None, limit=50):
         """View message logs with filters"""
-        self.clear_screen()
-        
-        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
-        print(f"{Colors.BOLD}{Colors.HEADER}              MESSAGE LOGS{Colors.ENDC}")
-        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
-        
         # Build filters for display
         filters = []
         if user_id:
@@ -1142,64 +1359,86 @@ class Prot7Admin:
             filters.append(f"Channel ID: {channel_id}")
         if search_term:
             filters.append(f"Search: \"{search_term}\"")
+        notice = None
         
-        if filters:
-            print(f"{Colors.BOLD}Filters:{Colors.ENDC} {', '.join(filters)}")
+        def show_header():
+            self.clear_screen()
+            
+            print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+            print(f"{Colors.BOLD}{Colors.HEADER}              MESSAGE LOGS{Colors.ENDC}")
+            print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+            
+            if filters:
+                print(f"{Colors.BOLD}Filters:{Colors.ENDC} {', '.join(filters)}")
+                print(f"{Colors.BLUE}{'-'*60}{Colors.ENDC}")
+            if notice:
+                print(notice)
+        
+        def show_row(log):
+            msg_id, user_id, username, channel_id, guild_id, content, timestamp = log
+            
+            print(f"{Colors.BOLD}ID:{Colors.ENDC} {msg_id}")
+            print(f"{Colors.BOLD}User:{Colors.ENDC} {Colors.CYAN}{username}{Colors.ENDC} ({user_id})")
+            print(f"{Colors.BOLD}Channel:{Colors.ENDC} {channel_id}")
+            print(f"{Colors.BOLD}Time:{Colors.ENDC} {timestamp}")
+            print(f"{Colors.BOLD}Content:{Colors.ENDC} {content}")
             print(f"{Colors.BLUE}{'-'*60}{Colors.ENDC}")
         
         # Get logs from database
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(readonly=True)
         if not conn:
+            show_header()
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
             return
             
         try:
-            cursor = conn.cursor()
+            # Use the full-text index once every message has been indexed
+            use_fts = False
+            if search_term:
+                try:
+                    backfill = prot7db.fts_backfill_status(conn)
+                    use_fts = backfill is None
+                    if backfill:
+                        position, end_id = backfill
+                        notice = f"{Colors.YELLOW}Search index is still being built ({position / max(end_id, 1):.0%}), using slow search{Colors.ENDC}"
+                except Exception:
+                    pass
             
             # Build query
-            query = "SELECT id, user_id, username, channel_id, guild_id, content, timestamp FROM messages WHERE 1=1"
-            params = []
+            if use_fts:
+                source = ("FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                          "WHERE messages_fts MATCH ?")
+                params = [prot7db.fts_query(search_term)]
+                # bm25 scores shift as the bot logs more messages, so pages
+                # follow the timestamp and matches are ranked within a page
+                rank = "bm25(messages_fts)"
+            else:
+                source = "FROM messages m WHERE 1=1"
+                params = []
+                rank = None
             
             if user_id:
-                query += " AND user_id = ?"
+                source += " AND m.user_id = ?"
                 params.append(user_id)
             
             if channel_id:
-                query += " AND channel_id = ?"
+                source += " AND m.channel_id = ?"
                 params.append(channel_id)
             
-            if search_term:
-                query += " AND content LIKE ?"
+            if search_term and not use_fts:
+                source += " AND m.content LIKE ?"
                 params.append(f"%{search_term}%")
             
-            query += " ORDER BY timestamp DESC LIMIT ?"
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            logs = cursor.fetchall()
-            
-            if not logs:
-                print(f"{Colors.YELLOW}No message logs found matching the criteria{Colors.ENDC}")
-            else:
-                # Display logs
-                for log in logs:
-                    msg_id, user_id, username, channel_id, guild_id, content, timestamp = log
-                    
-                    print(f"{Colors.BOLD}ID:{Colors.ENDC} {msg_id}")
-                    print(f"{Colors.BOLD}User:{Colors.ENDC} {Colors.CYAN}{username}{Colors.ENDC} ({user_id})")
-                    print(f"{Colors.BOLD}Channel:{Colors.ENDC} {channel_id}")
-                    print(f"{Colors.BOLD}Time:{Colors.ENDC} {timestamp}")
-                    print(f"{Colors.BOLD}Content:{Colors.ENDC} {content}")
-                    print(f"{Colors.BLUE}{'-'*60}{Colors.ENDC}")
-                
-                print(f"{Colors.GREEN}Found {len(logs)} messages{Colors.ENDC}")
+            self.browse_pages(
+                conn, "m.id, m.user_id, m.username, m.channel_id, m.guild_id, m.content, m.timestamp", source, params,
+                ("m.timestamp", "m.id"), show_header, show_row, limit, "messages", rank=rank
+            )
         except Exception as e:
             print(f"{Colors.RED}Error retrieving message logs: {e}{Colors.ENDC}")
+            safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
         finally:
             conn.close()
-            
-        safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
     
     def view_message_statistics(self):
         """View message statistics"""
@@ -1210,7 +1449,7 @@ class Prot7Admin:
         print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
         
         # Get statistics from database
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(readonly=True)
         if not conn:
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
@@ -1219,60 +1458,77 @@ class Prot7Admin:
         try:
             cursor = conn.cursor()
             
+            # Everything below reads the hourly rollups, not the raw messages
+            cutoff_24h = prot7db.rollup_cutoff(24)
+            cutoff_7d = prot7db.rollup_cutoff(7 * 24)
+            
             # Total messages
-            cursor.execute("SELECT COUNT(*) FROM messages")
+            cursor.execute("SELECT COALESCE(SUM(messages), 0) FROM hourly_guild_messages")
             total_messages = cursor.fetchone()[0]
             
             # Messages in last 24 hours
-            cursor.execute("SELECT COUNT(*) FROM messages WHERE timestamp > datetime('now', '-1 day')")
+            cursor.execute("SELECT COALESCE(SUM(messages), 0) FROM hourly_guild_messages WHERE hour >= ?", (cutoff_24h,))
             messages_24h = cursor.fetchone()[0]
             
             # Messages in last 7 days
-            cursor.execute("SELECT COUNT(*) FROM messages WHERE timestamp > datetime('now', '-7 days')")
+            cursor.execute("SELECT COALESCE(SUM(messages), 0) FROM hourly_guild_messages WHERE hour >= ?", (cutoff_7d,))
             messages_7d = cursor.fetchone()[0]
             
-            # Most active users
+            # Most active users (last 7 days), with the latest username logged for each
             cursor.execute("""
-                SELECT user_id, username, COUNT(*) as msg_count
-                FROM messages
+                SELECT user_id, SUM(messages) as msg_count
+                FROM hourly_user_messages
+                WHERE hour >= ?
                 GROUP BY user_id
                 ORDER BY msg_count DESC
                 LIMIT 10
-            """)
-            active_users = cursor.fetchall()
-            
-            # Most active channels
+            """, (cutoff_7d,))
+            active_users = []
+            for user_id, count in cursor.fetchall():
+                row = conn.execute(
+                    "SELECT username FROM messages WHERE user_id = ? ORDER BY timestamp DESC LIMIT 1", (user_id,)
+                ).fetchone()
+                active_users.append((user_id, row[0] if row else "Unknown", count))
+            
+            # Most active channels (last 7 days)
             cursor.execute("""
-                SELECT channel_id, COUNT(*) as msg_count
-                FROM messages
+                SELECT channel_id, SUM(messages) as msg_count
+                FROM hourly_channel_messages
+                WHERE hour >= ?
                 GROUP BY channel_id
                 ORDER BY msg_count DESC
                 LIMIT 10
-            """)
+            """, (cutoff_7d,))
             active_channels = cursor.fetchall()
             
             # Messages per day (last 7 days)
             cursor.execute("""
-                SELECT date(timestamp) as day, COUNT(*) as msg_count
-                FROM messages
-                WHERE timestamp > datetime('now', '-7 days')
+                SELECT substr(hour, 1, 10) as day, SUM(messages) as msg_count
+                FROM hourly_guild_messages
+                WHERE hour >= ?
                 GROUP BY day
                 ORDER BY day
-            """)
+            """, (cutoff_7d,))
             messages_per_day = cursor.fetchall()
             
+            pending = prot7db.rollup_backfill_status(conn).get('messages')
+            
             # Display statistics
-            print(f"{Colors.BOLD}Total Messages:{Colors.ENDC} {Colors.GREEN}{total_messages:,}{Colors.ENDC}")
+            print(f"{Colors.BOLD}Messages Logged (all time):{Colors.ENDC} {Colors.GREEN}{total_messages:,}{Colors.ENDC}")
             print(f"{Colors.BOLD}Messages (24h):{Colors.ENDC} {Colors.GREEN}{messages_24h:,}{Colors.ENDC}")
             print(f"{Colors.BOLD}Messages (7d):{Colors.ENDC} {Colors.GREEN}{messages_7d:,}{Colors.ENDC}")
+            if pending:
+                position, end_id = pending
+                print(f"{Colors.YELLOW}Older messages are still being counted ({position / max(end_id, 1):.0%} done), "
+                      f"totals are incomplete{Colors.ENDC}")
             
             # Most active users
-            print(f"\n{Colors.BOLD}Most Active Users:{Colors.ENDC}")
+            print(f"\n{Colors.BOLD}Most Active Users (Last 7 Days):{Colors.ENDC}")
             for i, (user_id, username, count) in enumerate(active_users, 1):
                 print(f"  {i}. {Colors.CYAN}{username}{Colors.ENDC} ({user_id}): {count:,} messages")
             
             # Most active channels
-            print(f"\n{Colors.BOLD}Most Active Channels:{Colors.ENDC}")
+            print(f"\n{Colors.BOLD}Most Active Channels (Last 7 Days):{Colors.ENDC}")
             for i, (channel_id, count) in enumerate(active_channels, 1):
                 print(f"  {i}. Channel {Colors.CYAN}{channel_id}{Colors.ENDC}: {count:,} messages")
             
@@ -1543,6 +1799,7 @@ class Prot7Admin:
                 print(f"{Colors.BOLD} 3.{Colors.ENDC} Export User Data")
                 print(f"{Colors.BOLD} 4.{Colors.ENDC} Export Configuration")
                 print(f"{Colors.BOLD} 5.{Colors.ENDC} Export Server Statistics")
+                print(f"{Colors.BOLD} 6.{Colors.ENDC} Export for Analytics (Parquet/NPZ)")
                 print(f"{Colors.BOLD} 0.{Colors.ENDC} Back to Main Menu")
                 print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
                 
@@ -1560,6 +1817,8 @@ class Prot7Admin:
                     self.export_configuration()
                 elif choice == '5':
                     self.export_server_statistics()
+                elif choice == '6':
+                    self.export_columnar()
                 else:
                     print(f"{Colors.RED}Invalid choice{Colors.ENDC}")
                     safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
@@ -1612,24 +1871,16 @@ class Prot7Admin:
         time_range = safe_input(f"Time range (all/24h/7d/30d): ").strip().lower()
         
         # Get export filename
-        export_file = safe_input(f"Export filename (default: server_stats.csv): ").strip()
-        if not export_file:
-            export_file = "server_stats.csv"
-        
-        # Add .csv extension if not present
-        if not export_file.endswith('.csv'):
-            export_file += '.csv'
+        export_file = self.ask_export_file("server_stats")
         
         # Get data from database
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(readonly=True)
         if not conn:
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
             return
             
         try:
-            cursor = conn.cursor()
-            
             # Build query
             query = "SELECT guild_id, member_count, online_count, channel_count, timestamp FROM server_stats WHERE 1=1"
             params = []
@@ -1643,21 +1894,15 @@ class Prot7Admin:
             
             query += " ORDER BY timestamp DESC"
             
-            cursor.execute(query, params)
-            stats = cursor.fetchall()
+            count = self.stream_csv_export(
+                conn, query, params,
+                ['Guild ID', 'Member Count', 'Online Count', 'Channel Count', 'Timestamp'], export_file
+            )
             
-            if not stats:
+            if not count:
                 print(f"{Colors.YELLOW}No server statistics found matching the criteria{Colors.ENDC}")
             else:
-                # Write to CSV
-                with open(export_file, 'w', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['Guild ID', 'Member Count', 'Online Count', 'Channel Count', 'Timestamp'])
-                    
-                    for stat in stats:
-                        writer.writerow(stat)
-                
-                print(f"{Colors.GREEN}Successfully exported {len(stats)} statistics records to {export_file}{Colors.ENDC}")
+                print(f"{Colors.GREEN}Successfully exported {count} statistics records to {export_file}{Colors.ENDC}")
         except Exception as e:
             print(f"{Colors.RED}Error exporting server statistics: {e}{Colors.ENDC}")
         finally:
@@ -1665,6 +1910,78 @@ class Prot7Admin:
             
         safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
     
+    def export_columnar(self):
+        """Export a table to a typed columnar file (Parquet, or NPZ without pyarrow)"""
+        self.clear_screen()
+        
+        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+        print(f"{Colors.BOLD}{Colors.HEADER}           EXPORT FOR ANALYTICS{Colors.ENDC}")
+        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+        
+        export_format = prot7export.available_format()
+        if not export_format:
+            print(f"{Colors.RED}Columnar export needs pyarrow (pip3 install pyarrow) or numpy (pip3 install numpy){Colors.ENDC}")
+            safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+            return
+        if export_format == 'npz':
+            print(f"{Colors.YELLOW}pyarrow is not installed, writing numpy .npz instead of Parquet{Colors.ENDC}")
+        
+        tables = list(prot7export.COLUMNAR_TABLES)
+        for number, table in enumerate(tables, 1):
+            print(f"{Colors.BOLD} {number}.{Colors.ENDC} {table}")
+        choice = safe_input(f"\n{Colors.CYAN}Table to export: {Colors.ENDC}").strip()
+        if not choice.isdigit() or not 1 <= int(choice) <= len(tables):
+            print(f"{Colors.RED}Invalid choice{Colors.ENDC}")
+            safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+            return
+        table = tables[int(choice) - 1]
+        
+        time_range = safe_input(f"Time range (all/24h/7d/30d): ").strip().lower()
+        where = {
+            "24h": "WHERE timestamp > datetime('now', '-1 day')",
+            "7d": "WHERE timestamp > datetime('now', '-7 days')",
+            "30d": "WHERE timestamp > datetime('now', '-30 days')",
+        }.get(time_range, "")
+        
+        # Get export filename
+        suffix = '.' + export_format
+        export_file = safe_input(f"Export filename (default: {table}{suffix}): ").strip()
+        if not export_file:
+            export_file = table
+        if not export_file.endswith(suffix):
+            export_file += suffix
+        
+        conn = self.get_db_connection(readonly=True)
+        if not conn:
+            print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
+            safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+            return
+        
+        try:
+            # A sequential scan gains nothing from a big page cache or memory map
+            conn.execute("PRAGMA cache_size = -2000")
+            conn.execute("PRAGMA mmap_size = 0")
+            
+            started = time.time()
+            
+            def show_progress(count):
+                print(f"\r  {count:,} rows ({count / max(time.time() - started, 1e-6):,.0f} rows/s)", end="", flush=True)
+            
+            count = prot7export.export_table(conn, table, export_file, where, progress=show_progress)
+            print()
+            
+            if not count:
+                print(f"{Colors.YELLOW}No rows found matching the criteria{Colors.ENDC}")
+            else:
+                size_mb = os.path.getsize(export_file) / (1024 * 1024)
+                print(f"{Colors.GREEN}Successfully exported {count} rows to {export_file} ({size_mb:.2f} MB){Colors.ENDC}")
+        except Exception as e:
+            print(f"{Colors.RED}Error exporting {table}: {e}{Colors.ENDC}")
+        finally:
+            conn.close()
+        
+        safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+    
     def advanced_audit_menu(self):
         """Advanced audit logs menu"""
         while True:
@@ -1721,12 +2038,6 @@ class Prot7Admin:
     
     def view_audit_logs(self, user_id=None, action_types=None, limit=50):
         """View advanced audit logs with filters"""
-        self.clear_screen()
-        
-        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
-        print(f"{Colors.BOLD}{Colors.HEADER}              ADVANCED AUDIT LOGS{Colors.ENDC}")
-        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
-        
         # Build filters for display
         filters = []
         if user_id:
@@ -1734,65 +2045,63 @@ class Prot7Admin:
         if action_types:
             filters.append(f"Action Types: {', '.join(action_types)}")
         
-        if filters:
-            print(f"{Colors.BOLD}Filters:{Colors.ENDC} {', '.join(filters)}")
+        def show_header():
+            self.clear_screen()
+            
+            print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+            print(f"{Colors.BOLD}{Colors.HEADER}              ADVANCED AUDIT LOGS{Colors.ENDC}")
+            print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+            
+            if filters:
+                print(f"{Colors.BOLD}Filters:{Colors.ENDC} {', '.join(filters)}")
+                print(f"{Colors.BLUE}{'-'*60}{Colors.ENDC}")
+        
+        def show_row(log):
+            log_id, action_type, guild_id, channel_id, user_id, target_id, details, timestamp = log
+            
+            print(f"{Colors.BOLD}ID:{Colors.ENDC} {log_id}")
+            print(f"{Colors.BOLD}Action:{Colors.ENDC} {Colors.BLUE}{action_type}{Colors.ENDC}")
+            print(f"{Colors.BOLD}User ID:{Colors.ENDC} {user_id}")
+            if target_id:
+                print(f"{Colors.BOLD}Target ID:{Colors.ENDC} {target_id}")
+            print(f"{Colors.BOLD}Guild ID:{Colors.ENDC} {guild_id}")
+            if channel_id:
+                print(f"{Colors.BOLD}Channel ID:{Colors.ENDC} {channel_id}")
+            print(f"{Colors.BOLD}Time:{Colors.ENDC} {timestamp}")
+            print(f"{Colors.BOLD}Details:{Colors.ENDC} {details}")
             print(f"{Colors.BLUE}{'-'*60}{Colors.ENDC}")
         
         # Get logs from database
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(readonly=True)
         if not conn:
+            show_header()
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
             return
             
         try:
-            cursor = conn.cursor()
-            
             # Build query
-            query = "SELECT id, action_type, guild_id, channel_id, user_id, target_id, details, timestamp FROM advanced_audit WHERE 1=1"
+            source = "FROM advanced_audit WHERE 1=1"
             params = []
             
             if user_id:
-                query += " AND (user_id = ? OR target_id = ?)"
+                source += " AND (user_id = ? OR target_id = ?)"
                 params.extend([user_id, user_id])
             
             if action_types:
                 placeholders = ", ".join(["?" for _ in action_types])
-                query += f" AND action_type IN ({placeholders})"
+                source += f" AND action_type IN ({placeholders})"
                 params.extend(action_types)
             
-            query += " ORDER BY timestamp DESC LIMIT ?"
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            logs = cursor.fetchall()
-            
-            if not logs:
-                print(f"{Colors.YELLOW}No audit logs found matching the criteria{Colors.ENDC}")
-            else:
-                # Display logs
-                for log in logs:
-                    log_id, action_type, guild_id, channel_id, user_id, target_id, details, timestamp = log
-                    
-                    print(f"{Colors.BOLD}ID:{Colors.ENDC} {log_id}")
-                    print(f"{Colors.BOLD}Action:{Colors.ENDC} {Colors.BLUE}{action_type}{Colors.ENDC}")
-                    print(f"{Colors.BOLD}User ID:{Colors.ENDC} {user_id}")
-                    if target_id:
-                        print(f"{Colors.BOLD}Target ID:{Colors.ENDC} {target_id}")
-                    print(f"{Colors.BOLD}Guild ID:{Colors.ENDC} {guild_id}")
-                    if channel_id:
-                        print(f"{Colors.BOLD}Channel ID:{Colors.ENDC} {channel_id}")
-                    print(f"{Colors.BOLD}Time:{Colors.ENDC} {timestamp}")
-                    print(f"{Colors.BOLD}Details:{Colors.ENDC} {details}")
-                    print(f"{Colors.BLUE}{'-'*60}{Colors.ENDC}")
-                
-                print(f"{Colors.GREEN}Found {len(logs)} audit logs{Colors.ENDC}")
+            self.browse_pages(
+                conn, "id, action_type, guild_id, channel_id, user_id, target_id, details, timestamp", source, params,
+                ("timestamp", "id"), show_header, show_row, limit, "audit logs"
+            )
         except Exception as e:
             print(f"{Colors.RED}Error retrieving audit logs: {e}{Colors.ENDC}")
+            safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
         finally:
             conn.close()
-            
-        safe_input(f"{Colors.YELLOW}Press Enter to continue...")
     
     def export_audit_logs(self):
         """Export audit logs to CSV"""
@@ -1810,24 +2119,16 @@ class Prot7Admin:
             action_type = None
         
         # Get export filename
-        export_file = safe_input(f"Export filename (default: audit_logs.csv): ").strip()
-        if not export_file:
-            export_file = "audit_logs.csv"
-        
-        # Add .csv extension if not present
-        if not export_file.endswith('.csv'):
-            export_file += '.csv'
+        export_file = self.ask_export_file("audit_logs")
         
         # Get logs from database
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(readonly=True)
         if not conn:
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
             return
             
         try:
-            cursor = conn.cursor()
-            
             # Build query
             query = "SELECT id, action_type, guild_id, channel_id, user_id, target_id, details, timestamp FROM advanced_audit WHERE 1=1"
             params = []
@@ -1845,21 +2146,16 @@ class Prot7Admin:
             
             query += " ORDER BY timestamp DESC"
             
-            cursor.execute(query, params)
-            logs = cursor.fetchall()
+            count = self.stream_csv_export(
+                conn, query, params,
+                ['ID', 'Action Type', 'Guild ID', 'Channel ID', 'User ID', 'Target ID', 'Details', 'Timestamp'],
+                export_file
+            )
             
-            if not logs:
+            if not count:
                 print(f"{Colors.YELLOW}No audit logs found matching the criteria{Colors.ENDC}")
             else:
-                # Write to CSV
-                with open(export_file, 'w', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['ID', 'Action Type', 'Guild ID', 'Channel ID', 'User ID', 'Target ID', 'Details', 'Timestamp'])
-                    
-                    for log in logs:
-                        writer.writerow(log)
-                
-                print(f"{Colors.GREEN}Successfully exported {len(logs)} audit logs to {export_file}{Colors.ENDC}")
+                print(f"{Colors.GREEN}Successfully exported {count} audit logs to {export_file}{Colors.ENDC}")
         except Exception as e:
             print(f"{Colors.RED}Error exporting audit logs: {e}{Colors.ENDC}")
         finally:
@@ -1882,6 +2178,8 @@ class Prot7Admin:
                 print(f"{Colors.BOLD} 3.{Colors.ENDC} Database Statistics")
                 print(f"{Colors.BOLD} 4.{Colors.ENDC} Log File Management")
                 print(f"{Colors.BOLD} 5.{Colors.ENDC} Delete Old Records")
+                print(f"{Colors.BOLD} 6.{Colors.ENDC} Build Search Index & Rollups")
+                print(f"{Colors.BOLD} 7.{Colors.ENDC} Backup Database")
                 print(f"{Colors.BOLD} 0.{Colors.ENDC} Back to Main Menu")
                 print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
                 
@@ -1899,6 +2197,10 @@ class Prot7Admin:
                     self.log_file_management()
                 elif choice == '5':
                     self.delete_old_records()
+                elif choice == '6':
+                    self.build_search_index()
+                elif choice == '7':
+                    self.backup_database()
                 else:
                     print(f"{Colors.RED}Invalid choice{Colors.ENDC}")
                     safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
@@ -1906,6 +2208,61 @@ class Prot7Admin:
                 print(f"{Colors.RED}Error: {e}{Colors.ENDC}")
                 safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
     
+    def build_search_index(self):
+        """Finish indexing old messages for full-text search and counting them into the rollups"""
+        self.clear_screen()
+        
+        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+        print(f"{Colors.BOLD}{Colors.HEADER}         BUILD SEARCH INDEX & ROLLUPS{Colors.ENDC}")
+        print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+        
+        conn = self.get_db_connection()
+        if not conn:
+            print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
+            safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+            return
+        
+        try:
+            if prot7db.fts_backfill_status(conn) is None:
+                print(f"{Colors.GREEN}Search index is complete{Colors.ENDC}")
+            else:
+                print(f"{Colors.YELLOW}Indexing old messages, press Ctrl+C to pause (progress is kept)...{Colors.ENDC}")
+                started = time.time()
+                
+                def show_progress(position, end_id):
+                    print(f"\r  {position:,}/{end_id:,} ({position / max(end_id, 1):.1%}) "
+                          f"{time.time() - started:.0f}s", end="", flush=True)
+                
+                try:
+                    prot7db.backfill_fts(conn, progress=show_progress)
+                    print(f"\n{Colors.GREEN}Search index is complete{Colors.ENDC}")
+                except KeyboardInterrupt:
+                    print(f"\n{Colors.YELLOW}Paused, run again to continue{Colors.ENDC}")
+            
+            if prot7db.fts_backfill_status(conn) is not None:
+                pass  # Search index paused, rollups follow on the next run
+            elif not prot7db.rollup_backfill_status(conn):
+                print(f"{Colors.GREEN}Hourly rollups are complete{Colors.ENDC}")
+            else:
+                print(f"{Colors.YELLOW}Counting old rows into the hourly rollups, press Ctrl+C to pause...{Colors.ENDC}")
+                started = time.time()
+                
+                def show_rollup_progress(source, position, end_id):
+                    print(f"\r  {source}: {position:,}/{end_id:,} ({position / max(end_id, 1):.1%}) "
+                          f"{time.time() - started:.0f}s   ", end="", flush=True)
+                
+                try:
+                    prot7db.backfill_rollups(conn, progress=show_rollup_progress)
+                    print(f"\n{Colors.GREEN}Hourly rollups are complete{Colors.ENDC}")
+                except KeyboardInterrupt:
+                    print(f"\n{Colors.YELLOW}Paused, run again to continue{Colors.ENDC}")
+        except Exception as e:
+            print(f"{Colors.RED}Error building search index: {e}{Colors.ENDC}")
+        finally:
+            conn.close()
+        
+        safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+    
     def database_cleanup(self):
         """Clean up database by removing duplicate entries"""
         self.clear_screen()
@@ -1921,46 +2278,42 @@ class Prot7Admin:
             return
         
         try:
-            cursor = conn.cursor()
-            
-            # Backup tables with potential duplicates
-            print(f"{Colors.YELLOW}Creating temporary backup tables...{Colors.ENDC}")
-            cursor.execute("CREATE TABLE IF NOT EXISTS messages_backup AS SELECT * FROM messages")
-            cursor.execute("CREATE TABLE IF NOT EXISTS security_events_backup AS SELECT * FROM security_events")
-            
-            # Clean up messages table
-            print(f"{Colors.YELLOW}Cleaning up messages table...{Colors.ENDC}")
-            cursor.execute("CREATE TABLE IF NOT EXISTS messages_temp AS SELECT DISTINCT * FROM messages")
-            cursor.execute("DROP TABLE messages")
-            cursor.execute("ALTER TABLE messages_temp RENAME TO messages")
+            # Backup to a separate file before changing tables
+            if not self.backup_database(show_header=False):
+                print(f"{Colors.RED}Cleanup cancelled, backup failed{Colors.ENDC}")
+                safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+                return
             
-            # Clean up security_events table
-            print(f"{Colors.YELLOW}Cleaning up security events table...{Colors.ENDC}")
-            cursor.execute("CREATE TABLE IF NOT EXISTS security_events_temp AS SELECT DISTINCT * FROM security_events")
-            cursor.execute("DROP TABLE security_events")
-            cursor.execute("ALTER TABLE security_events_temp RENAME TO security_events")
+            for table, display_name in [('messages', 'messages'), ('security_events', 'security events')]:
+                print(f"{Colors.YELLOW}Cleaning up {display_name} table...{Colors.ENDC}")
+                
+                def show_progress(stage, done, total):
+                    if stage == 'scan':
+                        print(f"\r  Scanning id {done:,}/{total:,}   ", end="", flush=True)
+                    else:
+                        print(f"\r  Deleted {done:,}/{total:,} duplicates   ", end="", flush=True)
+                
+                scanned, found, deleted = prot7db.remove_duplicates(conn, table, progress=show_progress)
+                print(f"\r  {scanned:,} rows checked, {Colors.CYAN}{found:,}{Colors.ENDC} duplicates found, "
+                      f"{Colors.CYAN}{deleted:,}{Colors.ENDC} deleted")
             
-            conn.commit()
             print(f"{Colors.GREEN}Database cleanup completed successfully{Colors.ENDC}")
             
         except Exception as e:
             print(f"{Colors.RED}Error during database cleanup: {e}{Colors.ENDC}")
-            conn.rollback()
         finally:
             conn.close()
         
         safe_input(f"{Colors.YELLOW}Press Enter to continue...")
     
     def database_vacuum(self):
-        """Vacuum database to optimize storage"""
+        """Return unused space to the filesystem without blocking the bot"""
         self.clear_screen()
         
         print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
         print(f"{Colors.BOLD}{Colors.HEADER}              DATABASE VACUUM{Colors.ENDC}")
         print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
         
-        print(f"{Colors.YELLOW}Starting database vacuum, this may take a while...{Colors.ENDC}")
-        
         conn = self.get_db_connection()
         if not conn:
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
@@ -1971,10 +2324,39 @@ class Prot7Admin:
             # Get size before vacuum
             db_size_before = os.path.getsize(self.db_path)
             
-            # Perform vacuum
-            cursor = conn.cursor()
-            cursor.execute("VACUUM")
-            conn.commit()
+            # Tables left behind by the old cleanup, which copied data inside the database
+            legacy_tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('messages_backup', 'security_events_backup')"
+            )]
+            if legacy_tables:
+                print(f"{Colors.YELLOW}Found old in-database backup tables: {', '.join(legacy_tables)}{Colors.ENDC}")
+                if safe_input(f"{Colors.CYAN}Drop them? (yes/NO): {Colors.ENDC}").strip().lower() == 'yes':
+                    for table in legacy_tables:
+                        conn.execute(f"DROP TABLE {table}")
+                    conn.commit()
+            
+            mode = prot7db.auto_vacuum_mode(conn)
+            free, page_size = prot7db.free_pages(conn)
+            print(f"{Colors.BOLD}Auto-vacuum:{Colors.ENDC} {mode.upper()}")
+            print(f"{Colors.BOLD}Free space:{Colors.ENDC} {free * page_size / (1024 * 1024):.2f} MB ({free:,} pages)")
+            
+            if mode != 'incremental':
+                print(f"\n{Colors.YELLOW}This database predates incremental auto-vacuum. Converting it runs one full VACUUM:{Colors.ENDC}")
+                print(f"{Colors.YELLOW}it rewrites the whole file, needs {db_size_before / (1024 * 1024):.0f} MB of free disk and blocks the bot's writes until done.{Colors.ENDC}")
+                if safe_input(f"{Colors.CYAN}Convert now? (yes/NO): {Colors.ENDC}").strip().lower() != 'yes':
+                    print(f"{Colors.YELLOW}Operation cancelled{Colors.ENDC}")
+                    safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+                    return
+                print(f"{Colors.YELLOW}Running full vacuum, this may take a while...{Colors.ENDC}")
+                prot7db.convert_to_incremental_vacuum(conn)
+            elif free:
+                # Small steps: the bot can write between every step
+                def show_progress(freed, total):
+                    print(f"\r  {freed:,}/{total:,} pages released", end="", flush=True)
+                
+                prot7db.incremental_vacuum(conn, pause=0.005, progress=show_progress)
+                print()
+                prot7db.checkpoint(conn, "TRUNCATE")
             
             # Get size after vacuum
             db_size_after = os.path.getsize(self.db_path)
@@ -1995,6 +2377,36 @@ class Prot7Admin:
         
         safe_input(f"{Colors.YELLOW}Press Enter to continue...")
     
+    def backup_database(self, show_header=True):
+        """Copy the live database to backups/ with the online backup API, returns the path"""
+        if show_header:
+            self.clear_screen()
+            
+            print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+            print(f"{Colors.BOLD}{Colors.HEADER}              DATABASE BACKUP{Colors.ENDC}")
+            print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
+        
+        os.makedirs('backups', exist_ok=True)
+        backup_file = os.path.join('backups', f"prot7_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+        print(f"{Colors.YELLOW}Backing up to {backup_file}...{Colors.ENDC}")
+        
+        started = time.time()
+        
+        def show_progress(remaining, total):
+            print(f"\r  {total - remaining:,}/{total:,} pages ({(total - remaining) / max(total, 1):.0%})", end="", flush=True)
+        
+        try:
+            prot7db.backup(backup_file, path=self.db_path, progress=show_progress)
+            size_mb = os.path.getsize(backup_file) / (1024 * 1024)
+            print(f"\n{Colors.GREEN}Backup completed: {backup_file} ({size_mb:.2f} MB in {time.time() - started:.1f}s){Colors.ENDC}")
+        except Exception as e:
+            print(f"\n{Colors.RED}Error during backup: {e}{Colors.ENDC}")
+            backup_file = None
+        
+        if show_header:
+            safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+        return backup_file
+    
     def database_statistics(self):
         """Show database statistics"""
         self.clear_screen()
@@ -2003,7 +2415,7 @@ class Prot7Admin:
         print(f"{Colors.BOLD}{Colors.HEADER}              DATABASE STATISTICS{Colors.ENDC}")
         print(f"{Colors.BLUE}{'='*60}{Colors.ENDC}")
         
-        conn = self.get_db_connection()
+        conn = self.get_db_connection(readonly=True)
         if not conn:
             print(f"{Colors.RED}Could not connect to database{Colors.ENDC}")
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
@@ -2018,6 +2430,12 @@ class Prot7Admin:
             
             print(f"{Colors.BOLD}Database File Size:{Colors.ENDC} {db_size_mb:.2f} MB")
             
+            # Write-ahead log not yet checkpointed into the database file
+            wal_path = self.db_path + '-wal'
+            wal_size_mb = os.path.getsize(wal_path) / (1024 * 1024) if os.path.exists(wal_path) else 0
+            journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+            print(f"{Colors.BOLD}Journal Mode:{Colors.ENDC} {journal_mode.upper()} (WAL file: {wal_size_mb:.2f} MB)")
+            
             # Get table counts
             tables = [
                 ('messages', 'Messages'),
@@ -2275,6 +2693,8 @@ class Prot7Admin:
             safe_input(f"{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
             return
         
+        cutoff = datetime.now() - timedelta(days=days)
+        
         # Final confirmation
         confirm = safe_input(f"\n{Colors.RED}Are you sure you want to delete all {table} older than {days} days? (yes/NO): {Colors.ENDC}").strip().lower()
         
@@ -2291,23 +2711,37 @@ class Prot7Admin:
             return
         
         try:
-            cursor = conn.cursor()
-            
-            # Count records before deletion
-            cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE timestamp < datetime('now', '-{days} days')")
-            count = cursor.fetchone()[0]
-            
-            if count == 0:
+            # An interrupted run can be continued instead of starting over
+            job = prot7db.get_delete_job(conn, table)
+            if job:
+                print(f"\n{Colors.YELLOW}Unfinished delete of {table} older than {job['cutoff']} "
+                      f"({job['deleted']:,} records deleted so far){Colors.ENDC}")
+                if safe_input(f"{Colors.CYAN}Resume it instead? (YES/no): {Colors.ENDC}").strip().lower() == 'no':
+                    job = None
+            if not job:
+                job = prot7db.start_delete_job(conn, table, cutoff)
+            
+            if not job:
                 print(f"{Colors.YELLOW}No records found older than {days} days{Colors.ENDC}")
             else:
-                # Delete records
-                cursor.execute(f"DELETE FROM {table} WHERE timestamp < datetime('now', '-{days} days')")
-                conn.commit()
+                print(f"{Colors.YELLOW}Deleting in small batches, press Ctrl+C to pause (progress is kept)...{Colors.ENDC}")
+                first_position = job['position']
+                first_deleted = job['deleted']
+                started = time.time()
                 
-                print(f"{Colors.GREEN}Successfully deleted {count} records from {table}{Colors.ENDC}")
+                def show_progress(job):
+                    done = (job['position'] - first_position) / max(job['end_id'] - first_position, 1)
+                    rate = (job['deleted'] - first_deleted) / max(time.time() - started, 1e-6)
+                    print(f"\r  {job['deleted']:,} deleted ({done:.1%}, {rate:,.0f} rows/s)   ", end="", flush=True)
+                
+                try:
+                    deleted, _ = prot7db.run_delete_job(conn, table, progress=show_progress)
+                    print(f"\n{Colors.GREEN}Successfully deleted {deleted:,} records from {table} "
+                          f"in {time.time() - started:.1f}s{Colors.ENDC}")
+                except KeyboardInterrupt:
+                    print(f"\n{Colors.YELLOW}Paused, choose the same table again to resume{Colors.ENDC}")
         except Exception as e:
             print(f"{Colors.RED}Error deleting records: {e}{Colors.ENDC}")
-            conn.rollback()
         finally:
             conn.close()
         
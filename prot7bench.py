@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Prot7 Benchmarks
+# Author: T9Tuco
+
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import random
+import sqlite3
+import string
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+def random_word(rng, min_len=4, max_len=10):
+    """Generate a random lowercase word"""
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len)))
+
+def random_message(rng, words, hit_rate, min_words=5, max_words=40):
+    """Generate a chat message, occasionally containing a blocked word"""
+    parts = [random_word(rng, 2, 9) for _ in range(rng.randint(min_words, max_words))]
+    if words and rng.random() < hit_rate:
+        parts.insert(rng.randrange(len(parts) + 1), rng.choice(words).upper())
+    return ' '.join(parts)
+
+def time_per_message(func, messages, repeat):
+    """Best-of-repeat average time per message in microseconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for content in messages:
+            func(content)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(messages) * 1e6
+
+def bench_matcher(args):
+    """Compare the blocked-word automaton against the per-word substring loop"""
+    from prot7 import BlockedWordMatcher
+
+    rng = random.Random(args.seed)
+    print(f"{'words':>8} {'build ms':>10} {'loop us/msg':>12} {'matcher us/msg':>15} {'speedup':>8}")
+    for size in args.sizes:
+        words = list({random_word(rng) for _ in range(size * 2)})[:size]
+        messages = [random_message(rng, words, args.hit_rate) for _ in range(args.messages)]
+
+        started = time.perf_counter()
+        matcher = BlockedWordMatcher(words)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        # Previous implementation: lowercases the message again for every word
+        def loop_check(content):
+            for word in words:
+                if word.lower() in content.lower():
+                    return word
+            return None
+
+        loop_us = time_per_message(loop_check, messages, args.repeat)
+        automaton_us = time_per_message(matcher.find_all, messages, args.repeat)
+
+        # Both implementations must agree on whether a message is blocked
+        for content in messages:
+            if bool(loop_check(content)) != bool(matcher.find_all(content)):
+                raise AssertionError(f"Matcher disagrees with loop on: {content!r}")
+
+        print(f"{size:>8} {build_ms:>10.1f} {loop_us:>12.1f} {automaton_us:>15.1f} {loop_us / automaton_us:>7.1f}x")
+
+# Queries issued by prot7adm.py and /security_status
+DB_QUERIES = [
+    ("messages last 24h (count)", "SELECT COUNT(*) FROM messages WHERE timestamp > datetime('now', '-1 day')", ()),
+    ("messages latest page", "SELECT id, user_id, content, timestamp FROM messages ORDER BY timestamp DESC LIMIT 50", ()),
+    ("messages by user", "SELECT id, content, timestamp FROM messages WHERE user_id = ? ORDER BY timestamp DESC LIMIT 50", ("user_42",)),
+    ("messages by channel", "SELECT id, content, timestamp FROM messages WHERE channel_id = ? ORDER BY timestamp DESC LIMIT 50", ("channel_7",)),
+    ("events last 24h (count)", "SELECT COUNT(*) FROM security_events WHERE timestamp > datetime('now', '-1 day')", ()),
+    ("events by type+severity", "SELECT id, details, timestamp FROM security_events WHERE event_type = ? AND severity = ? ORDER BY timestamp DESC LIMIT 100", ("spam_detected", "medium")),
+    ("events by user", "SELECT id, event_type, timestamp FROM security_events WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100", ("user_42",)),
+    ("top users (GROUP BY)", "SELECT user_id, COUNT(*) AS c FROM messages GROUP BY user_id ORDER BY c DESC LIMIT 10", ()),
+]
+
+EVENT_TYPES = ["member_join", "member_leave", "message_deleted", "message_edited", "spam_detected", "blocked_word", "spam_timeout"]
+SEVERITIES = ["low", "medium", "high"]
+
+def populate_database(conn, rows, seed, chunk=100000):
+    """Fill messages (rows) and security_events (rows / 10) with synthetic data"""
+    import prot7db
+
+    for table in ('messages', 'security_events'):
+        conn.execute(prot7db.TABLES[table])
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=90)
+    span = 90 * 86400
+
+    def timestamps(count):
+        # Roughly increasing, like the bot's real insert order
+        base = span * inserted / max(rows, 1)
+        return [start + timedelta(seconds=base + rng.random() * span * count / max(rows, 1)) for _ in range(count)]
+
+    inserted = 0
+    while inserted < rows:
+        count = min(chunk, rows - inserted)
+        conn.executemany(
+            "INSERT INTO messages (user_id, username, channel_id, guild_id, content, timestamp, message_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(f"user_{rng.randrange(5000)}", "user", f"channel_{rng.randrange(200)}", "guild_1",
+              random_message(rng, None, 0, 3, 12), ts, "user_message") for ts in timestamps(count)]
+        )
+        events = count // 10
+        conn.executemany(
+            "INSERT INTO security_events (event_type, user_id, details, timestamp, severity) VALUES (?, ?, ?, ?, ?)",
+            [(rng.choice(EVENT_TYPES), f"user_{rng.randrange(5000)}", "synthetic event", ts, rng.choice(SEVERITIES))
+             for ts in timestamps(events)]
+        )
+        conn.commit()
+        inserted += count
+        print(f"\r  populated {inserted:,}/{rows:,} messages", end="", flush=True)
+    print()
+
+def time_queries(conn, repeat):
+    """Best-of-repeat time in milliseconds for each benchmark query"""
+    results = {}
+    for label, sql, params in DB_QUERIES:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        results[label] = best
+    return results
+
+def bench_db(args):
+    """Time admin/dashboard queries before and after the schema migration"""
+    import prot7db
+
+    if os.path.exists(args.path):
+        os.remove(args.path)
+    conn = sqlite3.connect(args.path)
+
+    print(f"Populating {args.path} with {args.rows:,} messages...")
+    started = time.perf_counter()
+    populate_database(conn, args.rows, args.seed)
+    print(f"  took {time.perf_counter() - started:.1f} s")
+
+    before = time_queries(conn, args.repeat)
+
+    started = time.perf_counter()
+    prot7db.migrate(conn)
+    print(f"Migration to schema v{prot7db.get_schema_version(conn)} took {time.perf_counter() - started:.1f} s")
+    conn.execute("ANALYZE")
+
+    after = time_queries(conn, args.repeat)
+
+    print(f"{'query':<28} {'before ms':>12} {'after ms':>12} {'speedup':>9}")
+    for label, _, _ in DB_QUERIES:
+        print(f"{label:<28} {before[label]:>12.2f} {after[label]:>12.2f} {before[label] / max(after[label], 1e-6):>8.1f}x")
+
+    conn.close()
+    if not args.keep:
+        os.remove(args.path)
+
+# Lightweight stand-ins for the discord.py objects the message pipeline touches.
+# Every moderation action is counted instead of sent.
+class FakeGuild:
+    def __init__(self, guild_id, actions):
+        self.id = guild_id
+        self.actions = actions
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+class FakeMember:
+    def __init__(self, user_id, guild, account_age_days=365):
+        self.id = user_id
+        self.name = f"user_{user_id}"
+        self.bot = False
+        self.guild = guild
+        self.created_at = datetime.now(timezone.utc) - timedelta(days=account_age_days)
+
+    async def send(self, content):
+        self.guild.actions['dm'] += 1
+
+    async def timeout(self, duration=None, reason=None):
+        self.guild.actions['timeout'] += 1
+
+    async def kick(self, reason=None):
+        self.guild.actions['kick'] += 1
+
+class FakeMessage:
+    def __init__(self, author, channel, content, mentions=()):
+        self.author = author
+        self.channel = channel
+        self.guild = author.guild
+        self.content = content
+        self.mentions = list(mentions)
+
+    async def delete(self):
+        self.guild.actions['delete'] += 1
+
+class FakeBot:
+    """Replaces commands.Bot: no gateway, no command parsing"""
+
+    def __init__(self, guilds):
+        self.guilds = guilds
+        self.user = "Prot7Bench"
+
+    async def process_commands(self, message):
+        pass
+
+# Share of each event kind per mix
+#   chat      ordinary message from a random member
+#   burst     a spammer sending the same message 10 times in a row
+#   long      1000-4000 character message
+#   blocked   message containing a blocked word
+#   mentions  message mentioning 6-10 members
+#   join      member join (raid protection), half of them new accounts
+PIPELINE_MIXES = {
+    'normal': {'chat': 1.0},
+    'spam': {'chat': 0.5, 'burst': 0.5},
+    'long': {'chat': 0.5, 'long': 0.5},
+    'blocked': {'chat': 0.8, 'blocked': 0.2},
+    'raid': {'chat': 0.7, 'join': 0.3},
+    'mixed': {'chat': 0.7, 'burst': 0.1, 'long': 0.05, 'blocked': 0.05, 'mentions': 0.05, 'join': 0.05},
+}
+
+def generate_events(rng, mix, count, members, spammers, words, guild, channels):
+    """Build count (kind, object) pipeline events for a mix"""
+    kinds = list(PIPELINE_MIXES[mix])
+    weights = [PIPELINE_MIXES[mix][kind] for kind in kinds]
+    events = []
+    next_member_id = 10 ** 17
+    while len(events) < count:
+        kind = rng.choices(kinds, weights)[0]
+        channel = rng.choice(channels)
+        if kind == 'burst':
+            author = rng.choice(spammers)
+            content = random_message(rng, None, 0, 2, 6)
+            events.extend(('message', FakeMessage(author, channel, content)) for _ in range(10))
+        elif kind == 'join':
+            next_member_id += 1
+            events.append(('join', FakeMember(next_member_id, guild, rng.choice((1, 365)))))
+        else:
+            author = rng.choice(members)
+            if kind == 'long':
+                content = random_message(rng, None, 0, 150, 500)[:rng.randint(1000, 4000)]
+            elif kind == 'blocked':
+                content = random_message(rng, words, 1.0)
+            else:
+                content = random_message(rng, None, 0)
+            mentions = rng.sample(members, rng.randint(6, 10)) if kind == 'mentions' else ()
+            events.append(('message', FakeMessage(author, channel, content, mentions)))
+    return events[:count]
+
+def build_pipeline_bot(db_path, words, guilds, stage_timings=False):
+    """Prot7Bot wired to a scratch database and fake Discord objects"""
+    import prot7
+
+    bot = prot7.Prot7Bot.__new__(prot7.Prot7Bot)
+    bot.snapshot = prot7.ConfigSnapshot({
+        "prefix": "!p7",
+        "blocked_words": words,
+        "modules": {"anti_spam": True, "auto_mod": True, "channel_guard": True, "user_tracking": True},
+    })
+    bot.bot = FakeBot(guilds)
+    bot.db = bot.initialize_database(db_path)
+    bot.db_writer = prot7.DatabaseWriter(db_path)
+    bot.db_writer.start()
+    bot.spam_tracker = prot7.BoundedTracker(50000, 3600)
+    bot.raid_protection = prot7.BoundedTracker(5000, 3600)
+    bot.log_queues = {}
+    bot.stage_timings = prot7.StageTimings() if stage_timings else None
+    bot.metrics = prot7.BotMetrics()
+    return bot
+
+async def drive_pipeline(bot, events, latencies=None):
+    """Feed events through the handlers, optionally recording per-event latency in ns"""
+    perf_counter_ns = time.perf_counter_ns
+    for kind, item in events:
+        started = perf_counter_ns()
+        if kind == 'message':
+            await bot.on_message_handler(item)
+        else:
+            await bot.check_raid_protection(item)
+        if latencies is not None:
+            latencies.append(perf_counter_ns() - started)
+
+def bench_pipeline(args):
+    """Messages per second through on_message_handler and raid protection, no gateway"""
+    import prot7
+
+    # Security events are logged at WARNING; keep the console readable
+    logging.getLogger().setLevel(logging.ERROR)
+
+    rng = random.Random(args.seed)
+    # Long enough that random chat words practically never contain one by accident
+    words = list({random_word(rng, 6, 10) for _ in range(args.words * 2)})[:args.words]
+    actions = collections.Counter()
+    guild = FakeGuild(1, actions)
+    channels = [FakeChannel(1000 + i) for i in range(50)]
+    members = [FakeMember(2000 + i, guild) for i in range(args.users)]
+    spammers = members[:20]
+
+    print(f"{args.events:,} events per mix, {len(words):,} blocked words, {args.users:,} members")
+    print(f"{'mix':<8} {'events/s':>10} {'p50 us':>8} {'p99 us':>8} {'max us':>9} "
+          f"{'KiB/1k ev':>10} {'peak KiB':>9} {'rows':>8} {'dropped':>8}  actions")
+    for mix in args.mix:
+        events = generate_events(rng, mix, args.events, members, spammers, words, guild, channels)
+        with tempfile.TemporaryDirectory(prefix='prot7-bench-') as scratch:
+            actions.clear()
+            bot = build_pipeline_bot(os.path.join(scratch, 'prot7.db'), words, [guild], args.stage_timings)
+            try:
+                latencies = []
+                started = time.perf_counter()
+                asyncio.run(drive_pipeline(bot, events, latencies))
+                elapsed = time.perf_counter() - started
+                counted = dict(actions)
+                stages = bot.stage_timings.summary() if bot.stage_timings else {}
+
+                # Allocations on a fresh tracker state, traced separately so timing is not skewed
+                bot.spam_tracker = prot7.BoundedTracker(50000, 3600)
+                bot.raid_protection = prot7.BoundedTracker(5000, 3600)
+                sample = events[:args.alloc_events]
+                tracemalloc.start()
+                baseline = tracemalloc.get_traced_memory()[0]
+                asyncio.run(drive_pipeline(bot, sample))
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            finally:
+                bot.db_writer.stop()
+                bot.db.close()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] / 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] / 1000
+        retained = (current - baseline) / 1024 / max(len(sample), 1) * 1000
+        summary = ", ".join(f"{name} {count:,}" for name, count in sorted(counted.items())) or "none"
+        print(f"{mix:<8} {len(events) / elapsed:>10,.0f} {p50:>8.1f} {p99:>8.1f} {latencies[-1] / 1000:>9.0f} "
+              f"{retained:>10.1f} {(peak - baseline) / 1024:>9.0f} {bot.db_writer.rows_written:>8,} "
+              f"{bot.db_writer.rows_dropped:>8,}  {summary}")
+        for stage, t in stages.items():
+            print(f"    {stage:<16} {t['count']:>9,}x  p50 {t['p50_us']:>8.1f} us  p99 {t['p99_us']:>8.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description="Prot7 performance benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    matcher_parser = subparsers.add_parser("matcher", help="Blocked-word matcher vs. substring loop")
+    matcher_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 50000], help="Blocked word list sizes")
+    matcher_parser.add_argument("--messages", type=int, default=200, help="Messages per size")
+    matcher_parser.add_argument("--hit-rate", type=float, default=0.05, help="Fraction of messages containing a blocked word")
+    matcher_parser.add_argument("--repeat", type=int, default=3, help="Repetitions (best time is reported)")
+    matcher_parser.add_argument("--seed", type=int, default=7)
+    matcher_parser.set_defaults(func=bench_matcher)
+
+    db_parser = subparsers.add_parser("db", help="Dashboard queries before/after schema migration")
+    db_parser.add_argument("--rows", type=int, default=10000000, help="Messages to generate")
+    db_parser.add_argument("--path", default="prot7_bench.db", help="Scratch database file")
+    db_parser.add_argument("--repeat", type=int, default=3, help="Repetitions (best time is reported)")
+    db_parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    db_parser.add_argument("--seed", type=int, default=7)
+    db_parser.set_defaults(func=bench_db)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="on_message pipeline throughput with fake Discord objects")
+    pipeline_parser.add_argument("--mix", nargs="+", choices=sorted(PIPELINE_MIXES), default=list(PIPELINE_MIXES),
+                                 help="Message mixes to run")
+    pipeline_parser.add_argument("--events", type=int, default=100000, help="Events per mix")
+    pipeline_parser.add_argument("--users", type=int, default=20000, help="Members sending messages")
+    pipeline_parser.add_argument("--words", type=int, default=5000, help="Blocked word list size")
+    pipeline_parser.add_argument("--alloc-events", type=int, default=10000, help="Events replayed under tracemalloc")
+    pipeline_parser.add_argument("--stage-timings", action="store_true", help="Enable per-stage latency histograms")
+    pipeline_parser.add_argument("--seed", type=int, default=7)
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,779 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Prot7 Database Schema & Migrations
+# Shared by prot7.py (bot) and prot7adm.py (admin panel)
+# Author: T9Tuco
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+import urllib.parse
+from datetime import datetime
+
+DB_PATH = 'prot7.db'
+
+# Connection settings shared by the bot and the admin panel
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 64 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+WAL_AUTOCHECKPOINT_PAGES = 1000
+JOURNAL_SIZE_LIMIT = 64 * 1024 * 1024
+
+# Pages per incremental vacuum / backup step, small enough to take only milliseconds
+VACUUM_STEP_PAGES = 256
+BACKUP_STEP_PAGES = 1024
+
+# Canonical table definitions. Both the bot and the admin panel used to create
+# their own, slightly different, versions of these tables.
+TABLES = {
+    'messages': '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id TEXT,
+            user_id TEXT,
+            username TEXT,
+            channel_id TEXT,
+            guild_id TEXT,
+            content TEXT,
+            timestamp DATETIME,
+            message_type TEXT
+        )
+    ''',
+    'security_events': '''
+        CREATE TABLE IF NOT EXISTS security_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT,
+            user_id TEXT,
+            details TEXT,
+            timestamp DATETIME,
+            severity TEXT
+        )
+    ''',
+    'server_stats': '''
+        CREATE TABLE IF NOT EXISTS server_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id TEXT,
+            member_count INTEGER,
+            online_count INTEGER,
+            channel_count INTEGER,
+            timestamp DATETIME
+        )
+    ''',
+    'moderation_actions': '''
+        CREATE TABLE IF NOT EXISTS moderation_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id TEXT,
+            user_id TEXT,
+            moderator_id TEXT,
+            action_type TEXT,
+            reason TEXT,
+            timestamp DATETIME
+        )
+    ''',
+    'advanced_audit': '''
+        CREATE TABLE IF NOT EXISTS advanced_audit (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            action_type TEXT,
+            guild_id TEXT,
+            channel_id TEXT,
+            user_id TEXT,
+            target_id TEXT,
+            details TEXT,
+            timestamp DATETIME
+        )
+    ''',
+    'users': '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            username TEXT,
+            joined_at TEXT,
+            avatar_url TEXT,
+            is_bot INTEGER DEFAULT 0,
+            last_seen TEXT,
+            notes TEXT
+        )
+    ''',
+    'bot_status': '''
+        CREATE TABLE IF NOT EXISTS bot_status (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT,
+            details TEXT,
+            timestamp DATETIME
+        )
+    ''',
+}
+
+# Columns that only one of the old schemas had: (table, column, type)
+RECONCILED_COLUMNS = [
+    ('messages', 'message_id', 'TEXT'),
+    ('messages', 'message_type', 'TEXT'),
+    ('server_stats', 'online_count', 'INTEGER'),
+]
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_messages_user_timestamp ON messages (user_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_messages_channel_timestamp ON messages (channel_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_security_events_timestamp ON security_events (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_security_events_user_timestamp ON security_events (user_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_security_events_type_severity_timestamp ON security_events (event_type, severity, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_advanced_audit_timestamp ON advanced_audit (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_advanced_audit_user_timestamp ON advanced_audit (user_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_advanced_audit_target_timestamp ON advanced_audit (target_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_advanced_audit_action_timestamp ON advanced_audit (action_type, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_server_stats_timestamp ON server_stats (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_server_stats_guild_timestamp ON server_stats (guild_id, timestamp)',
+]
+
+def connect(path=DB_PATH, readonly=False):
+    """Open the database in WAL mode with the shared PRAGMA settings
+
+    WAL lets admin panel readers run alongside the bot's writer. Read-only
+    connections cannot change the database and never take the write lock.
+    """
+    if readonly:
+        uri = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_MS / 1000)
+    else:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+        # Only takes effect on a new, empty database (existing ones: convert_to_incremental_vacuum)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # Persistent: stored in the database file once set
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Durable at checkpoints, safe against corruption in WAL mode
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA wal_autocheckpoint = {WAL_AUTOCHECKPOINT_PAGES}")
+        conn.execute(f"PRAGMA journal_size_limit = {JOURNAL_SIZE_LIMIT}")
+
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+def checkpoint(conn, mode="PASSIVE"):
+    """Copy WAL frames back into the database file
+
+    Returns (busy, wal_frames, checkpointed_frames). PASSIVE never waits for
+    readers; TRUNCATE also resets the WAL file to zero bytes.
+    """
+    return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+def auto_vacuum_mode(conn):
+    """'none', 'full' or 'incremental'"""
+    return {0: 'none', 1: 'full', 2: 'incremental'}.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 'none')
+
+def free_pages(conn):
+    """(free pages, page size) of the database file"""
+    return conn.execute("PRAGMA freelist_count").fetchone()[0], conn.execute("PRAGMA page_size").fetchone()[0]
+
+def convert_to_incremental_vacuum(conn):
+    """One-time switch of an existing database to auto_vacuum=INCREMENTAL
+
+    Needs a full VACUUM: rewrites the whole file, needs as much free disk as
+    the database and blocks every writer until it is done.
+    """
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    # In WAL mode the rewritten pages land in the WAL first
+    checkpoint(conn, "TRUNCATE")
+
+def incremental_vacuum(conn, step_pages=VACUUM_STEP_PAGES, time_budget=None, pause=0.0, progress=None):
+    """Give free pages back to the filesystem in short steps, returns pages freed
+
+    Each step is its own small write transaction, so other writers get the
+    lock between steps. Stops when no free pages are left or after
+    time_budget seconds. Does nothing unless auto_vacuum is INCREMENTAL.
+    """
+    if auto_vacuum_mode(conn) != 'incremental':
+        return 0
+
+    started = time.monotonic()
+    total = free_pages(conn)[0]
+    freed = 0
+    while True:
+        before = free_pages(conn)[0]
+        if not before:
+            break
+        conn.execute(f"PRAGMA incremental_vacuum({int(step_pages)})").fetchall()
+        after = free_pages(conn)[0]
+        if after >= before:
+            break
+        freed += before - after
+        if progress:
+            progress(freed, total)
+        if time_budget is not None and time.monotonic() - started >= time_budget:
+            break
+        if pause:
+            time.sleep(pause)
+    return freed
+
+def backup(dest_path, path=DB_PATH, step_pages=BACKUP_STEP_PAGES, pause=0.005, progress=None):
+    """Copy the live database into a separate file with the online backup API
+
+    Copies step_pages pages per step and sleeps pause seconds between steps.
+    The source is read inside one read transaction: in WAL mode this is a
+    consistent snapshot that never blocks the bot, and the bot's commits
+    cannot force the copy to restart. progress(remaining, total) is called
+    after every step. The file is written under a temporary name first.
+    """
+    temp_path = dest_path + '.part'
+    source = connect(path, readonly=True)
+    target = sqlite3.connect(temp_path)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        # backup(sleep=...) only waits after a BUSY/LOCKED step, so pause here
+        def step(status, remaining, total):
+            if progress:
+                progress(remaining, total)
+            if pause and remaining:
+                time.sleep(pause)
+
+        source.backup(target, pages=step_pages, progress=step)
+        source.rollback()
+        target.close()
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        target.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        source.close()
+
+def table_columns(conn, table):
+    """Names of the columns of a table"""
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def migrate_v1(conn):
+    """Reconcile the bot and admin schemas and add secondary indexes"""
+    for create_sql in TABLES.values():
+        conn.execute(create_sql)
+
+    for table, column, column_type in RECONCILED_COLUMNS:
+        if column not in table_columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    for index_sql in INDEXES:
+        conn.execute(index_sql)
+
+# Full-text index over messages.content. External content: the text itself
+# stays in messages, the index only stores tokens keyed by messages.id.
+FTS_TABLES = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content,
+        content='messages',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    ''',
+    # Rows of messages that existed before the index and are not indexed yet:
+    # ids in (position, end_id]. The row is removed once the backfill is done.
+    '''
+    CREATE TABLE IF NOT EXISTS fts_backfill (
+        name TEXT PRIMARY KEY,
+        position INTEGER NOT NULL,
+        end_id INTEGER NOT NULL
+    )
+    ''',
+]
+
+# Rows waiting for the backfill are not in the index yet and must not be
+# removed from it.
+FTS_INDEXED = "NOT EXISTS (SELECT 1 FROM fts_backfill WHERE name = 'messages_fts' AND {id} > position AND {id} <= end_id)"
+
+FTS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+    WHEN {FTS_INDEXED.format(id='old.id')} BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages
+    WHEN {FTS_INDEXED.format(id='old.id')} BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    ''',
+]
+
+def migrate_v2(conn):
+    """Full-text search index on message content"""
+    for create_sql in FTS_TABLES + FTS_TRIGGERS:
+        conn.execute(create_sql)
+
+    # Everything logged so far is indexed later by backfill_fts()
+    max_id = conn.execute("SELECT MAX(id) FROM messages").fetchone()[0]
+    if max_id:
+        conn.execute(
+            "INSERT OR REPLACE INTO fts_backfill (name, position, end_id) VALUES ('messages_fts', 0, ?)",
+            (max_id,)
+        )
+
+# Tables with a timestamp column that old records can be deleted from
+DELETABLE_TABLES = ('messages', 'security_events', 'advanced_audit', 'server_stats')
+
+def migrate_v3(conn):
+    """State table for resumable batched deletes"""
+    # One job per table: rows with id in (position, end_id] and timestamp < cutoff
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS delete_jobs (
+            table_name TEXT PRIMARY KEY,
+            cutoff TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            end_id INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT
+        )
+    ''')
+
+# Hourly rollups kept up to date by the bot as it writes, so dashboards never
+# aggregate raw rows. They are append-only history: retention and duplicate
+# cleanup delete raw rows but never decrement them, so their totals count
+# everything ever logged, not what is stored now.
+# rollup table -> (source table, key columns, count column)
+ROLLUPS = {
+    'hourly_guild_messages': ('messages', ('guild_id',), 'messages'),
+    'hourly_channel_messages': ('messages', ('guild_id', 'channel_id'), 'messages'),
+    'hourly_user_messages': ('messages', ('guild_id', 'user_id'), 'messages'),
+    'hourly_security_events': ('security_events', ('event_type', 'severity'), 'events'),
+}
+
+def hour_bucket(timestamp):
+    """'YYYY-MM-DD HH:00:00' for a logged timestamp (datetime or ISO text)"""
+    return str(timestamp)[:13] + ':00:00'
+
+def rollup_cutoff(hours):
+    """First hour bucket of the last hours hours, in local time like the logged timestamps"""
+    return hour_bucket(datetime.fromtimestamp(time.time() - hours * 3600))
+
+def rollup_upsert_sql(rollup, select_sql):
+    """INSERT that adds counts to existing rollup rows instead of replacing them"""
+    source, keys, count_column = ROLLUPS[rollup]
+    return (
+        f"INSERT INTO {rollup} (hour, {', '.join(keys)}, {count_column}) {select_sql} "
+        f"ON CONFLICT (hour, {', '.join(keys)}) DO UPDATE SET {count_column} = {count_column} + excluded.{count_column}"
+    )
+
+def migrate_v4(conn):
+    """Hourly rollup tables for dashboards"""
+    for rollup, (source, keys, count_column) in ROLLUPS.items():
+        key_columns = ', '.join(f"{key} TEXT NOT NULL" for key in keys)
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {rollup} (
+                hour TEXT NOT NULL,
+                {key_columns},
+                {count_column} INTEGER NOT NULL,
+                PRIMARY KEY (hour, {', '.join(keys)})
+            ) WITHOUT ROWID
+        ''')
+
+    # Rows logged before the rollups existed are counted later by
+    # backfill_rollups(): ids in (position, end_id] per source table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_backfill (
+            source TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            end_id INTEGER NOT NULL
+        )
+    ''')
+    for source in sorted({source for source, _, _ in ROLLUPS.values()}):
+        max_id = conn.execute(f"SELECT MAX(id) FROM {source}").fetchone()[0]
+        if max_id:
+            conn.execute(
+                "INSERT OR REPLACE INTO rollup_backfill (source, position, end_id) VALUES (?, 0, ?)",
+                (source, max_id)
+            )
+
+def update_rollups(conn, table, columns, rows):
+    """Add rows just inserted into table to its hourly rollups
+
+    columns names the values of each row. Call inside the inserting
+    transaction so raw rows and rollups always commit together.
+    """
+    time_index = columns.index('timestamp')
+    for rollup, (source, keys, count_column) in ROLLUPS.items():
+        if source != table:
+            continue
+        key_indexes = [columns.index(key) for key in keys]
+        counts = {}
+        for row in rows:
+            if row[time_index] is None:
+                continue
+            key = (hour_bucket(row[time_index]),) + tuple(
+                '' if row[i] is None else str(row[i]) for i in key_indexes
+            )
+            counts[key] = counts.get(key, 0) + 1
+        conn.executemany(
+            rollup_upsert_sql(rollup, f"VALUES ({', '.join('?' * (len(keys) + 2))})"),
+            [key + (count,) for key, count in counts.items()]
+        )
+
+# (version, description, function) - append new steps, never reorder
+MIGRATIONS = [
+    (1, "canonical schema and indexes", migrate_v1),
+    (2, "full-text search index for messages", migrate_v2),
+    (3, "resumable delete jobs", migrate_v3),
+    (4, "hourly rollups for dashboards", migrate_v4),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    """Schema version recorded in PRAGMA user_version"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """Apply pending migrations, each in its own transaction
+
+    Returns a list of (version, description) for the steps that were applied.
+    Safe to call concurrently from the bot and the admin panel.
+    """
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if get_schema_version(conn) >= version:
+            continue
+
+        # Take the write lock first, then re-check in case another process migrated meanwhile
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) < version:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                applied.append((version, description))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        logging.info(f"Database migrated to schema version {version} ({description})")
+    return applied
+
+def fts_backfill_status(conn):
+    """(position, end_id) of the pending search index backfill, or None when complete"""
+    return conn.execute(
+        "SELECT position, end_id FROM fts_backfill WHERE name = 'messages_fts'"
+    ).fetchone()
+
+def backfill_fts(conn, batch_size=5000, max_batches=None, progress=None):
+    """Index messages logged before the search index existed
+
+    Works in short transactions and stores its position with every batch, so
+    it can be interrupted at any point and resumed later. Returns True once
+    every message is indexed.
+    """
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            status = fts_backfill_status(conn)
+            if status is None:
+                conn.execute("COMMIT")
+                return True
+            position, end_id = status
+
+            rows = conn.execute(
+                "SELECT id, content FROM messages WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                (position, end_id, batch_size)
+            ).fetchall()
+            if rows:
+                conn.executemany("INSERT INTO messages_fts (rowid, content) VALUES (?, ?)", rows)
+                position = rows[-1][0]
+
+            if not rows or position >= end_id:
+                conn.execute("DELETE FROM fts_backfill WHERE name = 'messages_fts'")
+                position = end_id
+            else:
+                conn.execute("UPDATE fts_backfill SET position = ? WHERE name = 'messages_fts'", (position,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        batches += 1
+        if progress:
+            progress(position, end_id)
+        if position >= end_id:
+            logging.info("Message search index backfill complete")
+            return True
+    return False
+
+def rollup_backfill_status(conn):
+    """{source table: (position, end_id)} for rollups still missing old rows"""
+    return {
+        source: (position, end_id)
+        for source, position, end_id in conn.execute("SELECT source, position, end_id FROM rollup_backfill ORDER BY source")
+    }
+
+def backfill_rollups(conn, batch_size=20000, max_batches=None, progress=None):
+    """Count rows logged before the rollups existed into them
+
+    Each batch aggregates one id range of one source table in its own short
+    transaction and stores the position, so it can be interrupted and
+    resumed like backfill_fts(). Returns True once every rollup is complete.
+    """
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT source, position, end_id FROM rollup_backfill ORDER BY source LIMIT 1").fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return True
+            source, position, end_id = row
+            upper = min(position + batch_size, end_id)
+
+            for rollup, (rollup_source, keys, count_column) in ROLLUPS.items():
+                if rollup_source != source:
+                    continue
+                # NULL keys (DMs, unknown severity) are stored as ''
+                conn.execute(rollup_upsert_sql(rollup, f'''
+                    SELECT substr(timestamp, 1, 13) || ':00:00', {', '.join(f"COALESCE({key}, '')" for key in keys)}, COUNT(*)
+                    FROM {source}
+                    WHERE id > ? AND id <= ? AND timestamp IS NOT NULL
+                    GROUP BY 1, {', '.join(str(i + 2) for i in range(len(keys)))}
+                '''), (position, upper))
+
+            if upper >= end_id:
+                conn.execute("DELETE FROM rollup_backfill WHERE source = ?", (source,))
+            else:
+                conn.execute("UPDATE rollup_backfill SET position = ? WHERE source = ?", (upper, source))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        batches += 1
+        if progress:
+            progress(source, upper, end_id)
+        if upper >= end_id:
+            logging.info(f"Hourly rollup backfill for {source} complete")
+    return False
+
+def fts_query(term):
+    """Make free-form input safe to use as an FTS5 query
+
+    Valid FTS5 syntax (phrases, prefix*, AND/OR/NOT) is used as is;
+    anything else is searched as a sequence of quoted words.
+    """
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE q USING fts5(t)")
+        conn.execute("SELECT * FROM q WHERE q MATCH ?", (term,)).fetchall()
+        return term
+    except sqlite3.OperationalError:
+        words = [word.replace('"', '""') for word in term.split()]
+        return ' '.join(f'"{word}"' for word in words)
+    finally:
+        conn.close()
+
+def get_delete_job(conn, table):
+    """Unfinished delete job for a table as a dict, or None"""
+    row = conn.execute(
+        "SELECT cutoff, position, end_id, deleted, started_at FROM delete_jobs WHERE table_name = ?",
+        (table,)
+    ).fetchone()
+    if not row:
+        return None
+    return dict(zip(('cutoff', 'position', 'end_id', 'deleted', 'started_at'), row))
+
+def start_delete_job(conn, table, cutoff):
+    """Record a job deleting rows older than cutoff, replacing any unfinished one
+
+    cutoff is compared against the stored timestamp text, so it must use the
+    same format the bot logs (str(datetime)). Returns the job, or None when
+    there is nothing to delete.
+    """
+    if table not in DELETABLE_TABLES:
+        raise ValueError(f"Cannot delete from {table}")
+
+    # The span ends at the highest expired id, found with a covering scan of
+    # the timestamp index (the unary + keeps SQLite from walking the table
+    # backwards by rowid instead), so rows logged out of timestamp order are
+    # included. It starts at the first id: a rowid lookup instead of reading
+    # the expired range twice, and every batch checks the cutoff anyway.
+    last_id = conn.execute(f"SELECT MAX(+id) FROM {table} WHERE timestamp < ?", (str(cutoff),)).fetchone()[0]
+    first_id = conn.execute(f"SELECT MIN(id) FROM {table}").fetchone()[0] if last_id is not None else None
+
+    with conn:
+        conn.execute("DELETE FROM delete_jobs WHERE table_name = ?", (table,))
+        if first_id is None:
+            return None
+        conn.execute(
+            "INSERT INTO delete_jobs (table_name, cutoff, position, end_id, deleted, started_at) VALUES (?, ?, ?, ?, 0, ?)",
+            (table, str(cutoff), first_id - 1, last_id, str(datetime.now()))
+        )
+    return get_delete_job(conn, table)
+
+def run_delete_job(conn, table, batch_size=5000, pause=0.05, max_batches=None, progress=None):
+    """Continue a delete job in short transactions over rowid ranges
+
+    Each batch deletes from at most batch_size consecutive ids and commits
+    together with the new position, so the write lock is held only briefly
+    and an interrupted job resumes where it stopped. Sleeps pause seconds
+    between batches to let other writers in. Returns (rows deleted in this
+    call, whether the job is finished).
+    """
+    if table not in DELETABLE_TABLES:
+        raise ValueError(f"Cannot delete from {table}")
+
+    deleted_now = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            job = get_delete_job(conn, table)
+            if not job:
+                conn.execute("COMMIT")
+                return deleted_now, True
+
+            upper = min(job['position'] + batch_size, job['end_id'])
+            cursor = conn.execute(
+                f"DELETE FROM {table} WHERE id > ? AND id <= ? AND timestamp < ?",
+                (job['position'], upper, job['cutoff'])
+            )
+            deleted_now += cursor.rowcount
+            job['deleted'] += cursor.rowcount
+            job['position'] = upper
+
+            finished = upper >= job['end_id']
+            if finished:
+                conn.execute("DELETE FROM delete_jobs WHERE table_name = ?", (table,))
+            else:
+                conn.execute(
+                    "UPDATE delete_jobs SET position = ?, deleted = ? WHERE table_name = ?",
+                    (upper, job['deleted'], table)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        batches += 1
+        if progress:
+            progress(job)
+        if finished:
+            logging.info(f"Deleted {job['deleted']} rows older than {job['cutoff']} from {table}")
+            return deleted_now, True
+        if pause:
+            time.sleep(pause)
+    return deleted_now, False
+
+# Duplicate detection: rows are duplicates when the key columns are equal and
+# the text column has the same content (compared by hash, then verified)
+DEDUP_FINGERPRINTS = {
+    'messages': (('user_id', 'channel_id', 'timestamp'), 'content'),
+    'security_events': (('user_id', 'event_type', 'timestamp'), 'details'),
+}
+
+def content_hash(value):
+    """64-bit hash of a text value for fingerprinting"""
+    if value is None:
+        return None
+    data = value.encode('utf-8', 'surrogatepass') if isinstance(value, str) else bytes(value)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+def remove_duplicates(conn, table, batch_size=50000, delete_batch=2000, pause=0.02, progress=None):
+    """Delete rows whose fingerprint matches an older row, keeping the oldest
+
+    Fingerprints are collected into a temporary table in id-range batches and
+    indexed there, so the live table is only read in short steps and keeps its
+    schema. Deletes run in small transactions, and every duplicate is compared
+    in full against the kept row first. progress(stage, done, total) reports
+    'scan' and 'delete'. Returns (rows scanned, duplicates found, rows deleted).
+    """
+    if table not in DEDUP_FINGERPRINTS:
+        raise ValueError(f"No duplicate fingerprint for {table}")
+    key_columns, text_column = DEDUP_FINGERPRINTS[table]
+    keys = ', '.join(key_columns)
+
+    conn.create_function('prot7_hash', 1, content_hash, deterministic=True)
+    # connect() keeps temp tables in memory; one fingerprint per row would
+    # need gigabytes of RAM on large tables, so spill them to a temp file.
+    # Changing temp_store drops existing temp tables, so do it before creating ours.
+    temp_store = conn.execute("PRAGMA temp_store").fetchone()[0]
+    conn.execute("PRAGMA temp_store = FILE")
+
+    try:
+        conn.execute("DROP TABLE IF EXISTS temp.dedup_keys")
+        conn.execute("DROP TABLE IF EXISTS temp.dedup_delete")
+        conn.execute(f"CREATE TEMP TABLE dedup_keys (id INTEGER PRIMARY KEY, {keys}, text_hash INTEGER)")
+        conn.execute("CREATE TEMP TABLE dedup_delete (id INTEGER PRIMARY KEY, keep_id INTEGER NOT NULL)")
+
+        # 1. Fingerprints, one id range per short read
+        max_id = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0
+        scanned = 0
+        position = 0
+        while position < max_id:
+            upper = position + batch_size
+            with conn:
+                scanned += conn.execute(
+                    f"INSERT INTO temp.dedup_keys SELECT id, {keys}, prot7_hash({text_column}) "
+                    f"FROM {table} WHERE id > ? AND id <= ?",
+                    (position, upper)
+                ).rowcount
+            position = upper
+            if progress:
+                progress('scan', min(position, max_id), max_id)
+
+        # 2. Temporary index: every fingerprint lookup becomes a seek
+        conn.execute(f"CREATE INDEX temp.dedup_keys_fingerprint ON dedup_keys ({keys}, text_hash, id)")
+        match = ' AND '.join(f"k.{column} IS d.{column}" for column in key_columns + ('text_hash',))
+        with conn:
+            conn.execute(f'''
+                INSERT INTO temp.dedup_delete (id, keep_id)
+                SELECT id, keep_id FROM (
+                    SELECT d.id, (SELECT MIN(k.id) FROM temp.dedup_keys k WHERE {match}) AS keep_id
+                    FROM temp.dedup_keys d
+                ) WHERE keep_id < id
+            ''')
+        found = conn.execute("SELECT COUNT(*) FROM temp.dedup_delete").fetchone()[0]
+
+        # 3. Delete in short write transactions, verifying the full content
+        same = ' AND '.join(f"keep.{column} IS dup.{column}" for column in key_columns + (text_column,))
+        deleted = 0
+        position = 0
+        while True:
+            batch = conn.execute(
+                "SELECT id FROM temp.dedup_delete WHERE id > ? ORDER BY id LIMIT ?", (position, delete_batch)
+            ).fetchall()
+            if not batch:
+                break
+            upper = batch[-1][0]
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted += conn.execute(f'''
+                    DELETE FROM {table} WHERE id IN (
+                        SELECT x.id FROM temp.dedup_delete x
+                        JOIN {table} dup ON dup.id = x.id
+                        JOIN {table} keep ON keep.id = x.keep_id
+                        WHERE x.id > ? AND x.id <= ? AND {same}
+                    )
+                ''', (position, upper)).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            position = upper
+            if progress:
+                progress('delete', deleted, found)
+            if pause:
+                time.sleep(pause)
+
+        logging.info(f"Duplicate cleanup of {table}: {scanned} scanned, {found} duplicates, {deleted} deleted")
+        return scanned, found, deleted
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.dedup_keys")
+        conn.execute("DROP TABLE IF EXISTS temp.dedup_delete")
+        conn.execute(f"PRAGMA temp_store = {temp_store}")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Prot7 Columnar Export (Parquet / NPZ)
+# Used by prot7adm.py for analytics exports
+# Author: T9Tuco
+
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+
+# Optional: Parquet via pyarrow, otherwise .npz via numpy
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Column kinds:
+#   int       plain integer column
+#   snowflake Discord ID stored as TEXT, exported as int64
+#   time      timestamp, exported as microseconds (naive, local time as logged)
+#   category  few distinct strings, dictionary-encoded
+#   text      free text
+COLUMNAR_TABLES = {
+    'messages': [
+        ('id', 'int'), ('message_id', 'snowflake'), ('user_id', 'snowflake'), ('username', 'text'),
+        ('channel_id', 'snowflake'), ('guild_id', 'snowflake'), ('content', 'text'),
+        ('timestamp', 'time'), ('message_type', 'category'),
+    ],
+    'security_events': [
+        ('id', 'int'), ('event_type', 'category'), ('user_id', 'snowflake'), ('details', 'text'),
+        ('timestamp', 'time'), ('severity', 'category'),
+    ],
+    'advanced_audit': [
+        ('id', 'int'), ('action_type', 'category'), ('guild_id', 'snowflake'), ('channel_id', 'snowflake'),
+        ('user_id', 'snowflake'), ('target_id', 'snowflake'), ('details', 'text'), ('timestamp', 'time'),
+    ],
+    'server_stats': [
+        ('id', 'int'), ('guild_id', 'snowflake'), ('member_count', 'int'), ('online_count', 'int'),
+        ('channel_count', 'int'), ('timestamp', 'time'),
+    ],
+}
+
+# Rows per Parquet row group / conversion batch
+ROW_GROUP_ROWS = 100000
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+def available_format():
+    """'parquet', 'npz' or None depending on the installed libraries"""
+    if pyarrow:
+        return 'parquet'
+    if numpy:
+        return 'npz'
+    return None
+
+def to_int(value):
+    """Integer or None for IDs logged as text ('unknown', empty, ...)"""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def to_micros(value):
+    """Microseconds since 1970 for a logged ISO timestamp, or None"""
+    if not value:
+        return None
+    try:
+        return (datetime.fromisoformat(str(value)).replace(tzinfo=None) - EPOCH) // ONE_MICROSECOND
+    except ValueError:
+        return None
+
+def convert_column(kind, values):
+    """Convert one column of a batch from SQLite values to export values"""
+    if kind in ('int', 'snowflake'):
+        return [to_int(v) for v in values]
+    if kind == 'time':
+        return [to_micros(v) for v in values]
+    return [None if v is None else str(v) for v in values]
+
+class ParquetExport:
+    """Parquet file, one row group per batch"""
+
+    ARROW_TYPES = {
+        'int': lambda: pyarrow.int64(),
+        'snowflake': lambda: pyarrow.int64(),
+        'time': lambda: pyarrow.timestamp('us'),
+        'category': lambda: pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+        'text': lambda: pyarrow.string(),
+    }
+
+    def __init__(self, path, columns):
+        self.columns = columns
+        self.schema = pyarrow.schema([(name, self.ARROW_TYPES[kind]()) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write_batch(self, rows):
+        arrays = []
+        for index, (name, kind) in enumerate(self.columns):
+            values = convert_column(kind, [row[index] for row in rows])
+            if kind == 'category':
+                arrays.append(pyarrow.array(values, pyarrow.string()).dictionary_encode())
+            else:
+                arrays.append(pyarrow.array(values, self.schema.field(name).type))
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+    def abort(self):
+        self.writer.close()
+
+class NpzExport:
+    """numpy .npz archive written without holding whole columns in memory
+
+    Every column is appended to a scratch file while rows stream in and is
+    copied into the archive as a .npy member at the end. Arrays per column:
+      int / snowflake  <name> int64, <name>.valid bool
+      time             <name> datetime64[us] (NaT when missing)
+      category         <name> int32 codes (-1 when missing), <name>.categories
+      text             <name>.data uint8 UTF-8 bytes, <name>.offsets int64 (n + 1)
+    """
+
+    # int64 value numpy uses for NaT
+    NAT = -2 ** 63
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.rows = 0
+        self.scratch = tempfile.mkdtemp(prefix='prot7-export-', dir=os.path.dirname(os.path.abspath(path)))
+        self.files = {}
+        self.categories = {}
+        self.text_bytes = {}
+        for name, kind in columns:
+            if kind in ('int', 'snowflake'):
+                self._open(name, 'int64')
+                self._open(f"{name}.valid", 'bool')
+            elif kind == 'time':
+                self._open(name, 'datetime64[us]')
+            elif kind == 'category':
+                self._open(name, 'int32')
+                self.categories[name] = {}
+            else:
+                self._open(f"{name}.data", 'uint8')
+                self._open(f"{name}.offsets", 'int64')
+                self.text_bytes[name] = 0
+                self._append(f"{name}.offsets", [0])
+
+    def _open(self, member, dtype):
+        self.files[member] = (open(os.path.join(self.scratch, member), 'wb'), numpy.dtype(dtype), [0])
+
+    def _append(self, member, values):
+        f, dtype, length = self.files[member]
+        array = numpy.asarray(values, dtype=dtype)
+        f.write(array.tobytes())
+        length[0] += len(array)
+
+    def write_batch(self, rows):
+        for index, (name, kind) in enumerate(self.columns):
+            values = convert_column(kind, [row[index] for row in rows])
+            if kind in ('int', 'snowflake'):
+                self._append(name, [0 if v is None else v for v in values])
+                self._append(f"{name}.valid", [v is not None for v in values])
+            elif kind == 'time':
+                self._append(name, numpy.array(
+                    [self.NAT if v is None else v for v in values], dtype='int64'
+                ).view('datetime64[us]'))
+            elif kind == 'category':
+                codes = self.categories[name]
+                self._append(name, [-1 if v is None else codes.setdefault(v, len(codes)) for v in values])
+            else:
+                encoded = [(v or '').encode('utf-8') for v in values]
+                offsets = []
+                total = self.text_bytes[name]
+                for chunk in encoded:
+                    total += len(chunk)
+                    offsets.append(total)
+                self.text_bytes[name] = total
+                self._append(f"{name}.data", numpy.frombuffer(b''.join(encoded), dtype='uint8'))
+                self._append(f"{name}.offsets", offsets)
+        self.rows += len(rows)
+
+    def close(self):
+        try:
+            with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+                for member, (f, dtype, length) in self.files.items():
+                    f.close()
+                    with archive.open(f"{member}.npy", 'w', force_zip64=True) as out:
+                        numpy.lib.format.write_array_header_1_0(
+                            out, {'descr': numpy.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (length[0],)}
+                        )
+                        with open(os.path.join(self.scratch, member), 'rb') as data:
+                            shutil.copyfileobj(data, out, 1024 * 1024)
+                for name, codes in self.categories.items():
+                    labels = sorted(codes, key=codes.get)
+                    with archive.open(f"{name}.categories.npy", 'w') as out:
+                        numpy.lib.format.write_array(out, numpy.array(labels, dtype=str))
+        finally:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def abort(self):
+        for f, _, _ in self.files.values():
+            f.close()
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+def export_table(conn, table, path, where="", params=(), progress=None):
+    """Stream a table into a columnar file, returns the number of rows
+
+    The format follows the file extension (.parquet or .npz). Rows are
+    fetched and converted ROW_GROUP_ROWS at a time. Nothing is written when
+    no rows match.
+    """
+    columns = COLUMNAR_TABLES[table]
+    export_class = ParquetExport if path.endswith('.parquet') else NpzExport
+    query = f"SELECT {', '.join(name for name, _ in columns)} FROM {table} {where} ORDER BY id"
+
+    cursor = conn.cursor()
+    cursor.arraysize = ROW_GROUP_ROWS
+    cursor.execute(query, params)
+
+    temp_path = path + '.part'
+    export = export_class(temp_path, columns)
+    count = 0
+    try:
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            export.write_batch(rows)
+            count += len(rows)
+            if progress:
+                progress(count)
+        if count:
+            export.close()
+        else:
+            export.abort()
+    except BaseException:
+        export.abort()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # Like the CSV export: no file at all rather than an empty one
+    if not count:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return 0
+
+    os.replace(temp_path, path)
+    return count
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Prot7 Replay
+# Re-runs logged messages from prot7.db through the moderation detectors
+# Author: T9Tuco
+
+import argparse
+import array
+import asyncio
+import collections
+import json
+import logging
+import time
+from datetime import datetime
+
+import prot7
+import prot7db
+from prot7bench import FakeBot, FakeChannel, FakeGuild, FakeMember, FakeMessage
+
+# cleanup_old_data runs every 10 minutes in the bot (resets spam warnings after an hour)
+CLEANUP_INTERVAL = 600
+
+# Rows fetched from the database at a time
+FETCH_ROWS = 5000
+
+def parse_timestamp(value):
+    """Seconds since the epoch for a logged timestamp, or None"""
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+def parse_id(value):
+    """Discord IDs are logged as text; the bot keys its trackers by int"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+class Replay:
+    """Prot7Bot detectors on a historical clock, recording actions instead of taking them
+
+    Mentions are not logged, so the mention check never fires during a replay.
+    """
+
+    def __init__(self, config, verbose=False):
+        self.now = 0.0
+        self.verbose = verbose
+        self.row = None
+        self.actions = collections.Counter()
+        self.events = collections.Counter()
+        self.flagged_users = collections.Counter()
+        self.usernames = {}
+        self.guilds = {}
+        self.channels = {}
+        self.members = {}
+        self.next_cleanup = None
+
+        bot = prot7.Prot7Bot.__new__(prot7.Prot7Bot)
+        bot.snapshot = prot7.ConfigSnapshot(config)
+        bot.bot = FakeBot([])
+        bot.db = None
+        bot.db_writer = None
+        bot.clock = lambda: self.now
+        limits = config.get('limits', {})
+        idle_seconds = limits.get('tracker_idle_minutes', 60) * 60
+        bot.spam_tracker = prot7.BoundedTracker(limits.get('max_tracked_users', 50000), idle_seconds, clock=bot.clock)
+        bot.raid_protection = prot7.BoundedTracker(limits.get('max_tracked_guilds', 5000), idle_seconds, clock=bot.clock)
+        bot.user_resolver = prot7.UserResolver(None)
+        bot.log_security_event = self.record_event
+        self.bot = bot
+
+    def record_event(self, event_type, user_id, details, severity="medium"):
+        """Stands in for Prot7Bot.log_security_event"""
+        self.events[event_type] += 1
+        self.flagged_users[user_id] += 1
+        if self.verbose:
+            print(f"{self.row[6]}  {event_type:<14} {self.row[2]} ({user_id}): {details}")
+
+    def message_for(self, row):
+        """Fake discord.Message for a logged row"""
+        _, user_id, username, channel_id, guild_id, content, _ = row
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            guild = self.guilds[guild_id] = FakeGuild(parse_id(guild_id), self.actions)
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(parse_id(channel_id))
+        author = self.members.get((guild_id, user_id))
+        if author is None:
+            author = self.members[guild_id, user_id] = FakeMember(parse_id(user_id), guild)
+        author.name = username
+        self.usernames[author.id] = username
+        return FakeMessage(author, channel, content or "")
+
+    async def replay(self, row):
+        """Run one logged message through the detectors, returns the time spent in them (ns)"""
+        timestamp = parse_timestamp(row[6])
+        if timestamp is None:
+            return None
+        self.row = row
+        self.now = timestamp
+
+        if self.next_cleanup is None:
+            self.next_cleanup = timestamp + CLEANUP_INTERVAL
+        elif timestamp >= self.next_cleanup:
+            await self.bot.cleanup_old_data.coro(self.bot)
+            self.next_cleanup = timestamp + CLEANUP_INTERVAL
+
+        message = self.message_for(row)
+        if not self.bot.snapshot.auto_mod:
+            return 0
+
+        # Same order as on_message_handler
+        started = time.perf_counter_ns()
+        if not await self.bot.check_message_content(message):
+            await self.bot.check_for_spam(message)
+        return time.perf_counter_ns() - started
+
+def iter_messages(conn, since=None, until=None, limit=None):
+    """Logged messages in timestamp order, fetched FETCH_ROWS at a time"""
+    query = "SELECT id, user_id, username, channel_id, guild_id, content, timestamp FROM messages WHERE timestamp IS NOT NULL"
+    params = []
+    if since:
+        query += " AND timestamp >= ?"
+        params.append(since)
+    if until:
+        query += " AND timestamp < ?"
+        params.append(until)
+    query += " ORDER BY timestamp, id"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    cursor = conn.cursor()
+    cursor.arraysize = FETCH_ROWS
+    cursor.execute(query, params)
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        yield from rows
+
+async def run_replay(args, replay, conn):
+    """Replay every selected message, pacing to --speed when given"""
+    latencies = array.array('q')
+    first = last = None
+    wall_start = time.perf_counter()
+    for row in iter_messages(conn, args.since, args.until, args.limit):
+        if args.speed and first is not None:
+            timestamp = parse_timestamp(row[6])
+            if timestamp is not None:
+                delay = wall_start + (timestamp - parse_timestamp(first)) / args.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+        elapsed = await replay.replay(row)
+        if elapsed is None:
+            continue
+        latencies.append(elapsed)
+        first = first or row[6]
+        last = row[6]
+
+        if not args.verbose and len(latencies) % 10000 == 0:
+            print(f"\r  {len(latencies):,} messages, at {last[:19]}", end="", flush=True)
+    if not args.verbose and len(latencies) >= 10000:
+        print()
+    return latencies, first, last, time.perf_counter() - wall_start
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged messages through the Prot7 detectors (no actions are taken)")
+    parser.add_argument("--db", default=prot7db.DB_PATH, help="Database to read messages from")
+    parser.add_argument("--config", default="config.json", help="Config with blocked words, modules and limits")
+    parser.add_argument("--since", help="Only messages logged at or after this time (YYYY-MM-DD[ HH:MM])")
+    parser.add_argument("--until", help="Only messages logged before this time")
+    parser.add_argument("--limit", type=int, help="Stop after this many messages")
+    parser.add_argument("--speed", type=float, default=0, help="Replay at N times real time (default: as fast as possible)")
+    parser.add_argument("--spam-window", type=int, help=f"Spam window in seconds (default {prot7.SpamRecord.WINDOW_SECONDS})")
+    parser.add_argument("--spam-max", type=int, help=f"Messages allowed per window (default {prot7.SpamRecord.MAX_MESSAGES})")
+    parser.add_argument("--verbose", action="store_true", help="Print every action that would have been taken")
+    args = parser.parse_args()
+
+    # The detectors log every action they take; the report below covers them
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    if args.spam_window:
+        prot7.SpamRecord.WINDOW_SECONDS = args.spam_window
+    if args.spam_max:
+        prot7.SpamRecord.MAX_MESSAGES = args.spam_max
+
+    replay = Replay(config, verbose=args.verbose)
+    snapshot = replay.bot.snapshot
+    if not snapshot.auto_mod:
+        print("Note: auto_mod is disabled in this config, nothing will be flagged")
+    print(f"Replaying {args.db} with {len(snapshot.matcher):,} blocked words, "
+          f"spam limit {prot7.SpamRecord.MAX_MESSAGES} messages / {prot7.SpamRecord.WINDOW_SECONDS}s"
+          + (f", {args.speed:g}x speed" if args.speed else ""))
+
+    conn = prot7db.connect(args.db, readonly=True)
+    try:
+        latencies, first, last, wall = asyncio.run(run_replay(args, replay, conn))
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+        return
+    finally:
+        conn.close()
+
+    if not latencies:
+        print("No messages to replay")
+        return
+
+    count = len(latencies)
+    detector_seconds = sum(latencies) / 1e9
+    ordered = sorted(latencies)
+    print(f"\nReplayed {count:,} messages logged from {first[:19]} to {last[:19]}")
+    print(f"Detectors: {count / max(detector_seconds, 1e-9):,.0f} messages/s, "
+          f"p50 {ordered[count // 2] / 1000:.1f} us, p99 {ordered[min(count - 1, int(count * 0.99))] / 1000:.1f} us, "
+          f"max {ordered[-1] / 1000:.0f} us")
+    print(f"Wall time: {wall:.1f}s ({count / wall:,.0f} messages/s including database reads)")
+
+    actions = replay.actions
+    print(f"\nWould have deleted {actions['delete']:,} messages, timed out {actions['timeout']:,} times, "
+          f"sent {actions['dm']:,} DMs")
+    for event_type, events in replay.events.most_common():
+        print(f"  {event_type:<16} {events:,}")
+    if replay.flagged_users:
+        print("\nMost flagged users:")
+        for user_id, events in replay.flagged_users.most_common(10):
+            print(f"  {replay.usernames.get(user_id, 'Unknown')} ({user_id}): {events:,} events")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+import collections
+import logging
+import random
+import string
+import types
+
+import prot7
+
+
+def naive_find_all(words, text):
+    """Substring oracle: every blocked word contained in text, case-insensitively"""
+    found = []
+    seen = set()
+    for word in words:
+        key = word.lower()
+        if key and key not in seen:
+            seen.add(key)
+            if key in text.lower():
+                found.append(word)
+    return found
+
+
+def random_word(rng, alphabet, min_len, max_len):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(min_len, max_len)))
+
+
+def test_matcher_agrees_with_substring_search():
+    rng = random.Random(7)
+    # A small alphabet makes overlapping and nested words common
+    for size in (1, 5, prot7.BlockedWordMatcher.SMALL_LIST, 200):
+        words = [random_word(rng, 'abcd', 1, 6) for _ in range(size)]
+        matcher = prot7.BlockedWordMatcher(words)
+        for _ in range(300):
+            text = random_word(rng, 'abcdAB e', 0, 40)
+            assert sorted(matcher.find_all(text)) == sorted(naive_find_all(words, text)), (words, text)
+
+
+def test_matcher_overlapping_and_suffix_words():
+    words = ['he', 'she', 'his', 'hers'] + [f"filler{i}" for i in range(40)]
+    matcher = prot7.BlockedWordMatcher(words)
+    assert sorted(matcher.find_all('ushers')) == ['he', 'hers', 'she']
+    assert matcher.find_all('ahishers')[0] == 'his'
+    assert matcher.find_all('nothing here') == ['he']
+    assert matcher.find_all('') == []
+
+
+def test_matcher_case_insensitive_and_deduplicated():
+    rng = random.Random(1)
+    # Enough words to use the automaton rather than the short-list path
+    words = ['Spam', 'spam', 'SPAM', 'Scam', '', None, 42] + [random_word(rng, string.ascii_lowercase, 8, 8) for _ in range(50)]
+    matcher = prot7.BlockedWordMatcher(words)
+    assert matcher.find_all('This is sPaM and a SCAM') == ['Spam', 'Scam']
+    assert matcher.find_all('clean message') == []
+    assert len(matcher) == len({w.lower() for w in words if isinstance(w, str) and w})
+
+
+def test_matcher_without_words():
+    assert prot7.BlockedWordMatcher([]).find_all('anything') == []
+    assert prot7.BlockedWordMatcher(None).find_all('anything') == []
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_tracker_evicts_least_recently_used():
+    tracker = prot7.BoundedTracker(3, 60, clock=FakeClock())
+    for key in 'abc':
+        tracker.get(key, list)
+    tracker.get('a')  # a becomes most recently used
+    tracker.get('d', list)
+    assert 'b' not in tracker
+    assert list(tracker.entries) == ['c', 'a', 'd']
+    tracker.set('e', [1])
+    assert list(tracker.entries) == ['a', 'd', 'e']
+    assert tracker.stats() == {'size': 3, 'max_size': 3, 'evictions': 2, 'expirations': 0}
+
+
+def test_tracker_get_without_factory_does_not_insert():
+    tracker = prot7.BoundedTracker(3, 60, clock=FakeClock())
+    assert tracker.get('missing') is None
+    assert len(tracker) == 0
+    value = tracker.get('x', list)
+    assert tracker.get('x') is value
+
+
+def test_tracker_expires_idle_keys():
+    clock = FakeClock()
+    tracker = prot7.BoundedTracker(10, 60, clock=clock)
+    tracker.get('old', list)
+    clock.now += 30
+    tracker.get('recent', list)
+    clock.now += 31
+    assert tracker.expire() == 1
+    assert list(tracker.entries) == ['recent']
+    # Using a key again keeps it alive
+    tracker.get('recent')
+    clock.now += 59
+    assert tracker.expire() == 0
+    clock.now += 1
+    assert tracker.expire() == 1
+    assert len(tracker) == 0
+    assert tracker.expirations == 2
+
+
+def test_tracker_pop():
+    tracker = prot7.BoundedTracker(10, 60, clock=FakeClock())
+    tracker.set('a', 1)
+    assert tracker.pop('a') == 1
+    assert tracker.pop('a') is None
+    assert tracker.expire() == 0
+
+
+def test_rate_limit_counter_counts_each_429_once():
+    # The warnings discord.py's HTTP client logs for a 429, global or not
+    counts = collections.Counter()
+    logger = logging.getLogger('prot7-test-http')
+    logger.propagate = False
+    handler = prot7.RateLimitCounter(counts)
+    logger.addHandler(handler)
+    try:
+        fmt = 'We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.'
+        logger.warning(fmt, 'POST', '/channels/1/messages', 1.5)
+        logger.warning(fmt, 'GET', '/users/@me', 0.5)
+        logger.warning('Global rate limit has been hit. Retrying in %.2f seconds.', 0.5)
+        logger.warning('Something else entirely')
+        logger.info('We are being rate limited, but only at INFO level')
+    finally:
+        logger.removeHandler(handler)
+    assert counts == {'all': 2, 'global': 1}
+
+
+def test_bot_metrics_counts_rest_requests():
+    metrics = prot7.BotMetrics()
+    http = types.SimpleNamespace()
+
+    async def request(route, **kwargs):
+        return route.method
+
+    http.request = request
+    metrics.install(http)
+    try:
+        route = types.SimpleNamespace(method='GET')
+        assert asyncio.run(http.request(route)) == 'GET'
+        assert asyncio.run(http.request(route, json={})) == 'GET'
+        assert metrics.rest_requests == {'GET': 2}
+    finally:
+        discord_http = logging.getLogger('discord.http')
+        for handler in list(discord_http.handlers):
+            if isinstance(handler, prot7.RateLimitCounter):
+                discord_http.removeHandler(handler)
+
+
+def test_format_metric():
+    lines = prot7.format_metric('prot7_rest_rate_limits_total', 'counter', 'REST 429 responses', [
+        (None, 3),
+        ({'scope': 'a"b\\c\nd'}, 1.5),
+        ('_sum', {}, float('inf')),
+    ])
+    assert lines == [
+        '# HELP prot7_rest_rate_limits_total REST 429 responses',
+        '# TYPE prot7_rest_rate_limits_total counter',
+        'prot7_rest_rate_limits_total 3',
+        'prot7_rest_rate_limits_total{scope="a\\"b\\\\c\\nd"} 1.5',
+        'prot7_rest_rate_limits_total_sum +Inf',
+    ]
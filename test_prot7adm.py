@@ -0,0 +1,62 @@
+import pytest
+
+import prot7adm
+import prot7db
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = prot7db.connect(str(tmp_path / 'prot7.db'))
+    prot7db.migrate(conn)
+    # Several rows share a timestamp, so the id has to break ties
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages (user_id, username, channel_id, guild_id, content, timestamp, message_type) "
+            "VALUES ('1', 'user', '10', '100', ?, ?, 'user_message')",
+            [(content, f'2026-01-01 10:00:0{second}') for content, second in [
+                ('spam spam spam', 1), ('spam', 1), ('spam spam', 2), ('ham', 2),
+                ('spam', 2), ('spam and eggs', 3), ('spam spam', 0),
+            ]]
+        )
+    yield conn
+    conn.close()
+
+
+def browse(conn, monkeypatch, keys_pressed, **kwargs):
+    """Run browse_pages with scripted input, returns the message ids shown per page"""
+    admin = prot7adm.Prot7Admin.__new__(prot7adm.Prot7Admin)
+    inputs = iter(keys_pressed)
+    monkeypatch.setattr(prot7adm, 'safe_input', lambda prompt: next(inputs))
+    pages = []
+    admin.browse_pages(
+        conn, "m.id, m.content", kwargs.pop('source', "FROM messages m WHERE 1=1"), kwargs.pop('params', []),
+        ("m.timestamp", "m.id"), lambda: pages.append([]), lambda row: pages[-1].append(row[0]), 3, "messages",
+        **kwargs
+    )
+    return pages
+
+
+def test_browse_pages_newest_first(conn, monkeypatch):
+    # Past the last page and before the first one the current page is shown again
+    pages = browse(conn, monkeypatch, ['n', 'n', 'n', 'p', 'p', 'p', ''])
+    assert pages == [[6, 5, 4], [3, 2, 1], [7], [7], [3, 2, 1], [6, 5, 4], [6, 5, 4]]
+
+
+def test_browse_pages_oldest_first(conn, monkeypatch):
+    pages = browse(conn, monkeypatch, ['n', 'n', ''], descending=False)
+    assert pages == [[7, 1, 2], [3, 4, 5], [6]]
+
+
+def test_browse_pages_ranks_search_results_within_pages(conn, monkeypatch):
+    search = dict(
+        source="FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid WHERE messages_fts MATCH ?",
+        params=['spam'], rank="bm25(messages_fts)",
+    )
+    pages = browse(conn, monkeypatch, ['n', 'n', ''], **search)
+    # Pages follow the timestamp, so every match is shown exactly once
+    assert [sorted(page) for page in pages] == [[3, 5, 6], [1, 2, 7], [1, 2, 7]]
+    ranks = dict(conn.execute(
+        "SELECT rowid, bm25(messages_fts) FROM messages_fts WHERE messages_fts MATCH 'spam'"
+    ).fetchall())
+    for page in pages:
+        assert [ranks[message_id] for message_id in page] == sorted(ranks[message_id] for message_id in page)
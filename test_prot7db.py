@@ -0,0 +1,247 @@
+import random
+import sqlite3
+
+import pytest
+
+import prot7db
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'prot7.db')
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = prot7db.connect(db_path)
+    prot7db.migrate(conn)
+    yield conn
+    conn.close()
+
+
+def insert_messages(conn, rows):
+    """rows: (user_id, channel_id, guild_id, content, timestamp)"""
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages (user_id, username, channel_id, guild_id, content, timestamp, message_type) "
+            "VALUES (?, 'user', ?, ?, ?, ?, 'user_message')",
+            rows
+        )
+
+
+def test_migrate_fresh_database(db_path):
+    conn = prot7db.connect(db_path)
+    applied = prot7db.migrate(conn)
+    assert [version for version, _ in applied] == [version for version, _, _ in prot7db.MIGRATIONS]
+    assert prot7db.get_schema_version(conn) == prot7db.SCHEMA_VERSION
+    assert prot7db.migrate(conn) == []
+
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'idx_messages_timestamp' in indexes
+    assert 'idx_security_events_type_severity_timestamp' in indexes
+    # Nothing to backfill in an empty database
+    assert prot7db.fts_backfill_status(conn) is None
+    assert prot7db.rollup_backfill_status(conn) == {}
+    conn.close()
+
+
+def test_migrate_old_admin_schema_keeps_rows(db_path):
+    # The admin panel used to create messages without message_id / message_type
+    old = sqlite3.connect(db_path)
+    old.execute('''
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT, username TEXT, channel_id TEXT, guild_id TEXT, content TEXT, timestamp DATETIME
+        )
+    ''')
+    old.executemany(
+        "INSERT INTO messages (user_id, username, channel_id, guild_id, content, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+        [('1', 'alice', '10', '100', 'hello world', '2026-01-01 10:00:00'),
+         ('2', 'bob', '10', '100', 'another message', '2026-01-01 11:30:00')]
+    )
+    old.commit()
+    old.close()
+
+    conn = prot7db.connect(db_path)
+    prot7db.migrate(conn)
+    assert {'message_id', 'message_type'} <= prot7db.table_columns(conn, 'messages')
+    assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 2
+
+    # Existing rows are indexed and counted by the backfills, not by the migration
+    assert prot7db.fts_backfill_status(conn) == (0, 2)
+    assert prot7db.rollup_backfill_status(conn)['messages'] == (0, 2)
+    assert prot7db.backfill_fts(conn)
+    assert prot7db.fts_backfill_status(conn) is None
+    assert conn.execute(
+        "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?", (prot7db.fts_query('hello'),)
+    ).fetchall() == [(1,)]
+
+    assert prot7db.backfill_rollups(conn)
+    assert prot7db.rollup_backfill_status(conn) == {}
+    assert conn.execute("SELECT hour, messages FROM hourly_guild_messages ORDER BY hour").fetchall() == [
+        ('2026-01-01 10:00:00', 1), ('2026-01-01 11:00:00', 1)
+    ]
+    conn.close()
+
+
+def test_new_messages_are_searchable(conn):
+    insert_messages(conn, [('1', '10', '100', 'Grüße aus Köln', '2026-01-01 10:00:00')])
+    assert conn.execute(
+        "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?", (prot7db.fts_query('koln'),)
+    ).fetchall() == [(1,)]
+    with conn:
+        conn.execute("DELETE FROM messages")
+    assert conn.execute(
+        "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ?", (prot7db.fts_query('koln'),)
+    ).fetchone()[0] == 0
+
+
+def message_ids(conn):
+    return [row[0] for row in conn.execute("SELECT id FROM messages ORDER BY id")]
+
+
+def test_delete_job_removes_only_expired_rows(conn):
+    insert_messages(conn, [
+        ('1', '10', '100', 'old', '2026-01-01 10:00:00'),
+        ('1', '10', '100', 'new', '2026-03-01 10:00:00'),
+        ('1', '10', '100', 'old', '2026-01-02 10:00:00'),
+        ('1', '10', '100', 'new', '2026-03-02 10:00:00'),
+        # Logged out of order: highest id, old timestamp
+        ('1', '10', '100', 'late', '2026-01-03 10:00:00'),
+    ])
+    job = prot7db.start_delete_job(conn, 'messages', '2026-02-01 00:00:00')
+    assert (job['position'], job['end_id'], job['deleted']) == (0, 5, 0)
+
+    assert prot7db.run_delete_job(conn, 'messages', batch_size=2, pause=0) == (3, True)
+    assert message_ids(conn) == [2, 4]
+    assert prot7db.get_delete_job(conn, 'messages') is None
+    # Deleted rows leave the search index too
+    assert conn.execute(
+        "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'old OR late'"
+    ).fetchone()[0] == 0
+
+
+def test_delete_job_resumes(conn):
+    insert_messages(conn, [('1', '10', '100', str(i), f'2026-01-01 10:00:{i:02d}') for i in range(10)])
+    prot7db.start_delete_job(conn, 'messages', '2026-01-01 10:00:07')
+
+    assert prot7db.run_delete_job(conn, 'messages', batch_size=3, pause=0, max_batches=1) == (3, False)
+    job = prot7db.get_delete_job(conn, 'messages')
+    assert (job['position'], job['end_id'], job['deleted']) == (3, 7, 3)
+
+    progress = []
+    assert prot7db.run_delete_job(conn, 'messages', batch_size=3, pause=0, progress=progress.append) == (4, True)
+    assert [job['position'] for job in progress] == [6, 7]
+    assert progress[-1]['deleted'] == 7
+    assert message_ids(conn) == [8, 9, 10]
+
+
+def test_delete_job_with_nothing_expired(conn):
+    insert_messages(conn, [('1', '10', '100', 'new', '2026-03-01 10:00:00')])
+    assert prot7db.start_delete_job(conn, 'messages', '2026-02-01 00:00:00') is None
+    assert prot7db.run_delete_job(conn, 'messages', pause=0) == (0, True)
+    assert message_ids(conn) == [1]
+    with pytest.raises(ValueError):
+        prot7db.start_delete_job(conn, 'users', '2026-02-01 00:00:00')
+
+
+def test_remove_duplicates_keeps_oldest(conn):
+    insert_messages(conn, [
+        ('1', '10', '100', 'hello', '2026-01-01 10:00:00'),
+        ('1', '10', '100', 'hello', '2026-01-01 10:00:00'),   # duplicate of 1
+        ('1', '10', '100', 'other', '2026-01-01 10:00:00'),   # same key, different content
+        ('2', '10', '100', 'hello', '2026-01-01 10:00:00'),   # different user
+        ('1', '10', '100', 'hello', '2026-01-01 10:00:00'),   # duplicate of 1
+        ('1', '10', '100', None, '2026-01-01 10:00:01'),
+        ('1', '10', '100', None, '2026-01-01 10:00:01'),      # NULL content matches NULL
+    ])
+    temp_store = conn.execute("PRAGMA temp_store").fetchone()[0]
+    progress = []
+    result = prot7db.remove_duplicates(conn, 'messages', batch_size=3, delete_batch=2, pause=0,
+                                       progress=lambda *args: progress.append(args))
+    assert result == (7, 3, 3)
+    assert message_ids(conn) == [1, 3, 4, 6]
+    assert progress[-1] == ('delete', 3, 3)
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == temp_store
+    assert prot7db.remove_duplicates(conn, 'messages', pause=0) == (4, 0, 0)
+
+
+def test_remove_duplicates_verifies_content(conn, monkeypatch):
+    # Every row gets the same hash: only the full comparison tells them apart
+    monkeypatch.setattr(prot7db, 'content_hash', lambda value: 0)
+    insert_messages(conn, [
+        ('1', '10', '100', 'a', '2026-01-01 10:00:00'),
+        ('1', '10', '100', 'b', '2026-01-01 10:00:00'),
+        ('1', '10', '100', 'a', '2026-01-01 10:00:00'),
+    ])
+    assert prot7db.remove_duplicates(conn, 'messages', pause=0) == (3, 2, 1)
+    assert message_ids(conn) == [1, 2]
+
+
+MESSAGE_COLUMNS = ('user_id', 'username', 'channel_id', 'guild_id', 'content', 'timestamp', 'message_type')
+
+
+def random_messages(rng, count):
+    return [
+        (str(rng.randint(1, 4)), 'user', str(rng.randint(10, 12)), rng.choice(['100', '200', None]), 'text',
+         f'2026-01-0{rng.randint(1, 2)} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00', 'user_message')
+        for _ in range(count)
+    ]
+
+
+def log_messages(conn, rows):
+    # The same way the bot's write queue stores a batch
+    with conn:
+        conn.executemany(
+            f"INSERT INTO messages ({', '.join(MESSAGE_COLUMNS)}) VALUES ({', '.join('?' * len(MESSAGE_COLUMNS))})", rows
+        )
+        prot7db.update_rollups(conn, 'messages', MESSAGE_COLUMNS, rows)
+
+
+def assert_rollups_match_raw_rows(conn):
+    for rollup, (source, keys, count_column) in prot7db.ROLLUPS.items():
+        positions = ', '.join(str(i + 2) for i in range(len(keys)))
+        raw = conn.execute(f'''
+            SELECT substr(timestamp, 1, 13) || ':00:00', {', '.join(f"COALESCE({key}, '')" for key in keys)}, COUNT(*)
+            FROM {source} GROUP BY 1, {positions} ORDER BY 1, {positions}
+        ''').fetchall()
+        stored = conn.execute(
+            f"SELECT hour, {', '.join(keys)}, {count_column} FROM {rollup} ORDER BY 1, {positions}"
+        ).fetchall()
+        assert stored == raw, rollup
+
+
+def test_update_rollups_matches_group_by(conn):
+    rng = random.Random(3)
+    for _ in range(5):
+        log_messages(conn, random_messages(rng, 40))
+    with conn:
+        events = [('spam', '1', 'x', '2026-01-01 10:15:00', 'high'), ('raid', '2', 'y', '2026-01-01 10:45:00', None)]
+        for row in events:
+            conn.execute(
+                "INSERT INTO security_events (event_type, user_id, details, timestamp, severity) VALUES (?, ?, ?, ?, ?)", row
+            )
+        prot7db.update_rollups(conn, 'security_events', ('event_type', 'user_id', 'details', 'timestamp', 'severity'), events)
+    assert_rollups_match_raw_rows(conn)
+    assert prot7db.hour_bucket('2026-01-01 10:15:00.123456') == '2026-01-01 10:00:00'
+
+
+def test_backfill_rollups_counts_older_rows_once(db_path):
+    rng = random.Random(4)
+    conn = prot7db.connect(db_path)
+    for version, _, step in prot7db.MIGRATIONS[:3]:
+        with conn:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+    insert_messages(conn, [row[:1] + row[2:6] for row in random_messages(rng, 100)])
+
+    prot7db.migrate(conn)
+    assert prot7db.rollup_backfill_status(conn) == {'messages': (0, 100)}
+    # New rows are counted as they are logged while the backfill is still pending
+    log_messages(conn, random_messages(rng, 30))
+    assert not prot7db.backfill_rollups(conn, batch_size=40, max_batches=1)
+    assert prot7db.rollup_backfill_status(conn) == {'messages': (40, 100)}
+    assert prot7db.backfill_rollups(conn, batch_size=40)
+    assert prot7db.backfill_rollups(conn)
+    assert_rollups_match_raw_rows(conn)
+    conn.close()
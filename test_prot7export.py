@@ -0,0 +1,98 @@
+import os
+from datetime import datetime
+
+import pytest
+
+import prot7db
+import prot7export
+
+
+ROWS = [
+    ('1001', '1', 'alice', '10', '100', 'hello', '2026-01-01 10:00:00.250000', 'user_message'),
+    (None, 'unknown', 'bob', '10', None, 'Grüße 👋', '2026-01-01 10:00:01', 'bot_command'),
+    ('1003', '3', 'carol', '11', '100', '', None, None),
+    ('1004', '18446744', 'dave', '11', '100', None, 'not a date', 'user_message'),
+    ('1005', '1', 'alice', '10', '100', 'last', '2026-01-02 00:00:00', 'user_message'),
+]
+
+EXPECTED = {
+    'id': [1, 2, 3, 4, 5],
+    'message_id': [1001, None, 1003, 1004, 1005],
+    'user_id': [1, None, 3, 18446744, 1],
+    'guild_id': [100, None, 100, 100, 100],
+    'content': ['hello', 'Grüße 👋', '', None, 'last'],
+    'timestamp': [datetime(2026, 1, 1, 10, 0, 0, 250000), datetime(2026, 1, 1, 10, 0, 1), None, None, datetime(2026, 1, 2)],
+    'message_type': ['user_message', 'bot_command', None, 'user_message', 'user_message'],
+}
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    # Several batches even for a handful of rows
+    monkeypatch.setattr(prot7export, 'ROW_GROUP_ROWS', 2)
+    conn = prot7db.connect(str(tmp_path / 'prot7.db'))
+    prot7db.migrate(conn)
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages (message_id, user_id, username, channel_id, guild_id, content, timestamp, message_type) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ROWS
+        )
+    yield conn
+    conn.close()
+
+
+def test_parquet_round_trip(conn, tmp_path, monkeypatch):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    monkeypatch.setattr(prot7export, 'pyarrow', pyarrow)
+    path = str(tmp_path / 'messages.parquet')
+
+    assert prot7export.export_table(conn, 'messages', path) == 5
+    table = pyarrow.parquet.read_table(path)
+    assert table.column_names == [name for name, _ in prot7export.COLUMNAR_TABLES['messages']]
+    assert pyarrow.types.is_dictionary(table.schema.field('message_type').type)
+    data = table.to_pydict()
+    for name, values in EXPECTED.items():
+        assert data[name] == values, name
+    assert pyarrow.parquet.ParquetFile(path).num_row_groups == 3
+    assert not os.path.exists(path + '.part')
+
+
+def test_npz_round_trip(conn, tmp_path, monkeypatch):
+    numpy = pytest.importorskip('numpy')
+    monkeypatch.setattr(prot7export, 'numpy', numpy)
+    path = str(tmp_path / 'messages.npz')
+
+    assert prot7export.export_table(conn, 'messages', path) == 5
+    with numpy.load(path) as archive:
+        assert archive['id'].tolist() == EXPECTED['id']
+        for name in ('message_id', 'user_id', 'guild_id'):
+            values = archive[name].tolist()
+            valid = archive[f"{name}.valid"].tolist()
+            assert [v if ok else None for v, ok in zip(values, valid)] == EXPECTED[name], name
+
+        data = archive['content.data'].tobytes()
+        offsets = archive['content.offsets'].tolist()
+        assert [data[a:b].decode('utf-8') for a, b in zip(offsets, offsets[1:])] == [v or '' for v in EXPECTED['content']]
+
+        assert [None if numpy.isnat(v) else v.item() for v in archive['timestamp']] == EXPECTED['timestamp']
+
+        labels = archive['message_type.categories'].tolist()
+        assert [labels[code] if code >= 0 else None for code in archive['message_type'].tolist()] == EXPECTED['message_type']
+    # The scratch directory is cleaned up
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('prot7-export-')]
+
+
+@pytest.mark.parametrize('extension, module', [('parquet', 'pyarrow'), ('npz', 'numpy')])
+def test_export_without_rows_leaves_no_file(conn, tmp_path, monkeypatch, extension, module):
+    library = pytest.importorskip(module)
+    if module == 'pyarrow':
+        import pyarrow.parquet
+    monkeypatch.setattr(prot7export, module, library)
+    path = str(tmp_path / f"messages.{extension}")
+
+    assert prot7export.export_table(conn, 'messages', path, "WHERE user_id = ?", ('nobody',)) == 0
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + '.part')
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('prot7-export-')]